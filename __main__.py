@@ -1 +1,4 @@
-import spkg_compose.cli
\ No newline at end of file
+from spkg_compose.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Helpers shared by the benchmark scripts. The scripts are run from the repository root, e.g.
+
+    python benchmarks/gzip_threads.py --size 64
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    """Returns the fastest of `repeat` runs of func(*args) in seconds"""
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def random_text(rng, size: int) -> bytes:
+    """Compressible data that isn't trivially compressible, like source code or binaries with strings"""
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz_") for _ in range(rng.randint(2, 12))) for _ in range(4096)]
+    out = bytearray()
+
+    while len(out) < size:
+        out += rng.choice(words)
+        out += b" " if rng.random() < 0.9 else b"\n"
+
+    return bytes(out[:size])
@@ -0,0 +1,57 @@
+"""Creates the same binpkg with 1 to N compression threads and prints the time and size of each run"""
+from common import best_of, random_text
+
+from binpkg import BinPkg
+from binpkg.metadata import Metadata
+
+import argparse
+import os
+import random
+import tempfile
+
+
+def make_tree(directory: str, size_mb: int, seed: int = 0):
+    rng = random.Random(seed)
+    files = max(size_mb, 1)
+
+    for i in range(files):
+        sub = os.path.join(directory, "usr", "lib", f"dir{i % 8}")
+        os.makedirs(sub, exist_ok=True)
+
+        with open(os.path.join(sub, f"file{i}"), "wb") as f:
+            f.write(random_text(rng, size_mb * 1024 * 1024 // files))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=64, help="size of the package tree in MiB")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="thread counts to compare")
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    threads = options.threads or sorted({1, 2, 4, os.cpu_count() or 1})
+    meta = Metadata("bench", "bench", "1.0", "benchmark package", "x86_64", "bench")
+
+    with tempfile.TemporaryDirectory() as work:
+        tree = os.path.join(work, "tree")
+        output = os.path.join(work, "out.binpkg")
+        make_tree(tree, options.size)
+
+        print(f"{options.size} MiB tree, {os.cpu_count()} CPUs, best of {options.repeat}")
+        base = None
+
+        for count in threads:
+            elapsed = best_of(options.repeat, BinPkg.create, meta, tree, output, count)
+            base = base or elapsed
+
+            print(
+                f"threads={count:<3} {elapsed:7.2f} s  {options.size / elapsed:7.1f} MiB/s  "
+                f"speedup {base / elapsed:4.2f}x  size {os.path.getsize(output) / 1024 / 1024:.1f} MiB"
+            )
+
+            # The parallel output is a multi-member gzip stream, it has to extract like the serial one
+            BinPkg.extract(output, os.path.join(work, f"extract{count}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compares finding changed compose files with a full walk and parse (as indexing did before), with
+IncrementalScanner and with IncrementalScanner driven by a Watcher (needs inotify_simple)"""
+from common import ROOT
+
+from spkg_compose.server.indexer import index_entry
+from spkg_compose.server.scanner import IncrementalScanner, Watcher
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+COMPOSE = open(os.path.join(ROOT, "buildfiles", "binpkg", "spkg.spkg")).read()
+SPECFILE = "binpkg:\n  x86_64:\n    url: https://example.org/packages/{name}/{name}-1.0-x86_64.binpkg\n"
+
+
+def add_package(repo: str, name: str):
+    os.makedirs(os.path.join(repo, name))
+
+    with open(os.path.join(repo, name, "compose.spkg"), "w") as f:
+        f.write(COMPOSE.replace("Id=spkg", f"Id={name}"))
+
+    with open(os.path.join(repo, name, "specfile.yml"), "w") as f:
+        f.write(SPECFILE.format(name=name))
+
+
+def full_walk(repo: str) -> int:
+    count = 0
+
+    for root, _, files in os.walk(repo):
+        for name in files:
+            if name.endswith(".spkg"):
+                _, entry, error = index_entry(os.path.join(root, name), set())
+                assert error is None, error
+                count += 1
+
+    return count
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packages", type=int, default=10000)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        repo = os.path.join(work, "repo")
+        snapshot = os.path.join(work, "scan.json")
+
+        for i in range(options.packages):
+            add_package(repo, f"pkg{i}")
+
+        print(f"{options.packages} packages")
+
+        elapsed, count = timed(full_walk, repo)
+        print(f"full walk and parse             {elapsed:6.3f} s  ({count} files)")
+
+        scanner = IncrementalScanner(repo, snapshot)
+        elapsed, (changed, _) = timed(scanner.scan)
+        scanner.save()
+        print(f"first scan                      {elapsed:6.3f} s  ({len(changed)} changed)")
+
+        scanner = IncrementalScanner(repo, snapshot)
+        elapsed, (changed, removed) = timed(scanner.scan)
+        scanner.save()
+        print(f"incremental scan, no changes    {elapsed:6.3f} s  ({len(changed)} changed, {len(removed)} removed)")
+
+        # One package added, one modified and one removed
+        watcher = Watcher(repo) if Watcher.available() else None
+
+        add_package(repo, "new")
+        with open(os.path.join(repo, "pkg5", "compose.spkg"), "a") as f:
+            f.write("\n")
+        shutil.rmtree(os.path.join(repo, "pkg7"))
+
+        if watcher is not None:
+            time.sleep(0.5)
+            elapsed, (changed, removed) = timed(scanner.scan, watcher.drain())
+            print(f"watcher scan, 3 changes         {elapsed:6.3f} s  ({len(changed)} changed, {len(removed)} removed)")
+        else:
+            print("watcher scan                    skipped, inotify_simple is not installed")
+
+        scanner = IncrementalScanner(repo, snapshot)
+        elapsed, (changed, removed) = timed(scanner.scan)
+        print(f"incremental scan, 3 changes     {elapsed:6.3f} s  ({len(changed)} changed, {len(removed)} removed)")
+
+
+if __name__ == "__main__":
+    main()
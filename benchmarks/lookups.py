@@ -0,0 +1,72 @@
+"""Times the REST lookups of a checkout against the fake GitHub API of the tests, taking --latency per request:
+one after another with a new connection per request, one after another over one session, and with 8 and 16
+workers sharing one session (as fetch_git does)"""
+from common import best_of
+
+from spkg_compose.server.api import github
+from spkg_compose.server.api.cache import ResponseCache
+from spkg_compose.server.api.github import gh_session, GitHubApi
+from tests.conftest import FakeGitHub
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import argparse
+import os
+import tempfile
+
+import requests
+
+
+def lookups(work: str, session, count: int) -> list:
+    server = SimpleNamespace(
+        index=SimpleNamespace(get=lambda name: {}),
+        http_cache=ResponseCache(os.path.join(work, "etags.json"), session),
+    )
+
+    return [
+        GitHubApi(
+            repo_url=f"https://github.com/owner/repo{i}", api_token="token", server=server,
+            package=SimpleNamespace(meta=SimpleNamespace(id=f"repo{i}")), file_path=None, rt_logger=None
+        )
+        for i in range(count)
+    ]
+
+
+def run(repositories: list, workers: int):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        assert all(result == ("v1.0", None) for result in pool.map(lambda git: git.lookup(), repositories))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=1)
+    options = parser.parse_args()
+
+    api = FakeGitHub({f"owner/repo{i}": ("v1.0", f"sha{i}") for i in range(options.lookups)}, options.latency).start()
+    github.API_URL = api.url
+
+    print(f"{options.lookups} lookups, {options.latency * 1000:.0f} ms per request, best of {options.repeat}")
+
+    cases = (
+        ("serial, new connections", lambda: requests, 1),
+        ("serial, shared session", lambda: gh_session(8), 1),
+        ("8 workers, shared session", lambda: gh_session(8), 8),
+        ("16 workers, shared session", lambda: gh_session(16), 16),
+    )
+
+    with tempfile.TemporaryDirectory() as work:
+        for label, session, workers in cases:
+            repositories = lookups(work, session(), options.lookups)
+            api.connections.clear()
+
+            elapsed = best_of(options.repeat, run, repositories, workers)
+            print(f"{label:28} {elapsed:6.2f} s  {len(api.connections):4} connections opened")
+
+    api.close()
+
+
+if __name__ == "__main__":
+    main()
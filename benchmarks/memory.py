@@ -0,0 +1,85 @@
+"""Measures the memory of parsed compose files (SpkgBuild) and of index entries per package with tracemalloc.
+
+--root measures another checkout, e.g. a `git worktree` of an older commit, to compare against"""
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+ENTRY = {
+    "compose": "/srv/repo/packages/{name}/compose.spkg",
+    "specfile": "/srv/repo/packages/{name}/specfile.yml",
+    "source": "https://github.com/owner/{name}",
+    "binpkg_path": "/{name}",
+    "latest": "v1.2.3",
+    "architectures": {"x86_64": True, "aarch64": True},
+}
+
+
+def measure(func, count: int) -> tuple[list, float]:
+    """Returns the objects func(i) creates and their memory in bytes per object"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [func(i) for i in range(count)]
+    gc.collect()
+
+    return objects, (tracemalloc.get_traced_memory()[0] - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packages", type=int, default=5000)
+    parser.add_argument("--root", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="checkout whose spkg_compose is measured")
+    options = parser.parse_args()
+
+    compose_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "buildfiles", "deb",
+                                "spkg.spkg")
+    sys.path.insert(0, os.path.abspath(options.root))
+
+    # Older checkouts run the command line when spkg_compose.cli is imported
+    argv, sys.argv = sys.argv, [sys.argv[0], "help"]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from spkg_compose.core.parser import read
+        from spkg_compose.package import SpkgBuild
+
+        # Without spkg_compose.server itself, which loads (or creates) config.yml in older checkouts
+        spec = importlib.util.spec_from_file_location(
+            "index_module", os.path.join(options.root, "spkg_compose", "server", "index.py")
+        )
+        index_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(index_module)
+
+    sys.argv = argv
+
+    # Rows are loaded from the database one by one, every entry has its own strings
+    rows = [json.dumps(ENTRY).replace("{name}", f"pkg{i}") for i in range(options.packages)]
+
+    tracemalloc.start()
+
+    compose_data, compose_size = measure(lambda i: read(compose_file), options.packages)
+    _, build_size = measure(lambda i: SpkgBuild(compose_data[i]), options.packages)
+
+    if hasattr(index_module, "IndexEntry"):
+        _, entry_size = measure(lambda i: index_module.IndexEntry.from_dict(json.loads(rows[i])), options.packages)
+        entry_type = "IndexEntry"
+    else:
+        _, entry_size = measure(lambda i: json.loads(rows[i]), options.packages)
+        entry_type = "dict"
+
+    tracemalloc.stop()
+
+    print(f"{options.packages} packages, spkg_compose from {os.path.abspath(options.root)}")
+    print(f"compose_data          {compose_size:7.0f} B/package")
+    print(f"SpkgBuild on top      {build_size:7.0f} B/package")
+    print(f"index entry           {entry_size:7.0f} B/package ({entry_type})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compares binpkg.scan (cold and warm cache) with reading every package header through BinPkg.read"""
+from common import best_of
+
+from binpkg import BinPkg, scan
+from binpkg.metadata import Metadata
+from binpkg.scan import clear_cache
+
+import argparse
+import os
+import tempfile
+
+
+def make_packages(directory: str, count: int):
+    tree = os.path.join(directory, "tree")
+    os.makedirs(os.path.join(tree, "usr", "bin"))
+
+    with open(os.path.join(tree, "usr", "bin", "tool"), "w") as f:
+        f.write("#!/bin/sh\necho tool\n")
+
+    template = os.path.join(directory, "template.binpkg")
+    BinPkg.create(Metadata("tool", "tool", "1.0", "benchmark package", "x86_64", "bench"), tree, template)
+
+    for i in range(count):
+        sub = os.path.join(directory, "repo", f"group{i % 100}")
+        os.makedirs(sub, exist_ok=True)
+
+        meta = Metadata(f"pkg{i}", f"pkg{i}", f"1.{i}", "benchmark package " * 8, "x86_64", "bench")
+        BinPkg.relabel(template, meta, os.path.join(sub, f"pkg{i}-1.{i}-x86_64.binpkg"))
+
+    return os.path.join(directory, "repo")
+
+
+def read_loop(repo: str):
+    for root, _, files in os.walk(repo):
+        for name in files:
+            if name.endswith(".binpkg"):
+                BinPkg.read(os.path.join(root, name))
+
+
+def cold_scan(repo: str, threads: int):
+    clear_cache()
+    assert sum(1 for _ in scan(repo, threads)) > 0
+
+
+def warm_scan(repo: str, threads: int):
+    sum(1 for _ in scan(repo, threads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packages", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        repo = make_packages(work, options.packages)
+        print(f"{options.packages} packages, {os.cpu_count()} CPUs, best of {options.repeat}")
+
+        print(f"BinPkg.read loop  {best_of(options.repeat, read_loop, repo):6.3f} s")
+        print(f"cold scan         {best_of(options.repeat, cold_scan, repo, options.threads):6.3f} s")
+
+        warm_scan(repo, options.threads)
+        print(f"warm scan         {best_of(options.repeat, warm_scan, repo, options.threads):6.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compares staging a build output with `cp -r` (as makepkg did before) and with staging.stage"""
+from common import best_of, random_text
+
+from spkg_compose.package.staging import expand_sources, stage
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+
+
+def make_build_output(directory: str, size_mb: int, files: int):
+    rng = random.Random(0)
+    data = random_text(rng, 1024 * 1024)
+
+    for i in range(files):
+        sub = os.path.join(directory, "target", "release", f"dir{i % 20}")
+        os.makedirs(sub, exist_ok=True)
+
+        with open(os.path.join(sub, f"file{i}"), "wb") as f:
+            size = size_mb * 1024 * 1024 // files
+
+            while size > 0:
+                f.write(data[:size])
+                size -= len(data)
+
+
+def copy_tree(build_dir: str, root: str):
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(os.path.join(root, "usr"))
+    subprocess.run(f"cp -r {build_dir}/target/* {root}/usr", shell=True, check=True)
+
+
+def stage_tree(build_dir: str, root: str):
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    stage(expand_sources(f"{build_dir}/target/*", "/usr"), root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=256, help="size of the build output in MiB")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        build_dir = os.path.join(work, "build")
+        root = os.path.join(work, "_binpkg")
+        make_build_output(build_dir, options.size, options.files)
+
+        print(f"{options.size} MiB in {options.files} files, best of {options.repeat}")
+        print(f"cp -r          {best_of(options.repeat, copy_tree, build_dir, root):6.3f} s")
+        print(f"staging.stage  {best_of(options.repeat, stage_tree, build_dir, root):6.3f} s")
+
+        sample = os.path.join(root, "usr", "release", "dir0", "file0")
+        print(f"staged files are hardlinks: {os.stat(sample).st_nlink > 1}")
+
+
+if __name__ == "__main__":
+    main()
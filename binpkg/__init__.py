@@ -1,84 +1,354 @@
+from binpkg.codec import DECODE_ERRORS, DEFAULT_CODEC, get_codec
+from binpkg.delta import create_delta, apply_delta
+from binpkg.header import build_header, read_header
 from binpkg.metadata import Metadata
+from binpkg.parallel import ParallelWriter
+from binpkg.scan import scan
+from binpkg.stream import iter_chunks
+from binpkg.toc import (Member, TreeTarget, should_cut, HashingReader, HashingWriter, BoundedReader, add_trees,
+                         member_type, write_toc, read_toc)
 
-import json
+import contextlib
+import hashlib
+import io
+import os
+import shutil
 import tarfile
 
-BINPKG_VERSION = "1.1"
+BINPKG_VERSION = "1.4"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class IntegrityError(Exception):
+    pass
 
 
 class BinPkg:
-    def __init__(self, meta: Metadata, source: str, output: str):
+    def __init__(self, meta: Metadata, source: str, output: str, compression: str = DEFAULT_CODEC):
         self.meta: Metadata = meta
         self.source: str = source
         self.output: str = output
+        self.compression: str = compression
+
+    @classmethod
+    def create(cls, meta: Metadata, source_dir: str, output_file, threads: int = 1,
+               compression: str = DEFAULT_CODEC, index: bool = False, reproducible: bool = False):
+        """Creates a binpkg. `output_file` is either a path or any writable binary file object (e.g. a pipe
+        or a socket file), which is written strictly sequentially and left open.
+
+        With `reproducible`, the same tree always gives the same bytes: ownership is normalized, mtimes are
+        clamped to SOURCE_DATE_EPOCH (0 if unset) and the compressed framing doesn't depend on `threads`."""
+        with cls.writer(meta, output_file, threads, compression, index, reproducible) as target:
+            add_trees([target], source_dir, '.')
+
+        return cls(meta, source_dir, _sink_name(output_file), get_codec(compression).name)
 
     @classmethod
-    def create(cls, meta: Metadata, source_dir: str, output_file: str):
-        metadata_json = json.dumps(meta.serialize()).encode('utf-8')
-        metadata_length = len(metadata_json)
-        header = f"LENGTH={metadata_length},VERSION={BINPKG_VERSION}\n".encode('utf-8') + metadata_json
+    @contextlib.contextmanager
+    def writer(cls, meta: Metadata, output_file, threads: int = 1, compression: str = DEFAULT_CODEC,
+               index: bool = False, reproducible: bool = False):
+        """Context manager form of create: yields the TreeTarget the tree is added to with add_trees and
+        completes the package on exit. This way one walk of a tree can fill several packages"""
+        codec = get_codec(compression)
+        extra = {"INDEX": 1, "CHECKSUM": "sha256"} if index else {"CHECKSUM": "sha256"}
+        header = build_header(meta.serialize(), BINPKG_VERSION, codec.name, extra)
 
-        with open(output_file, 'wb') as f:
+        with _open_sink(output_file) as f:
             f.write(header)
-            f.write(b'\n')
 
-            with tarfile.open(fileobj=f, mode='w:gz') as tar:
-                tar.add(source_dir, arcname='.')
+            with _payload_writer(f, codec, threads, index, reproducible) as target:
+                yield target
 
-        return cls(meta, source_dir, output_file)
+    @classmethod
+    def relabel(cls, input_file: str, meta: Metadata, output_file):
+        """Writes a copy of a package with new metadata (e.g. a new version). The compressed payload and the
+        table of contents are reused as they are, nothing is recompressed"""
+        with open(input_file, 'rb') as source:
+            fields, _ = read_header(source)
+            extra = {key: value for key, value in fields.items() if key not in ("LENGTH", "VERSION", "COMPRESSION")}
+            header = build_header(meta.serialize(), fields["VERSION"], fields["COMPRESSION"], extra)
+
+            with _open_sink(output_file) as f:
+                f.write(header)
+                shutil.copyfileobj(source, f, STREAM_CHUNK_SIZE)
+
+        return cls(meta, input_file, _sink_name(output_file), fields["COMPRESSION"])
+
+    @classmethod
+    def stream(cls, meta: Metadata, source_dir: str, threads: int = 1, compression: str = DEFAULT_CODEC,
+               index: bool = False, reproducible: bool = False, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Generator form of create. Yields the package in chunks while it's being compressed, so it can be
+        uploaded (e.g. as a chunked HTTP body) without writing a temporary file"""
+        yield from iter_chunks(
+            lambda sink: cls.create(meta, source_dir, sink, threads, compression, index, reproducible),
+            chunk_size
+        )
 
     @classmethod
     def read(cls, input_file: str):
         with open(input_file, 'rb') as f:
-            length_line = f.readline().strip()
-            parts = length_line.split(b',')
-            metadata_length = int(parts[0].split(b'=')[1])
-            version = parts[1].split(b'=')[1].decode('utf-8')
-
-            metadata_json = f.read(metadata_length)
-            meta_dict = json.loads(metadata_json.decode('utf-8'))
+            fields, meta_dict = read_header(f)
             meta = Metadata.from_json(meta_dict)
 
         return cls(
             meta=meta,
             source=input_file,
-            output=None
+            output=None,
+            compression=fields["COMPRESSION"]
         )
 
     @classmethod
     def extract(cls, input_file: str, output_dir: str):
         with open(input_file, 'rb') as f:
-            length_line = f.readline().strip()
-            parts = length_line.split(b',')
-            metadata_length = int(parts[0].split(b'=')[1])
-            version = parts[1].split(b'=')[1].decode('utf-8')
-
-            metadata_json = f.read(metadata_length)
-            meta_dict = json.loads(metadata_json.decode('utf-8'))
+            fields, meta_dict = read_header(f)
             meta = Metadata.from_json(meta_dict)
 
-            f.read(1)
-
-            with tarfile.open(fileobj=f, mode='r:gz') as tar:
-                tar.extractall(path=output_dir)
+            _extract_payload(f, fields, output_dir)
 
         return cls(
             meta=meta,
             source=input_file,
-            output=output_dir
+            output=output_dir,
+            compression=fields["COMPRESSION"]
         )
 
+    @classmethod
+    def create_delta(cls, base_file: str, target_file: str, output_file: str):
+        """Creates a delta that encodes target_file as the changes against base_file.
+        Both packages have to be created with index=True"""
+        create_delta(base_file, target_file, output_file, base_version=cls.read(base_file).meta.version)
+
+    @classmethod
+    def apply_delta(cls, base_file: str, delta_file: str, output_file: str):
+        """Rebuilds the full package from a delta and its base package"""
+        apply_delta(base_file, delta_file, output_file)
+
+        return cls.read(output_file)
+
     def self_extract(self, output_dir: str):
         with open(str(self.source), 'rb') as f:
-            length_line = f.readline().strip()
-            parts = length_line.split(b',')
-            metadata_length = int(parts[0].split(b'=')[1])
-            version = parts[1].split(b'=')[1].decode('utf-8')
+            fields, _ = read_header(f)
+
+            _extract_payload(f, fields, output_dir)
+
+    def verify(self):
+        """Checks the payload and every file against the checksums in the table of contents in a single pass,
+        without extracting anything. Raises IntegrityError on the first mismatch"""
+        with open(str(self.source), 'rb') as f:
+            fields, _ = read_header(f)
+
+            if "CHECKSUM" not in fields:
+                raise ValueError(f"'{self.source}' has no checksums (created before version 1.4)")
+
+            _extract_payload(f, fields, None)
+
+    def list_members(self) -> list[Member]:
+        """Returns the table of contents of a binpkg without decompressing the payload"""
+        with open(str(self.source), 'rb') as f:
+            fields, _ = read_header(f)
+
+            if not _has_toc(fields):
+                raise ValueError(f"'{self.source}' has no table of contents")
+
+            members, _, _ = read_toc(f)
+
+        return members
+
+    def open_member(self, path: str):
+        """Returns a file object with the content of a single file, only decompressing the chunk it lives in"""
+        with open(str(self.source), 'rb') as f:
+            fields, _ = read_header(f)
+            _check_index(fields, self.source)
+
+            payload_start = f.tell()
+            members, payload_end, _ = read_toc(f)
+
+            wanted = os.path.normpath(path.lstrip("/"))
+            member = next((member for member in members if os.path.normpath(member.path) == wanted), None)
+
+            if member is None:
+                raise KeyError(f"'{path}' not found in '{self.source}'")
+            if member.type != "file":
+                raise ValueError(f"'{path}' is not a regular file")
+
+            f.seek(payload_start + member.chunk)
+            payload = BoundedReader(f, payload_end - f.tell())
+
+            try:
+                with get_codec(fields["COMPRESSION"]).open_reader(payload) as reader:
+                    _skip(reader, member.offset)
+
+                    with tarfile.open(fileobj=reader, mode='r|') as tar:
+                        data = tar.extractfile(tar.next()).read()
+            except (tarfile.TarError, *DECODE_ERRORS) as err:
+                raise IntegrityError(f"Damaged payload in '{self.source}' ({err})") from err
+
+        if member.sha256 is not None and hashlib.sha256(data).hexdigest() != member.sha256:
+            raise IntegrityError(f"Checksum mismatch for '{member.path}' in '{self.source}'")
+
+        return io.BytesIO(data)
+
 
-            metadata_json = f.read(metadata_length)
-            _ = json.loads(metadata_json.decode('utf-8'))
+class _VerifyingTarFile(tarfile.TarFile):
+    """TarFile that checks the SHA-256 of every regular file while it's extracted"""
 
-            f.read(1)
+    digests = {}
 
-            with tarfile.open(fileobj=f, mode='r:gz') as tar:
+    def makefile(self, tarinfo, targetpath):
+        # Written under a temporary name, so a file that doesn't match its checksum never shows up
+        tmp_path = os.path.join(os.path.dirname(targetpath), f".{os.path.basename(targetpath)}.part")
+
+        try:
+            with open(tmp_path, "wb") as target:
+                self.copy_verified(tarinfo, target)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+        os.replace(tmp_path, targetpath)
+
+    def copy_verified(self, tarinfo, target=None):
+        source = self.fileobj
+        source.seek(tarinfo.offset_data)
+
+        file_hash = hashlib.sha256()
+        remaining = tarinfo.size
+
+        while remaining > 0:
+            block = source.read(min(remaining, self.copybufsize or 65536))
+            if not block:
+                raise tarfile.ReadError("Unexpected end of data")
+
+            file_hash.update(block)
+            if target is not None:
+                target.write(block)
+            remaining -= len(block)
+
+        expected = self.digests.get(tarinfo.name)
+        if expected is not None and file_hash.hexdigest() != expected:
+            raise IntegrityError(f"Checksum mismatch for '{tarinfo.name}'")
+
+
+def _reproducible_filter(tarinfo):
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = "root"
+    tarinfo.mtime = min(int(tarinfo.mtime), int(os.environ.get("SOURCE_DATE_EPOCH", 0)))
+    return tarinfo
+
+
+@contextlib.contextmanager
+def _payload_writer(f, codec, threads: int, index: bool, reproducible: bool):
+    """Writes the compressed payload of the tree added to the yielded TreeTarget, followed by the table of
+    contents with the checksums. With index, the payload is written as independently compressed chunks"""
+    payload = HashingWriter(f)
+    members = []
+
+    # Uncompressed payloads gain nothing from block compression. Reproducible packages always use it,
+    # so the output doesn't depend on the number of threads
+    if index or reproducible or (threads > 1 and codec.name not in ("none", "zstd")):
+        writer = ParallelWriter(payload, codec.compress, max(threads, 1))
+    else:
+        writer = codec.open_writer(payload, threads)
+
+    def before(tarinfo):
+        chunk = offset = None
+
+        if index:
+            if should_cut(tarinfo, writer.position()[1]):
+                writer.cut()
+
+            # The compressed offset of a chunk is only known once it's written, so keep the chunk index for now
+            chunk, offset = writer.position()
+
+        members.append(Member(tarinfo.name, member_type(tarinfo), tarinfo.size, tarinfo.mode, None, chunk, offset))
+
+    def after(_tarinfo, sha256):
+        members[-1].sha256 = sha256
+
+    # The chunk positions need an exact offset for every member, which the buffered stream mode doesn't give
+    with writer, tarfile.open(fileobj=writer, mode='w' if index else 'w|') as tar:
+        yield TreeTarget(tar, before, after, _reproducible_filter if reproducible else None)
+
+    if index:
+        chunk_offsets = [0]
+        for size in writer.frame_sizes:
+            chunk_offsets.append(chunk_offsets[-1] + size)
+
+        for member in members:
+            member.chunk = chunk_offsets[member.chunk]
+
+    write_toc(f, members, payload.hash.hexdigest())
+
+
+def _extract_payload(f, fields: dict, output_dir: str | None):
+    """Extracts the payload to output_dir, or only verifies it if output_dir is None"""
+    payload = f
+    digests = {}
+    payload_sha256 = None
+
+    # The table of contents is behind the payload, which the decoder must not see
+    if _has_toc(fields):
+        payload_start = f.tell()
+        members, payload_end, payload_sha256 = read_toc(f)
+        f.seek(payload_start)
+
+        payload = BoundedReader(f, payload_end - payload_start)
+        digests = {member.path: member.sha256 for member in members if member.sha256 is not None}
+
+    payload = HashingReader(payload)
+
+    # Damaged compressed data shows up as an error of the decoder or of tarfile, depending on where it is
+    try:
+        with get_codec(fields["COMPRESSION"]).open_reader(payload) as reader, \
+                _VerifyingTarFile.open(fileobj=reader, mode='r|') as tar:
+            tar.digests = digests
+
+            if output_dir is not None:
                 tar.extractall(path=output_dir)
+            else:
+                for tarinfo in tar:
+                    if tarinfo.isreg():
+                        tar.copy_verified(tarinfo)
+    except (tarfile.TarError, *DECODE_ERRORS) as err:
+        raise IntegrityError(f"Damaged payload ({err})") from err
+
+    if payload_sha256 is not None:
+        # The decoder doesn't necessarily read the padding at the end of the payload
+        while payload.read(65536):
+            pass
+
+        if payload.hash.hexdigest() != payload_sha256:
+            raise IntegrityError("Payload checksum mismatch")
+
+
+def _open_sink(output_file):
+    """Returns a context manager for writing to output_file, a path or a file object"""
+    if hasattr(output_file, "write"):
+        return contextlib.nullcontext(output_file)
+
+    return open(output_file, 'wb')
+
+
+def _sink_name(output_file):
+    if hasattr(output_file, "write"):
+        return getattr(output_file, "name", None)
+
+    return output_file
+
+
+def _has_toc(fields: dict) -> bool:
+    return "INDEX" in fields or "CHECKSUM" in fields
+
+
+def _check_index(fields: dict, source: str):
+    if "INDEX" not in fields:
+        raise ValueError(f"'{source}' has no table of contents (created without index)")
+
+
+def _skip(reader, length: int):
+    while length > 0:
+        data = reader.read(min(length, 65536))
+        if not data:
+            raise EOFError("Unexpected end of binpkg payload")
+        length -= len(data)
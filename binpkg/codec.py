@@ -0,0 +1,125 @@
+import gzip
+import io
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_CODEC = "gzip"
+
+# What the decoders raise for damaged data
+DECODE_ERRORS = (EOFError, zlib.error, gzip.BadGzipFile, lzma.LZMAError)
+
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+
+class _Passthrough(io.RawIOBase):
+    """Uncompressed view of a file object that leaves the underlying file open on close"""
+
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.fileobj.write(data)
+        return len(data)
+
+
+class Codec:
+    name = None
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a block of data into a self-contained frame that can be concatenated with others"""
+        raise NotImplementedError
+
+    def open_writer(self, fileobj, threads: int = 1):
+        raise NotImplementedError
+
+    def open_reader(self, fileobj):
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+    def open_writer(self, fileobj, threads: int = 1):
+        # No timestamp in the gzip header, so identical input gives identical output
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=9, mtime=0)
+
+    def open_reader(self, fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+
+class XzCodec(Codec):
+    name = "xz"
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_XZ)
+
+    def open_writer(self, fileobj, threads: int = 1):
+        return lzma.LZMAFile(fileobj, mode='wb', format=lzma.FORMAT_XZ)
+
+    def open_reader(self, fileobj):
+        return lzma.LZMAFile(fileobj, mode='rb')
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=19).compress(data)
+
+    def open_writer(self, fileobj, threads: int = 1):
+        # zstd has its own worker threads, so there is no need for block compression
+        compressor = zstandard.ZstdCompressor(level=19, threads=threads if threads > 1 else 0)
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def open_reader(self, fileobj):
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True, closefd=False)
+
+
+class NoneCodec(Codec):
+    name = "none"
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def open_writer(self, fileobj, threads: int = 1):
+        return _Passthrough(fileobj)
+
+    def open_reader(self, fileobj):
+        return _Passthrough(fileobj)
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (GzipCodec(), XzCodec(), NoneCodec())
+}
+
+if zstandard is not None:
+    CODECS[ZstdCodec.name] = ZstdCodec()
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported compression '{name}' (available: {', '.join(CODECS)})")
@@ -0,0 +1,146 @@
+from binpkg.header import read_header
+from binpkg.toc import read_toc
+
+import hashlib
+import os
+import struct
+
+DELTA_VERSION = "1"
+
+# Every record starts with an operation and two numbers: COPY (offset in base, length) or LITERAL (length, 0).
+# Literal records are followed by `length` bytes of data, END closes the delta.
+RECORD = struct.Struct("<cQQ")
+BLOCK_SIZE = 1024 * 1024
+OP_COPY = b"C"
+OP_LITERAL = b"L"
+OP_END = b"E"
+
+
+def _segments(f):
+    """Splits an indexed binpkg into header, compressed chunks and table of contents.
+    Chunks are independently compressed, so an unchanged chunk has the same bytes in both versions"""
+    read_header(f)
+    payload_start = f.tell()
+
+    members, payload_end, _ = read_toc(f)
+    file_end = f.seek(0, os.SEEK_END)
+
+    chunks = {payload_start + member.chunk for member in members if member.chunk is not None}
+    boundaries = sorted({0, payload_start, payload_end, file_end} | chunks)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _blocks(f, start: int, length: int):
+    f.seek(start)
+
+    while length > 0:
+        block = f.read(min(length, BLOCK_SIZE))
+        if not block:
+            raise EOFError("Unexpected end of file")
+        length -= len(block)
+        yield block
+
+
+def _range_hash(f, start: int, length: int) -> bytes:
+    range_hash = hashlib.sha256()
+
+    for block in _blocks(f, start, length):
+        range_hash.update(block)
+
+    return range_hash.digest()
+
+
+def _file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return _range_hash(f, 0, f.seek(0, os.SEEK_END)).hex()
+
+
+def create_delta(base_file: str, target_file: str, output_file: str, base_version: str = ""):
+    """Encodes target_file as the changes against base_file. Both packages must be created with index=True"""
+    base_chunks = {}
+
+    with open(base_file, 'rb') as base:
+        for start, end in _segments(base):
+            base_chunks.setdefault(_range_hash(base, start, end - start), (start, end - start))
+
+    copied = 0
+
+    with open(target_file, 'rb') as target, open(output_file, 'wb') as out:
+        out.write(
+            f"DELTA={DELTA_VERSION},BASE={_file_hash(base_file)},TARGET={_file_hash(target_file)},"
+            f"FROM={base_version}\n".encode('utf-8')
+        )
+
+        pending = None
+
+        for start, end in _segments(target):
+            found = base_chunks.get(_range_hash(target, start, end - start))
+
+            if found is not None:
+                copied += found[1]
+
+                # Merge copies of chunks that are adjacent in the base package
+                if pending is not None and pending[0] + pending[1] == found[0]:
+                    pending = (pending[0], pending[1] + found[1])
+                    continue
+
+                if pending is not None:
+                    out.write(RECORD.pack(OP_COPY, *pending))
+                pending = found
+            else:
+                if pending is not None:
+                    out.write(RECORD.pack(OP_COPY, *pending))
+                    pending = None
+
+                out.write(RECORD.pack(OP_LITERAL, end - start, 0))
+                for block in _blocks(target, start, end - start):
+                    out.write(block)
+
+        if pending is not None:
+            out.write(RECORD.pack(OP_COPY, *pending))
+
+        out.write(RECORD.pack(OP_END, 0, 0))
+
+    return copied
+
+
+def read_delta_header(f) -> dict:
+    fields = {}
+
+    for part in f.readline().strip().split(b','):
+        key, value = part.split(b'=', 1)
+        fields[key.decode('utf-8')] = value.decode('utf-8')
+
+    return fields
+
+
+def apply_delta(base_file: str, delta_file: str, output_file: str):
+    """Rebuilds the target package of a delta from its base package and verifies it bit for bit"""
+    with open(delta_file, 'rb') as delta:
+        fields = read_delta_header(delta)
+
+        if _file_hash(base_file) != fields["BASE"]:
+            raise ValueError(f"'{base_file}' is not the base package of '{delta_file}'")
+
+        target_hash = hashlib.sha256()
+
+        with open(base_file, 'rb') as base, open(output_file, 'wb') as out:
+            while True:
+                op, first, second = RECORD.unpack(delta.read(RECORD.size))
+
+                if op == OP_END:
+                    break
+                elif op == OP_COPY:
+                    blocks = _blocks(base, first, second)
+                elif op == OP_LITERAL:
+                    blocks = _blocks(delta, delta.tell(), first)
+                else:
+                    raise ValueError(f"Invalid delta record {op!r}")
+
+                for block in blocks:
+                    target_hash.update(block)
+                    out.write(block)
+
+    if target_hash.hexdigest() != fields["TARGET"]:
+        os.remove(output_file)
+        raise ValueError(f"Rebuilt package does not match the checksum recorded in '{delta_file}'")
@@ -0,0 +1,39 @@
+from binpkg.codec import DEFAULT_CODEC
+
+import json
+
+
+def build_header(meta_dict: dict, version: str, compression: str, extra: dict = None) -> bytes:
+    metadata_json = json.dumps(meta_dict).encode('utf-8')
+    header_line = f"LENGTH={len(metadata_json)},VERSION={version},COMPRESSION={compression}"
+
+    for key, value in (extra or {}).items():
+        header_line += f",{key}={value}"
+
+    header_line += "\n"
+
+    return header_line.encode('utf-8') + metadata_json + b'\n'
+
+
+def parse_header_line(line: bytes) -> dict:
+    """Parses the 'KEY=value,...' header line. Files older than version 1.2 have no COMPRESSION field"""
+    fields = {"COMPRESSION": DEFAULT_CODEC}
+
+    for part in line.strip().split(b','):
+        key, value = part.split(b'=', 1)
+        fields[key.decode('utf-8')] = value.decode('utf-8')
+
+    fields["LENGTH"] = int(fields["LENGTH"])
+    return fields
+
+
+def read_header(f):
+    """Reads the header from an open binpkg file and leaves the file positioned at the payload"""
+    fields = parse_header_line(f.readline())
+
+    metadata_json = f.read(fields["LENGTH"])
+    meta_dict = json.loads(metadata_json.decode('utf-8'))
+
+    f.read(1)
+
+    return fields, meta_dict
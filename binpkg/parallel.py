@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+import io
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class ParallelWriter(io.RawIOBase):
+    """Writable file object that compresses its input as independent frames on a thread pool.
+
+    The written data is split into blocks of `block_size` bytes, every block is compressed with
+    `compress` into a self-contained frame (e.g. a gzip member) and the frames are written to `fileobj`
+    in order. Concatenated gzip members or xz streams are still a valid gzip/xz stream, so the output
+    can be read with the regular decoder of the codec.
+    """
+
+    def __init__(self, fileobj, compress, threads: int, block_size: int = BLOCK_SIZE):
+        super().__init__()
+        self.fileobj = fileobj
+        self.compress = compress
+        self.block_size = block_size
+
+        # Compressed size of every frame written to fileobj, in order
+        self.frame_sizes = []
+
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._max_pending = threads * 2
+        self._buffer = bytearray()
+        self._frames = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def position(self):
+        """Returns the index of the frame the next written byte goes into and the offset inside that frame"""
+        return self._frames, len(self._buffer)
+
+    def cut(self):
+        """Ends the current frame, so the next written byte starts a new independently decodable frame"""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._executor.submit(self.compress, block))
+        self._frames += 1
+
+        # Limit the number of blocks in flight, so memory usage stays bounded
+        while len(self._pending) >= self._max_pending:
+            self._write_frame()
+
+    def _write_frame(self):
+        frame = self._pending.popleft().result()
+        self.fileobj.write(frame)
+        self.frame_sizes.append(len(frame))
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            self.cut()
+
+            while self._pending:
+                self._write_frame()
+        finally:
+            self._executor.shutdown()
+            super().close()
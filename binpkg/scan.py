@@ -0,0 +1,129 @@
+from binpkg.header import parse_header_line
+from binpkg.metadata import Metadata
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+import json
+import os
+import threading
+
+# Enough for the header line and the metadata of almost every package, larger headers need a second read
+HEADER_PEEK = 4096
+
+# Files are handed to the worker threads in batches, a future per file costs more than a cached lookup
+BATCH_SIZE = 64
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _iter_binpkgs(directory: str):
+    stack = [directory]
+
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".binpkg") and entry.is_file():
+                    yield entry.path
+
+
+def _read_metadata(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None
+
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return path, cached[1]
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return path, None
+
+    try:
+        data = os.pread(fd, HEADER_PEEK, 0)
+        line_end = data.index(b'\n')
+        fields = parse_header_line(data[:line_end])
+
+        metadata_end = line_end + 1 + fields["LENGTH"]
+        if metadata_end > len(data):
+            data += os.pread(fd, metadata_end - len(data), len(data))
+
+        meta = Metadata.from_json(json.loads(data[line_end + 1:metadata_end].decode('utf-8')))
+    except (OSError, ValueError, KeyError):
+        return path, None
+    finally:
+        os.close(fd)
+
+    with _cache_lock:
+        _cache[path] = (key, meta)
+
+    return path, meta
+
+
+def _read_batch(paths: list):
+    return [_read_metadata(path) for path in paths]
+
+
+def _batches(paths, size: int = BATCH_SIZE):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def scan(directory: str, threads: int = None):
+    """Reads the metadata of every *.binpkg file below `directory` and yields (path, Metadata) pairs.
+
+    Only the header bytes of a package are read. Results are cached per path and reused as long as
+    inode, size and mtime of the file stay the same. Files with an invalid header are skipped. Once a scan
+    is complete, the cached results of files below `directory` that weren't found anymore are dropped.
+    """
+    threads = threads or min(32, (os.cpu_count() or 1) * 4)
+    seen = set()
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Only a few batches are in flight at a time, so a huge tree isn't queued up front
+        for batch in _batches(_iter_binpkgs(directory)):
+            seen.update(batch)
+            pending.append(executor.submit(_read_batch, batch))
+
+            if len(pending) >= threads * 2:
+                yield from _valid(pending.popleft().result())
+
+        while pending:
+            yield from _valid(pending.popleft().result())
+
+    _prune(directory, seen)
+
+
+def _valid(results: list):
+    for path, meta in results:
+        if meta is not None:
+            yield path, meta
+
+
+def _prune(directory: str, seen: set):
+    prefix = os.path.join(directory, "")
+
+    with _cache_lock:
+        for path in [path for path in _cache if path.startswith(prefix) and path not in seen]:
+            del _cache[path]
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
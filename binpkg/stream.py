@@ -0,0 +1,95 @@
+import io
+import queue
+import threading
+
+_DONE = object()
+
+
+class QueueWriter(io.RawIOBase):
+    """Writable file object that hands everything written to it to another thread in chunks of `chunk_size`"""
+
+    def __init__(self, chunk_size: int, max_chunks: int = 8):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(max_chunks)
+        self.cancelled = threading.Event()
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+
+        return len(data)
+
+    def _put(self, item):
+        # Block while the consumer is behind, but don't wait forever if it stopped reading
+        while True:
+            if self.cancelled.is_set():
+                raise BrokenPipeError("The consumer stopped reading the stream")
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        try:
+            if self._buffer:
+                self._put(bytes(self._buffer))
+                self._buffer.clear()
+            self._put(_DONE)
+        except BrokenPipeError:
+            pass
+
+
+class TeeWriter(io.RawIOBase):
+    """Writable file object that writes everything to two file objects"""
+
+    def __init__(self, first, second):
+        super().__init__()
+        self.first = first
+        self.second = second
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.first.write(data)
+        self.second.write(data)
+        return len(data)
+
+
+def iter_chunks(produce, chunk_size: int):
+    """Runs `produce(sink)` on a separate thread and yields everything it writes to `sink` in chunks"""
+    sink = QueueWriter(chunk_size)
+    errors = []
+
+    def run():
+        try:
+            produce(sink)
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            sink.finish()
+
+    producer = threading.Thread(target=run, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            chunk = sink.queue.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        sink.cancelled.set()
+        producer.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import tarfile
+import zlib
+
+TOC_MAGIC = b"BPKGTOC1"
+TOC_FOOTER = struct.Struct("<Q8s")
+
+# A new chunk is started in front of a member once the current chunk holds at least this many bytes
+CHUNK_SIZE = 256 * 1024
+
+# Smaller chunks are also cut in front of roughly every 16th member, picked by path. That way chunk
+# boundaries of two package versions line up again shortly after a changed file, which keeps deltas small.
+MIN_CHUNK_SIZE = 16 * 1024
+
+# Size of the reads when files are added to a tarfile
+COPY_BUFSIZE = 1024 * 1024
+
+
+class Member:
+    def __init__(self, path: str, type: str, size: int, mode: int, sha256: str | None, chunk: int, offset: int):
+        self.path = path
+        self.type = type
+        self.size = size
+        self.mode = mode
+        self.sha256 = sha256
+        self.chunk = chunk
+        self.offset = offset
+
+    @classmethod
+    def from_json(cls, json: dict):
+        return cls(json["path"], json["type"], json["size"], json["mode"], json["sha256"], json["chunk"],
+                   json["offset"])
+
+    def serialize(self):
+        return {
+            "path": self.path,
+            "type": self.type,
+            "size": self.size,
+            "mode": self.mode,
+            "sha256": self.sha256,
+            "chunk": self.chunk,
+            "offset": self.offset,
+        }
+
+
+class HashingReader(io.RawIOBase):
+    """Readable file object that computes the SHA-256 of everything read through it"""
+
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        self.hash.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class HashingWriter(io.RawIOBase):
+    """Writable file object that computes the SHA-256 and length of everything written through it"""
+
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+        self.length = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.hash.update(data)
+        self.length += len(data)
+        return len(data)
+
+
+class BoundedReader(io.RawIOBase):
+    """Readable file object that stops after `length` bytes, so decoders don't run into the trailer"""
+
+    def __init__(self, fileobj, length: int):
+        super().__init__()
+        self.fileobj = fileobj
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def should_cut(tarinfo, chunk_length: int) -> bool:
+    if chunk_length >= CHUNK_SIZE:
+        return True
+
+    return chunk_length >= MIN_CHUNK_SIZE and zlib.crc32(tarinfo.name.encode('utf-8')) % 16 == 0
+
+
+def member_type(tarinfo) -> str:
+    if tarinfo.isreg():
+        return "file"
+    elif tarinfo.isdir():
+        return "dir"
+    elif tarinfo.issym():
+        return "symlink"
+    elif tarinfo.islnk():
+        return "hardlink"
+    return "other"
+
+
+class TreeTarget:
+    """A tarfile that add_trees writes to, together with its callbacks (see add_tree)"""
+
+    def __init__(self, tar, before=None, after=None, filter=None, algorithm: str = "sha256"):
+        self.tar = tar
+        self.before = before
+        self.after = after
+        self.filter = filter
+        self.algorithm = algorithm
+
+
+def add_tree(tar, name: str, arcname: str, before=None, after=None, filter=None, algorithm: str = "sha256"):
+    """Adds a directory tree to a tarfile in the same order as TarFile.add.
+
+    `before(tarinfo)` is called right before a member is written, `after(tarinfo, digest)` right after.
+    `digest` is the hex digest (`algorithm`, SHA-256 by default) of the content of regular files and None
+    for every other member type.
+    `filter(tarinfo)` can change a member before it's written or exclude it by returning None, like the filter
+    of TarFile.add.
+    """
+    add_trees([TreeTarget(tar, before, after, filter, algorithm)], name, arcname)
+
+
+def add_trees(targets: list, name: str, arcname: str):
+    """Adds a directory tree to several tarfiles at once (e.g. packages of different formats). Every file is
+    read only once and its content is written to all targets"""
+    entries = []
+
+    for target in targets:
+        tarinfo = target.tar.gettarinfo(name, arcname)
+
+        if tarinfo is not None and target.filter is not None:
+            tarinfo = target.filter(tarinfo)
+
+        if tarinfo is not None:
+            entries.append((target, tarinfo))
+
+    for target, tarinfo in entries:
+        if target.before is not None:
+            target.before(tarinfo)
+
+        _write_header(target.tar, tarinfo)
+
+    digests = _write_content(name, [(target, tarinfo) for target, tarinfo in entries if tarinfo.isreg()])
+
+    for target, tarinfo in entries:
+        target.tar.members.append(tarinfo)
+
+        if target.after is not None:
+            target.after(tarinfo, digests.get(target))
+
+    directories = [target for target, tarinfo in entries if tarinfo.isdir()]
+
+    if directories:
+        for f in sorted(os.listdir(name)):
+            add_trees(directories, os.path.join(name, f), os.path.join(arcname, f))
+
+
+# TarFile.addfile can only copy a member from a file object of its own, so the header and the content are
+# written the same way it does, which lets several tarfiles share the reads of one file
+
+def _write_header(tar, tarinfo):
+    buf = tarinfo.tobuf(tar.format, tar.encoding, tar.errors)
+    tar.fileobj.write(buf)
+    tar.offset += len(buf)
+
+
+def _write_content(name: str, entries: list) -> dict:
+    if not entries:
+        return {}
+
+    hashes = {target: hashlib.new(target.algorithm) for target, _ in entries}
+    remaining = entries[0][1].size
+
+    with open(name, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(remaining, COPY_BUFSIZE))
+            if not block:
+                raise OSError(f"'{name}' changed while it was added")
+
+            for target, _ in entries:
+                hashes[target].update(block)
+                target.tar.fileobj.write(block)
+            remaining -= len(block)
+
+    for target, tarinfo in entries:
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+
+        if remainder > 0:
+            target.tar.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+
+        target.tar.offset += blocks * tarfile.BLOCKSIZE
+
+    return {target: file_hash.hexdigest() for target, file_hash in hashes.items()}
+
+
+def write_toc(f, members: list, payload_sha256: str):
+    toc_json = json.dumps({
+        "payload_sha256": payload_sha256,
+        "members": [member.serialize() for member in members]
+    }).encode('utf-8')
+
+    f.write(toc_json)
+    f.write(TOC_FOOTER.pack(len(toc_json), TOC_MAGIC))
+
+
+def read_toc(f):
+    """Reads the table of contents from the end of a binpkg file. Returns the members, the absolute offset
+    where the payload ends and the SHA-256 of the payload (None for packages older than version 1.4)"""
+    f.seek(-TOC_FOOTER.size, os.SEEK_END)
+    toc_length, magic = TOC_FOOTER.unpack(f.read(TOC_FOOTER.size))
+
+    if magic != TOC_MAGIC:
+        raise ValueError("Invalid binpkg table of contents")
+
+    payload_end = f.seek(-TOC_FOOTER.size - toc_length, os.SEEK_END)
+    toc = json.loads(f.read(toc_length).decode('utf-8'))
+
+    return [Member.from_json(member) for member in toc["members"]], payload_end, toc.get("payload_sha256")
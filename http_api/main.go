@@ -12,6 +12,7 @@ func main() {
 	config.LoadConfig("../data/config.yml")
 
 	http.HandleFunc("/upload", upload.Handler)
+	http.HandleFunc("/packages/", upload.DownloadHandler)
 
 	address := config.API.Address
 	port := config.API.Port
@@ -0,0 +1,30 @@
+package upload
+
+import (
+	"net/http"
+	"path/filepath"
+	"strings"
+)
+
+// DownloadHandler serves the uploaded files of a package (/packages/<package>/<file>), e.g. a binpkg and the
+// delta against its previous version. Range requests are supported by http.ServeFile
+func DownloadHandler(w http.ResponseWriter, r *http.Request) {
+	if r.Method != http.MethodGet && r.Method != http.MethodHead {
+		http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
+		return
+	}
+
+	packageName, filename, ok := strings.Cut(strings.TrimPrefix(r.URL.Path, "/packages/"), "/")
+	if !ok || filename == "" || filename != filepath.Base(filename) {
+		http.Error(w, "Not found", http.StatusNotFound)
+		return
+	}
+
+	packageInfo, ok := index[packageName]
+	if !ok {
+		http.Error(w, "Package not found", http.StatusNotFound)
+		return
+	}
+
+	http.ServeFile(w, r, filepath.Join(initDir, "local_repo", packageInfo.BinpkgPath, filename))
+}
@@ -45,6 +45,12 @@ func Handler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	// Build servers stream packages as raw request body while they are being compressed
+	if filename := r.Header.Get("Filename"); filename != "" {
+		handleStream(w, r, packageName, filepath.Base(filename))
+		return
+	}
+
 	file, fileHeader, err := r.FormFile("file")
 	if err != nil {
 		http.Error(w, "No file part", http.StatusBadRequest)
@@ -53,7 +59,7 @@ func Handler(w http.ResponseWriter, r *http.Request) {
 	defer func(file multipart.File) {
 		err := file.Close()
 		if err != nil {
-
+			log.Printf("Failed to close uploaded file: %v", err)
 		}
 	}(file)
 
@@ -62,42 +68,61 @@ func Handler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	saveUpload(w, packageName, filepath.Base(fileHeader.Filename), file)
+}
+
+func handleStream(w http.ResponseWriter, r *http.Request, packageName string, filename string) {
+	saveUpload(w, packageName, filename, r.Body)
+}
+
+// saveUpload writes an upload to <file>.part next to its destination and renames it once it's complete, so
+// a package is never served half-written and an aborted upload doesn't replace the previous file
+func saveUpload(w http.ResponseWriter, packageName string, filename string, body io.Reader) {
 	packageInfo, ok := index[packageName]
 	if !ok {
 		http.Error(w, "Package not found", http.StatusNotFound)
 		return
 	}
 
-	destPath := filepath.Join(initDir, "local_repo", packageInfo.BinpkgPath, fileHeader.Filename)
-	out, err := os.Create(destPath)
-	if err != nil {
+	destPath := filepath.Join(initDir, "local_repo", packageInfo.BinpkgPath, filename)
+	partPath := destPath + ".part"
+
+	if err := writeFile(partPath, body); err != nil {
+		if err := os.Remove(partPath); err != nil && !os.IsNotExist(err) {
+			log.Printf("Failed to remove %s: %v", partPath, err)
+		}
 		http.Error(w, fmt.Sprintf("Failed to save file: %v", err), http.StatusInternalServerError)
 		return
 	}
-	defer func(out *os.File) {
-		err := out.Close()
-		if err != nil {
 
-		}
-	}(out)
-
-	fileBytes, err := io.ReadAll(file)
-	if err != nil {
-		http.Error(w, fmt.Sprintf("Failed to read file: %v", err), http.StatusInternalServerError)
+	if err := os.Rename(partPath, destPath); err != nil {
+		http.Error(w, fmt.Sprintf("Failed to save file: %v", err), http.StatusInternalServerError)
 		return
 	}
 
-	_, err = out.Write(fileBytes)
+	w.WriteHeader(http.StatusOK)
+	_, err := fmt.Fprintf(w, "Binpkg for package '%s' uploaded successfully (%s)", packageName, filename)
 	if err != nil {
-		http.Error(w, fmt.Sprintf("Failed to write file: %v", err), http.StatusInternalServerError)
 		return
 	}
+}
 
-	w.WriteHeader(http.StatusOK)
-	_, err = fmt.Fprintf(w, "Binpkg for package '%s' uploaded successfully (%s)", packageName, fileHeader.Filename)
+func writeFile(path string, body io.Reader) error {
+	out, err := os.Create(path)
 	if err != nil {
-		return
+		return err
+	}
+
+	if _, err = io.Copy(out, body); err == nil {
+		err = out.Sync()
 	}
+
+	// A failed close can mean the data never reached the disk, so it fails the upload as well
+	if closeErr := out.Close(); err == nil {
+		err = closeErr
+	}
+
+	return err
 }
 
 func isValidToken(authHeader string) bool {
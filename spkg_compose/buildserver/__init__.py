@@ -203,32 +203,58 @@ class BuildServer:
                                 os.system(f"tar xf {filename}")
                                 os.chdir(package.build.workdir)
 
-                        logger.routine(
-                            f"{MAGENTA}rt@build{CRESET}: Creating binpkg ..."
-                        )
-                        build_package = package.install_pkg.makepkg()
-
-                        logger.ok(f"{MAGENTA}rt@build{CRESET}: Package successfully build as '{CYAN}{build_package}{RESET}'")
-                        logger.info(f"{MAGENTA}rt@build{CRESET}: Uploading package to {BLUE}{repo_url}{RESET} ...")
+                        build_package = None
+                        build_packages = []
+                        deltas = {}
                         url = f"{repo_url}/upload"
-
                         headers = {
                             "Authorization": f"Bearer {self.config.token}",
                             "Package": package.meta.id
                         }
-                        files = {
-                            "file": open(f"{init_dir}/{build_package}", "rb")
-                        }
+
                         try:
-                            response = requests.post(url, headers=headers, files=files)
+                            # Formats that support it are compressed and uploaded at the same time
+                            if hasattr(package.install_pkg, "stream"):
+                                build_package = package.install_pkg.package_name()
+                                build_packages = [build_package]
+                                logger.routine(
+                                    f"{MAGENTA}rt@build{CRESET}: Creating binpkg and uploading it to "
+                                    f"{BLUE}{repo_url}{RESET} ..."
+                                )
+
+                                headers["Filename"] = build_package
+                                response = requests.post(url, headers=headers, data=package.install_pkg.stream())
+                            else:
+                                logger.routine(
+                                    f"{MAGENTA}rt@build{CRESET}: Creating binpkg ..."
+                                )
+                                build_package = package.install_pkg.makepkg()
+
+                                # Compose files with several formats give one package per format
+                                build_packages = build_package if isinstance(build_package, list) else [build_package]
+                                build_package = build_packages[0]
+
+                                for package_name in build_packages:
+                                    logger.ok(
+                                        f"{MAGENTA}rt@build{CRESET}: Package successfully build as "
+                                        f"'{CYAN}{package_name}{RESET}'"
+                                    )
+                                    logger.info(
+                                        f"{MAGENTA}rt@build{CRESET}: Uploading package to {BLUE}{repo_url}{RESET} ..."
+                                    )
+
+                                    with open(f"{init_dir}/{package_name}", "rb") as package_file:
+                                        response = requests.post(url, headers=headers, files={"file": package_file})
+
+                                    if response.status_code != 200:
+                                        break
+
+                            if response.status_code == 200:
+                                deltas = upload_deltas(url, headers, build_packages)
                         except Exception as err:
                             logger.warning(f"{MAGENTA}rt@build{CRESET}: Apparently the HTTP API is not available{RESET}")
                             logger.warning(f"{MAGENTA}rt@build{CRESET}: Error details: {err}{RESET}")
-                            logger.info(
-                                f"{MAGENTA}rt@build{CRESET}: Removing locally saved package "
-                                f"'{CYAN}{build_package}{RESET}'"
-                            )
-                            os.remove(f"{init_dir}/{build_package}")
+                            remove_local_packages(build_packages)
                             logger.warning(f"{MAGENTA}rt@build{CRESET}: Build not succeeded{RESET}")
                             return client.send({"response": "failed"})
 
@@ -238,11 +264,7 @@ class BuildServer:
                                     f"{MAGENTA}rt@build{CRESET}: This build server does not have access to the HTTP "
                                     f"API. Check the token in your config{RESET}"
                                 )
-                                logger.info(
-                                    f"{MAGENTA}rt@build{CRESET}: Removing locally saved package "
-                                    f"'{CYAN}{build_package}{RESET}'"
-                                )
-                                os.remove(f"{init_dir}/{build_package}")
+                                remove_local_packages(build_packages)
                                 logger.warning(f"{MAGENTA}rt@build{CRESET}: Build not succeeded{RESET}")
                                 return client.send({"response": "failed"})
 
@@ -252,11 +274,7 @@ class BuildServer:
                                     f"The API returned with status code 404 - Not Found"
                                 )
                                 logger.warning(f"{MAGENTA}rt@build{CRESET}: Error details: {response.text}{RESET}")
-                                logger.info(
-                                    f"{MAGENTA}rt@build{CRESET}: Removing locally saved package "
-                                    f"'{CYAN}{build_package}{RESET}'"
-                                )
-                                os.remove(f"{init_dir}/{build_package}")
+                                remove_local_packages(build_packages)
                                 logger.warning(f"{MAGENTA}rt@build{CRESET}: Build not succeeded{RESET}")
                                 return client.send({"response": "failed"})
 
@@ -265,11 +283,7 @@ class BuildServer:
 
                             case 500:
                                 logger.warning(f"{MAGENTA}rt@build{CRESET}: Internal server error! Something went wrong!")
-                                logger.info(
-                                    f"{MAGENTA}rt@build{CRESET}: Removing locally saved package "
-                                    f"'{CYAN}{build_package}{RESET}'"
-                                )
-                                os.remove(f"{init_dir}/{build_package}")
+                                remove_local_packages(build_packages)
                                 logger.warning(f"{MAGENTA}rt@build{CRESET}: Build not succeeded{RESET}")
                                 return client.send({"response": "failed"})
 
@@ -279,11 +293,24 @@ class BuildServer:
                                     f"{response.status_code}{RESET}"
                                 )
 
-                        logger.info(f"{MAGENTA}rt@build{CRESET}: Removing locally saved package '{CYAN}{build_package}{RESET}'")
-                        os.remove(f"{init_dir}/{build_package}")
+                        # The server puts package_file into the binpkg URL of the specfile, so it's the binpkg
+                        # whatever the order of `As` is. All packages are reported by format as well
+                        packages = package_formats(package.install_pkg)
+                        build_package = packages.get("binpkg", build_package)
+
+                        # The next version gets its delta against the packages the repository has now
+                        if hasattr(package.install_pkg, "publish"):
+                            package.install_pkg.publish()
+
+                        remove_local_packages(build_packages)
 
                         logger.ok(f"{MAGENTA}rt@build{CRESET}: Build succeeded{RESET}")
-                        client.send({"response": "success", "package_file": build_package})
+                        client.send({
+                            "response": "success",
+                            "package_file": build_package,
+                            "packages": packages,
+                            "delta_file": deltas.get(build_package)
+                        })
 
             except Exception as err:
                 logger.warning(f"Client '{CYAN}{client.address}{RESET}' disconnected unexpected ({err})")
@@ -308,6 +335,53 @@ class BuildServer:
             logger.warning("spkg-compose build server will be terminated")
 
 
+def package_formats(install_pkg) -> dict:
+    """Returns {format: package name} of the packages a build created, e.g. {"deb": ..., "binpkg": ...}"""
+    formats = getattr(install_pkg, "formats", [install_pkg])
+    return {package_format.format: package_format.package_name() for package_format in formats}
+
+
+def upload_deltas(url: str, headers: dict, build_packages: list) -> dict:
+    """Uploads the deltas that were created next to the packages. A delta that can't be uploaded is left out,
+    clients download the full package then. Returns {package: delta} of the uploaded ones"""
+    deltas = {}
+
+    for build_package in build_packages:
+        delta = f"{build_package}.delta"
+
+        if not os.path.exists(f"{init_dir}/{delta}"):
+            continue
+
+        logger.info(f"{MAGENTA}rt@build{CRESET}: Uploading delta '{CYAN}{delta}{RESET}' ...")
+
+        with open(f"{init_dir}/{delta}", "rb") as delta_file:
+            response = requests.post(url, headers={**headers, "Filename": delta}, data=delta_file)
+
+        if response.status_code == 200:
+            deltas[build_package] = delta
+        else:
+            logger.warning(
+                f"{MAGENTA}rt@build{CRESET}: Delta '{CYAN}{delta}{RESET}' was not uploaded "
+                f"(status code {response.status_code})"
+            )
+
+    return deltas
+
+
+def remove_local_packages(build_packages: list):
+    for build_package in build_packages:
+        if build_package is None:
+            continue
+
+        # Together with the delta against the previous version, if one was created
+        for file in (build_package, f"{build_package}.delta"):
+            if not os.path.exists(f"{init_dir}/{file}"):
+                continue
+
+            logger.info(f"{MAGENTA}rt@build{CRESET}: Removing locally saved package '{CYAN}{file}{RESET}'")
+            os.remove(f"{init_dir}/{file}")
+
+
 def build_server_main(args):
     logger.default(f"Starting spkg-compose build server v{BUILD_SERVER_VERSION} for {CYAN}{platform.machine()}{RESET}")
     logger.info(f"{MAGENTA}server@meta{RESET}: Server Name: {CYAN}{_cfg.name}{RESET}")
@@ -141,6 +141,15 @@ def build(compose_file):
             os.system(f"tar xf {filename}")
             os.chdir(package.build.workdir)
 
-    package = package.install_pkg.makepkg()
+    install_pkg = package.install_pkg
+    package = install_pkg.makepkg()
+
+    # A local build is delivered once it's written, the next version gets its delta against it
+    if hasattr(install_pkg, "publish"):
+        install_pkg.publish()
+
+    # Compose files with several formats give one package per format
+    if isinstance(package, list):
+        package = "', '".join(package)
 
     print(f"\n{BACK_GREEN}   OK   {BACK_RESET}  Package successfully build as '{package}'")
@@ -0,0 +1,62 @@
+from spkg_compose.core.parser import read
+from spkg_compose.package import SpkgBuild
+
+import os
+import threading
+
+
+class ComposeCache:
+    """Process-wide cache of parsed compose files.
+
+    A file is only parsed again when its identity (inode, size, mtime) changed, e.g. after the version in it
+    was updated. The returned SpkgBuild objects are shared between all callers and must not be modified.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, file_path: str) -> SpkgBuild:
+        path = os.path.abspath(file_path)
+
+        # The file is stat'ed before it's read, so a change during parsing is noticed on the next load
+        stat = os.stat(path)
+        identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(path)
+
+            if entry is not None and entry[0] == identity:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        package = SpkgBuild(read(path))
+
+        with self._lock:
+            self._entries[path] = (identity, package)
+
+        return package
+
+    def prune(self, file_paths):
+        """Forgets every file that isn't in file_paths anymore (e.g. removed packages)"""
+        keep = {os.path.abspath(file_path) for file_path in file_paths}
+
+        with self._lock:
+            for path in self._entries.keys() - keep:
+                del self._entries[path]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+compose_cache = ComposeCache()
@@ -1,15 +1,46 @@
 from spkg_compose.server.config import config
 from spkg_compose import init_dir
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, send_from_directory
 
+import contextlib
 import json
+import os
+import threading
 
 
 app = Flask(__name__)
 
-with open(f"{init_dir}/data/index.json", 'r') as json_file:
-    index = json.load(json_file)
+
+class IndexFile:
+    """index.json as exported by the server, read again only when the server replaced it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime_ns = None
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        """Returns the index, which is empty while the server hasn't exported one (yet), so every package
+        is not found"""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        with self._lock:
+            if mtime_ns is None:
+                self.data, self.mtime_ns = {}, None
+            elif mtime_ns != self.mtime_ns:
+                with open(self.path, 'r') as json_file:
+                    self.data = json.load(json_file)
+                self.mtime_ns = mtime_ns
+
+            return self.data
+
+
+index_file = IndexFile(f"{init_dir}/data/index.json")
 
 
 @app.route('/upload', methods=['POST'])
@@ -20,6 +51,10 @@ def upload_file():
     if auth_header not in [f"Bearer {token}" for token in config.repo_api.allowed_tokens]:
         abort(403)
 
+    # Build servers stream packages as raw request body while they are being compressed
+    if request.headers.get('Filename'):
+        return upload_stream(package_name, request.headers.get('Filename'))
+
     if 'file' not in request.files:
         abort(400, "No file part")
 
@@ -27,12 +62,51 @@ def upload_file():
     if file.filename == '':
         abort(400, "No selected file")
 
+    return save_upload(package_name, os.path.basename(file.filename), file.stream)
+
+
+def upload_stream(package_name: str, filename: str):
+    return save_upload(package_name, os.path.basename(filename), request.stream)
+
+
+def save_upload(package_name: str, filename: str, stream):
+    """Writes an upload to <file>.part next to its destination and moves it into place once it's complete,
+    so a package is never served half-written and an aborted upload doesn't replace the previous file"""
+    try:
+        destination = f"{config.data_dir}/{index_file.get()[package_name]['binpkg_path']}/{filename}"
+    except KeyError:
+        return f"Package not found ({package_name})", 404
+
+    part_file = f"{destination}.part"
+
     try:
-        file.save(f"{config.data_dir}/{index[package_name]['binpkg_path']}/{file.filename}")
+        with open(part_file, 'wb') as file:
+            while chunk := stream.read(1024 * 1024):
+                file.write(chunk)
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(part_file, destination)
     except Exception as err:
-        return f"Package not found ({err})", 404
+        with contextlib.suppress(OSError):
+            os.remove(part_file)
+
+        return f"Failed to save file ({err})", 500
+
+    return f"Binpkg for package '{package_name}' uploaded successfully ({filename})", 200
+
+
+@app.route('/packages/<package_name>/<filename>', methods=['GET'])
+def download_file(package_name: str, filename: str):
+    """Serves the uploaded files of a package, e.g. a binpkg and the delta against its previous version"""
+    try:
+        binpkg_path = index_file.get()[package_name]['binpkg_path']
+    except KeyError:
+        abort(404)
 
-    return f"Binpkg for package '{package_name}' uploaded successfully ({file.filename})", 200
+    # Range requests are supported, so interrupted downloads can be resumed
+    return send_from_directory(f"{config.data_dir}/{binpkg_path}", filename, conditional=True)
 
 
 def repo_api_main():
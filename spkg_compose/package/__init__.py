@@ -1,78 +1,122 @@
 from spkg_compose.package.builder import SpkgPackageBuilder
 from spkg_compose.package.deb import SpkgDebPkgFormat
 from spkg_compose.package.binpkg import SpkgBinPkgFormat
+from spkg_compose.package.multi import SpkgMultiFormat
+
+from dataclasses import dataclass
+
+import sys
 
 
 class SpkgBuild:
+    """A parsed compose file.
+
+    The sections are immutable and architecture and build system names are interned, as the server keeps one
+    SpkgBuild per package in memory. The builder and the package formats are only created when they're used,
+    which is on build servers and `spkg-compose build`.
+    """
+
+    __slots__ = ("compose_data", "meta", "prepare", "build", "install", "_builder", "_install_pkg")
+
     def __init__(self, data: dict):
         self.compose_data = data
 
-        self.meta = _SpkgPackageMeta()
-        self.prepare = _SpkgPackagePrepare()
-        self.build = _SpkgPackageBuild()
-        self.install = _SpkgPackageInstall()
+        self._builder = None
+        self._install_pkg = None
 
-        self.builder = None
-        self.install_pkg = None
+        self.meta, self.prepare, self.build, self.install = self.parse()
 
-        match data["Build"]["BuildSys"]:
-            case "cargo":
-                self.builder = SpkgPackageBuilder.Cargo(data)
-            case "any":
-                self.builder = SpkgPackageBuilder.Any(data)
-            case "none":
-                self.builder = SpkgPackageBuilder.NoneType(data)
+        # The sections of the builder and the formats have to be there, even though they're only read later
+        sections = [f"Build.{self.build.build_system}"] if self.build.build_system in ("cargo", "any") else []
+        sections += [f"Install.{type_as}" for type_as in self.install.formats if type_as in ("deb", "binpkg")]
 
-        match data["Install"]["As"]:
-            case "deb":
-                self.install_pkg = SpkgDebPkgFormat(data)
-            case "binpkg":
-                self.install_pkg = SpkgBinPkgFormat(data)
+        for section in sections:
+            if section not in data:
+                raise KeyError(section)
 
-        self.parse()
+    @property
+    def builder(self):
+        if self._builder is None:
+            match self.build.build_system:
+                case "cargo":
+                    self._builder = SpkgPackageBuilder.Cargo(self.compose_data)
+                case "any":
+                    self._builder = SpkgPackageBuilder.Any(self.compose_data)
+                case "none":
+                    self._builder = SpkgPackageBuilder.NoneType(self.compose_data)
 
-    def parse(self):
-        self.meta.name = self.compose_data["Meta"]["Name"]
-        self.meta.id = self.compose_data["Meta"]["Id"]
-        self.meta.description = self.compose_data["Meta"]["Description"]
-        self.meta.version = self.compose_data["Meta"]["Version"]
-        self.meta.architecture = self.compose_data["Meta"]["Architecture"]
-        self.meta.author = self.compose_data["Meta"]["Author"]
-        self.meta.source = self.compose_data["Meta"]["Source"]
+        return self._builder
 
-        self.prepare.type = self.compose_data["Prepare"]["Type"]
-        self.prepare.url = self.compose_data["Prepare"]["URL"]
+    @property
+    def install_pkg(self):
+        if self._install_pkg is None:
+            formats = []
 
-        self.build.build_system = self.compose_data["Build"]["BuildSys"]
-        self.build.workdir = self.compose_data["Build"]["Workdir"]
+            # As can list several formats (e.g. "binpkg, deb"), which are all created from the same build
+            for type_as in self.install.formats:
+                match type_as:
+                    case "deb":
+                        formats.append(SpkgDebPkgFormat(self.compose_data))
+                    case "binpkg":
+                        formats.append(SpkgBinPkgFormat(self.compose_data))
 
-        self.install.type_as = self.compose_data["Install"]["As"]
+            if len(formats) == 1:
+                self._install_pkg = formats[0]
+            elif formats:
+                self._install_pkg = SpkgMultiFormat(formats)
 
+        return self._install_pkg
 
+    def parse(self):
+        meta = self.compose_data["Meta"]
+        prepare = self.compose_data["Prepare"]
+        build = self.compose_data["Build"]
+        install = self.compose_data["Install"]
+
+        return (
+            _SpkgPackageMeta(
+                name=meta["Name"],
+                id=meta["Id"],
+                description=meta["Description"],
+                version=meta["Version"],
+                architecture=sys.intern(meta["Architecture"]),
+                author=meta["Author"],
+                source=meta["Source"],
+            ),
+            _SpkgPackagePrepare(type=sys.intern(prepare["Type"]), url=prepare["URL"]),
+            _SpkgPackageBuild(build_system=sys.intern(build["BuildSys"]), workdir=build["Workdir"]),
+            _SpkgPackageInstall(
+                type_as=install["As"],
+                formats=tuple(sys.intern(type_as.strip()) for type_as in install["As"].split(","))
+            ),
+        )
+
+
+@dataclass(frozen=True, slots=True)
 class _SpkgPackageMeta:
-    def __init__(self):
-        self.name = None
-        self.id = None
-        self.description = None
-        self.version = None
-        self.architecture = None
-        self.author = None
-        self.source = None
+    name: str
+    id: str
+    description: str
+    version: str
+    architecture: str
+    author: str
+    source: str
 
 
+@dataclass(frozen=True, slots=True)
 class _SpkgPackagePrepare:
-    def __init__(self):
-        self.type = None
-        self.url = None
-        self.branch = None
+    type: str
+    url: str
+    branch: str | None = None
 
 
+@dataclass(frozen=True, slots=True)
 class _SpkgPackageBuild:
-    def __init__(self):
-        self.build_system = None
-        self.workdir = None
+    build_system: str
+    workdir: str
 
 
+@dataclass(frozen=True, slots=True)
 class _SpkgPackageInstall:
-    def __init__(self):
-        self.type_as = None
+    type_as: str
+    formats: tuple
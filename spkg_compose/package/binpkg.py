@@ -1,19 +1,30 @@
 import shutil
 
 from spkg_compose import execution_dir
-from binpkg import BinPkg
+from spkg_compose.package.cache import ArtifactCache, tree_manifest
+from spkg_compose.package.staging import expand_sources, stage
+from binpkg import BinPkg, STREAM_CHUNK_SIZE
 from binpkg.metadata import Metadata
+from binpkg.stream import TeeWriter, iter_chunks
+from binpkg.toc import add_trees
 
+import contextlib
 import platform
 import os
 
 
 class SpkgBinPkgFormat:
+    format = "binpkg"
+
     def __init__(self, raw_data: dict):
         self.compose_data = raw_data
 
         self.prefix = raw_data["Install.binpkg"]["Prefix"]
         self.target = raw_data["Install.binpkg"]["Target"]
+        self.threads = raw_data["Install.binpkg"].get("Threads", "auto")
+        self.compression = raw_data["Install.binpkg"].get("Compression", "gzip")
+        self.index = raw_data["Install.binpkg"].get("Index", "false").lower() == "true"
+        self.reproducible = raw_data["Install.binpkg"].get("Reproducible", "false").lower() == "true"
         self.build_workdir = raw_data["Build"]["Workdir"]
 
         self.name = self.compose_data["Meta"]["Name"]
@@ -23,7 +34,10 @@ class SpkgBinPkgFormat:
         self.architecture = self.compose_data["Meta"]["Architecture"]
         self.author = self.compose_data["Meta"]["Author"]
 
-    def makepkg(self):
+        self.cache = ArtifactCache(f"{execution_dir}/.cache/binpkg")
+        self._cache_key = None
+
+    def stage(self):
         os.chdir(f"{execution_dir}/_work")
         try:
             os.mkdir("_binpkg")
@@ -47,30 +61,146 @@ class SpkgBinPkgFormat:
                     os.makedirs(current_path)
 
         os.chdir(f"{execution_dir}/_work")
-        os.system(f"cp -r {self.build_workdir}/{self.target} _binpkg/{self.prefix}")
+        stage(self.sources(), "_binpkg")
 
+        return "./_binpkg"
+
+    def package_name(self):
         if self.architecture == "%runtime_arch%":
             self.architecture = platform.machine()
 
-        if os.path.exists(f"{self.id}-{self.version}-{self.architecture}.binpkg"):
-            os.remove(f"{self.id}-{self.version}-{self.architecture}.binpkg")
-
-        if os.path.exists(f"../{self.id}-{self.version}-{self.architecture}.binpkg"):
-            os.remove(f"../{self.id}-{self.version}-{self.architecture}.binpkg")
-
-        BinPkg.create(
-            meta=Metadata(
-                name=self.name,
-                id=self.id,
-                version=self.version,
-                description=self.description,
-                architecture=self.architecture,
-                author=self.author
-            ),
-            source_dir="./_binpkg",
-            output_file=f"{self.id}-{self.version}-{self.architecture}.binpkg"
+        return f"{self.id}-{self.version}-{self.architecture}.binpkg"
+
+    def metadata(self):
+        return Metadata(
+            name=self.name,
+            id=self.id,
+            version=self.version,
+            description=self.description,
+            architecture=self.architecture,
+            author=self.author
         )
 
-        os.system(f"mv {self.id}-{self.version}-{self.architecture}.binpkg ..")
+    def create_options(self):
+        return {
+            "threads": (os.cpu_count() or 1) if self.threads == "auto" else int(self.threads),
+            "compression": self.compression,
+            "index": self.index,
+            "reproducible": self.reproducible
+        }
 
-        return f"{self.id}-{self.version}-{self.architecture}.binpkg"
+    def sources(self):
+        """Returns the paths that stage() copies into the package, together with their path inside the package"""
+        return expand_sources(f"{execution_dir}/_work/{self.build_workdir}/{self.target}", self.prefix)
+
+    def cache_key(self):
+        # The build output doesn't change anymore once packaging starts, so the tree is only hashed once
+        if self._cache_key is None:
+            options = self.create_options()
+            del options["threads"]
+
+            self._cache_key = ArtifactCache.key(tree_manifest(self.sources()), self.metadata().serialize(), options)
+
+        return self._cache_key
+
+    def relabel_cached(self):
+        """Writes the package from the artifact cache if nothing changed since the last build.
+        Returns False if there is no cached build"""
+        cached = self.cache.lookup(f"{self.id}-{self.architecture}", self.cache_key())
+
+        if cached is None:
+            return False
+
+        # Only the header with the new version has to be written
+        os.chdir(f"{execution_dir}/_work")
+        BinPkg.relabel(cached, self.metadata(), f"{execution_dir}/{self.package_name()}")
+
+        return True
+
+    @contextlib.contextmanager
+    def writer(self):
+        """Opens the package for writing, the staged tree is added to the yielded TreeTarget with add_trees"""
+        package = self.package_name()
+
+        with BinPkg.writer(self.metadata(), f"{execution_dir}/{package}", **self.create_options()) as target:
+            yield target
+
+        self.cache.store(f"{self.id}-{self.architecture}", self.cache_key(), f"{execution_dir}/{package}")
+
+    def makepkg(self):
+        package = self.package_name()
+
+        # The package is written straight to its destination, there is no temporary file to move
+        if not self.relabel_cached():
+            with self.writer() as target:
+                add_trees([target], self.stage(), '.')
+
+        if self.index:
+            self.makedelta()
+
+        return package
+
+    def stream(self):
+        """Stages the package and yields it in chunks while it's being compressed, without writing it to disk.
+        Packages with index are written to disk as well, because the delta against the previous version is
+        created from the complete package once the stream is done"""
+        package = self.package_name()
+        slot = f"{self.id}-{self.architecture}"
+        key = self.cache_key()
+        cached = self.cache.lookup(slot, key)
+
+        with contextlib.ExitStack() as stack:
+            local_file = stack.enter_context(open(f"{execution_dir}/{package}", "wb")) if self.index else None
+
+            def sink_of(sink):
+                return sink if local_file is None else TeeWriter(sink, local_file)
+
+            if cached is not None:
+                yield from iter_chunks(
+                    lambda sink: BinPkg.relabel(cached, self.metadata(), sink_of(sink)), STREAM_CHUNK_SIZE
+                )
+            else:
+                self.stage()
+
+                with self.cache.open_writer(slot) as cache_file:
+                    yield from iter_chunks(
+                        lambda sink: BinPkg.create(
+                            meta=self.metadata(),
+                            source_dir="./_binpkg",
+                            output_file=TeeWriter(sink_of(sink), cache_file),
+                            **self.create_options()
+                        ),
+                        STREAM_CHUNK_SIZE
+                    )
+
+                self.cache.commit(slot, key)
+
+        if self.index:
+            self.makedelta()
+
+    def makedelta(self):
+        """Creates a delta against the last delivered version of this package (see publish), if there is one.
+        Returns the name of the delta file or None"""
+        package = self.package_name()
+        base = self.cache.base(f"{self.id}-{self.architecture}")
+
+        # A delta of an earlier build must not be taken for one of this package
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{execution_dir}/{package}.delta")
+
+        if base is None or BinPkg.read(base).meta.version == self.version:
+            return None
+
+        try:
+            BinPkg.create_delta(base, f"{execution_dir}/{package}", f"{execution_dir}/{package}.delta")
+        except ValueError:
+            # The previous version was created without index
+            return None
+
+        return f"{package}.delta"
+
+    def publish(self):
+        """Keeps the package as the base of the next delta. Called once the package was delivered, so the
+        base of a delta is always the package the clients have"""
+        if self.index:
+            self.cache.keep_base(f"{self.id}-{self.architecture}", f"{execution_dir}/{self.package_name()}")
@@ -0,0 +1,105 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import stat
+
+
+def _hash_file(path: str) -> str:
+    file_hash = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def tree_manifest(sources: list) -> str:
+    """Returns a content hash over (source path, destination path) pairs of files and directories.
+    Paths, types, permissions, symlink targets and file contents are part of the hash, timestamps are not"""
+    manifest = hashlib.sha256()
+
+    def add(path: str, dest: str):
+        st = os.lstat(path)
+
+        if stat.S_ISLNK(st.st_mode):
+            content = os.readlink(path)
+        elif stat.S_ISREG(st.st_mode):
+            content = _hash_file(path)
+        else:
+            content = ""
+
+        manifest.update(f"{dest}\0{stat.S_IFMT(st.st_mode)}\0{stat.S_IMODE(st.st_mode)}\0{content}\n".encode())
+
+    for source, dest in sorted(sources, key=lambda pair: pair[1]):
+        add(source, dest)
+
+        if os.path.isdir(source) and not os.path.islink(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+
+                for name in sorted(dirs + files):
+                    path = os.path.join(root, name)
+                    add(path, os.path.join(dest, os.path.relpath(path, source)))
+
+    return manifest.hexdigest()
+
+
+class ArtifactCache:
+    """Keeps the last package built for every package id and architecture, together with the key of its input.
+    A build with the same key can reuse the compressed payload instead of packing everything again.
+
+    The last package that was delivered (e.g. uploaded to the repository) is kept as well, as the base of
+    the delta of the next version"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def key(manifest: str, meta: dict, options: dict) -> str:
+        meta = {key: value for key, value in meta.items() if key != "version"}
+        return hashlib.sha256(json.dumps([manifest, meta, options], sort_keys=True).encode()).hexdigest()
+
+    def _path(self, slot: str):
+        return f"{self.directory}/{slot}.binpkg"
+
+    def lookup(self, slot: str, key: str):
+        try:
+            with open(f"{self._path(slot)}.key", "r") as key_file:
+                if key_file.read().strip() == key and os.path.exists(self._path(slot)):
+                    return self._path(slot)
+        except FileNotFoundError:
+            pass
+
+        return None
+
+    def open_writer(self, slot: str):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(f"{self._path(slot)}.tmp", "wb")
+
+    def commit(self, slot: str, key: str):
+        # Drop the old key first, so an interrupted commit never pairs a package with the wrong key
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{self._path(slot)}.key")
+
+        os.replace(f"{self._path(slot)}.tmp", self._path(slot))
+
+        with open(f"{self._path(slot)}.key", "w") as key_file:
+            key_file.write(key)
+
+    def store(self, slot: str, key: str, package_file: str):
+        with open(package_file, "rb") as package, self.open_writer(slot) as writer:
+            shutil.copyfileobj(package, writer, 1024 * 1024)
+
+        self.commit(slot, key)
+
+    def base(self, slot: str):
+        path = f"{self.directory}/{slot}.base.binpkg"
+        return path if os.path.exists(path) else None
+
+    def keep_base(self, slot: str, package_file: str):
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.copyfile(package_file, f"{self.directory}/{slot}.base.binpkg.tmp")
+        os.replace(f"{self.directory}/{slot}.base.binpkg.tmp", f"{self.directory}/{slot}.base.binpkg")
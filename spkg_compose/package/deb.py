@@ -1,16 +1,23 @@
-import platform
+import shutil
 
 from spkg_compose import execution_dir
+from spkg_compose.package.debfile import DebPkg
+from spkg_compose.package.staging import expand_sources, stage
 
+import platform
 import os
 
 
 class SpkgDebPkgFormat:
+    format = "deb"
+
     def __init__(self, raw_data: dict):
         self.compose_data = raw_data
 
         self.prefix = raw_data["Install.deb"]["Prefix"]
         self.target = raw_data["Install.deb"]["Target"]
+        self.threads = raw_data["Install.deb"].get("Threads", "auto")
+        self.compression = raw_data["Install.deb"].get("Compression", "gzip")
         self.build_workdir = raw_data["Build"]["Workdir"]
 
         self.name = self.compose_data["Meta"]["Name"]
@@ -20,13 +27,15 @@ class SpkgDebPkgFormat:
         self.architecture = self.compose_data["Meta"]["Architecture"]
         self.author = self.compose_data["Meta"]["Author"]
 
-    def makepkg(self):
+    def stage(self):
         os.chdir(f"{execution_dir}/_work")
-        os.mkdir("_deb")
+        try:
+            os.mkdir("_deb")
+        except FileExistsError:
+            shutil.rmtree("_deb")
+            os.mkdir("_deb")
         os.chdir("_deb")
 
-        os.mkdir("DEBIAN")
-
         path = ""
 
         if not self.prefix == "/":
@@ -42,8 +51,11 @@ class SpkgDebPkgFormat:
                     os.makedirs(current_path)
 
         os.chdir(f"{execution_dir}/_work")
-        os.system(f"cp -r {self.build_workdir}/{self.target} _deb/{self.prefix}")
+        stage(self.sources(), "_deb")
 
+        return "./_deb"
+
+    def package_name(self):
         if self.architecture == "%runtime_arch%":
             match platform.machine():
                 case "x86_64":
@@ -53,20 +65,39 @@ class SpkgDebPkgFormat:
                 case "x86":
                     self.architecture = "i386"
 
-        with open("_deb/DEBIAN/control", "w") as _deb_control:
-            _deb_control.write(f"""Package: {self.id}
-Version: {self.version}
-Architecture: {self.architecture}
-Maintainer: {self.author}
-Description: {self.description}
-""")
+        return f"{self.id}-{self.version}_{self.architecture}.deb"
+
+    def control(self):
+        return {
+            "Package": self.id,
+            "Version": self.version,
+            "Architecture": self.architecture,
+            "Maintainer": self.author,
+            "Description": self.description,
+        }
+
+    def create_options(self):
+        return {
+            "threads": (os.cpu_count() or 1) if self.threads == "auto" else int(self.threads),
+            "compression": self.compression
+        }
 
-            _deb_control.close()
+    def sources(self):
+        """Returns the paths that stage() copies into the package, together with their path inside the package"""
+        return expand_sources(f"{execution_dir}/_work/{self.build_workdir}/{self.target}", self.prefix)
 
-            os.chdir(f"{execution_dir}/_work")
+    def writer(self):
+        """Opens the package for writing, the staged tree is added to the yielded TreeTarget with add_trees"""
+        return DebPkg.writer(self.control(), f"{execution_dir}/{self.package_name()}", **self.create_options())
+
+    def makepkg(self):
+        package = self.package_name()
 
-            os.system("dpkg-deb --build _deb")
-            os.system(f"mv _deb.deb {self.id}-{self.version}_{self.architecture}.deb")
-            os.system(f"mv {self.id}-{self.version}_{self.architecture}.deb ..")
+        DebPkg.create(
+            control=self.control(),
+            source_dir=self.stage(),
+            output_file=f"{execution_dir}/{package}",
+            **self.create_options()
+        )
 
-            return f"{self.id}-{self.version}_{self.architecture}.deb"
+        return package
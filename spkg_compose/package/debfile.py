@@ -0,0 +1,156 @@
+from binpkg.codec import get_codec
+from binpkg.parallel import ParallelWriter
+from binpkg.toc import TreeTarget, add_trees
+
+import contextlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+AR_MAGIC = b"!<arch>\n"
+DEB_FORMAT_VERSION = b"2.0\n"
+
+# Suffix of data.tar for every codec dpkg can read
+EXTENSIONS = {
+    "gzip": ".gz",
+    "xz": ".xz",
+    "zstd": ".zst",
+    "none": "",
+}
+
+
+class DebPkg:
+    def __init__(self, control: dict, output: str, compression: str):
+        self.control: dict = control
+        self.output: str = output
+        self.compression: str = compression
+
+    @classmethod
+    def create(cls, control: dict, source_dir: str, output_file: str, threads: int = 1, compression: str = "gzip"):
+        """Creates a .deb from a staged tree without dpkg-deb. The tree is only read once: data.tar is
+        compressed while the md5sums and the Installed-Size of the control file are collected.
+
+        `control` holds the fields of DEBIAN/control"""
+        control = dict(control)
+
+        with cls.writer(control, output_file, threads, compression) as target:
+            add_trees([target], source_dir, '.')
+
+        return cls(control, output_file, get_codec(compression).name)
+
+    @classmethod
+    @contextlib.contextmanager
+    def writer(cls, control: dict, output_file: str, threads: int = 1, compression: str = "gzip"):
+        """Context manager form of create: yields the TreeTarget the tree is added to with add_trees and
+        writes the package on exit. Installed-Size is added to `control`"""
+        codec = get_codec(compression)
+
+        if codec.name not in EXTENSIONS:
+            raise ValueError(f"Compression '{codec.name}' is not supported for deb packages")
+
+        mtime = int(os.environ.get("SOURCE_DATE_EPOCH", time.time()))
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+
+        md5sums = []
+        digests = {}
+        installed_size = 0
+
+        def after(tarinfo, md5):
+            nonlocal installed_size
+
+            # Hardlinks are regular files once installed, so they are in md5sums with the content of their target
+            if tarinfo.islnk():
+                md5 = digests.get(tarinfo.linkname)
+
+            if md5 is not None:
+                digests[tarinfo.name] = md5
+                md5sums.append(f"{md5}  {tarinfo.name.removeprefix('./')}\n")
+
+            # Same estimate dpkg-gencontrol uses: file sizes rounded up to KiB, 1 KiB for everything else
+            if tarinfo.isreg():
+                installed_size += (tarinfo.size + 1023) // 1024
+            else:
+                installed_size += 1
+
+        # The control archive comes first in a deb but depends on the data, so data.tar is buffered on disk
+        with tempfile.TemporaryFile(dir=output_dir) as data:
+            # Concatenated gzip members are a valid gzip stream for every decoder, dpkg included
+            if codec.name == "gzip" and threads > 1:
+                writer = ParallelWriter(data, codec.compress, threads)
+            else:
+                writer = codec.open_writer(data, threads)
+
+            with writer, tarfile.open(fileobj=writer, mode='w|', format=tarfile.GNU_FORMAT) as tar:
+                yield TreeTarget(tar, after=after, filter=_root_owner, algorithm="md5")
+
+            control["Installed-Size"] = str(installed_size)
+            control_tar = _control_tar(control, "".join(md5sums), mtime)
+
+            with open(output_file, 'wb') as f:
+                f.write(AR_MAGIC)
+                _write_member(f, "debian-binary", DEB_FORMAT_VERSION, mtime)
+                _write_member(f, "control.tar.gz", control_tar, mtime)
+
+                f.write(_ar_header(f"data.tar{EXTENSIONS[codec.name]}", data.tell(), mtime))
+                data.seek(0)
+                shutil.copyfileobj(data, f)
+
+                if f.tell() % 2:
+                    f.write(b"\n")
+
+
+def _root_owner(tarinfo):
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = "root"
+    return tarinfo
+
+
+def _control_tar(control: dict, md5sums: str, mtime: int) -> bytes:
+    buffer = io.BytesIO()
+
+    with get_codec("gzip").open_writer(buffer) as writer, \
+            tarfile.open(fileobj=writer, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        root = tarfile.TarInfo(".")
+        root.type = tarfile.DIRTYPE
+        root.mode = 0o755
+        root.mtime = mtime
+        tar.addfile(_root_owner(root))
+
+        for name, content in (("control", _format_control(control)), ("md5sums", md5sums)):
+            content = content.encode("utf-8")
+
+            tarinfo = tarfile.TarInfo(f"./{name}")
+            tarinfo.size = len(content)
+            tarinfo.mode = 0o644
+            tarinfo.mtime = mtime
+            tar.addfile(_root_owner(tarinfo), io.BytesIO(content))
+
+    return buffer.getvalue()
+
+
+def _format_control(control: dict) -> str:
+    lines = []
+
+    for field, value in control.items():
+        first, *rest = str(value).strip().split("\n")
+        lines.append(f"{field}: {first}")
+
+        # Continuation lines of multi-line fields (e.g. Description) are indented, empty ones are a single dot
+        lines.extend(f" {line}" if line.strip() else " ." for line in rest)
+
+    return "\n".join(lines) + "\n"
+
+
+def _ar_header(name: str, size: int, mtime: int) -> bytes:
+    return f"{name:<16}{mtime:<12}{0:<6}{0:<6}{0o100644:<8o}{size:<10}`\n".encode("ascii")
+
+
+def _write_member(f, name: str, data: bytes, mtime: int):
+    f.write(_ar_header(name, len(data), mtime))
+    f.write(data)
+
+    if len(data) % 2:
+        f.write(b"\n")
@@ -0,0 +1,42 @@
+from binpkg.toc import add_trees
+
+import contextlib
+
+
+class SpkgMultiFormat:
+    """Packages one build in several formats (`As=binpkg, deb`).
+
+    Formats with the same Prefix and Target contain the same files, so their tree is staged once and every
+    file is read once for all of their packages."""
+
+    def __init__(self, formats: list):
+        self.formats = formats
+
+    def makepkg(self):
+        """Creates the packages of all formats and returns their names, in the order of `As`"""
+        packages = [package_format.package_name() for package_format in self.formats]
+        groups = {}
+
+        for package_format in self.formats:
+            if hasattr(package_format, "relabel_cached") and package_format.relabel_cached():
+                continue
+
+            groups.setdefault((package_format.prefix, package_format.target), []).append(package_format)
+
+        for group in groups.values():
+            source_dir = group[0].stage()
+
+            with contextlib.ExitStack() as stack:
+                targets = [stack.enter_context(package_format.writer()) for package_format in group]
+                add_trees(targets, source_dir, '.')
+
+        for package_format in self.formats:
+            if getattr(package_format, "index", False):
+                package_format.makedelta()
+
+        return packages
+
+    def publish(self):
+        for package_format in self.formats:
+            if hasattr(package_format, "publish"):
+                package_format.publish()
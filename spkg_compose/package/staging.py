@@ -0,0 +1,70 @@
+import contextlib
+import errno
+import fcntl
+import glob
+import os
+import shutil
+
+# ioctl request for copy-on-write clones of a whole file (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+
+def expand_sources(pattern: str, prefix: str) -> list:
+    """Resolves the Target pattern of a compose file like the shell would and returns (path, path inside the
+    package) pairs, with the same layout `cp -r <pattern> <prefix>` would create. Like cp, fails if nothing matches,
+    instead of creating an empty package"""
+    paths = sorted(glob.glob(pattern))
+
+    if not paths:
+        raise FileNotFoundError(errno.ENOENT, "Target matches no files", pattern)
+
+    prefix = prefix.strip("/")
+    return [(path, os.path.join(prefix, os.path.basename(path))) for path in paths]
+
+
+def _reflink(source: str, target: str):
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def stage_file(source: str, target: str):
+    """Puts a file into the staging tree without copying its data if possible: as hardlink, as copy-on-write
+    reflink or, if the filesystem supports neither, as a regular copy"""
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        pass
+
+    try:
+        _reflink(source, target)
+        shutil.copystat(source, target)
+        return
+    except OSError:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(target)
+
+    shutil.copy2(source, target)
+
+
+def stage_tree(source: str, target: str):
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), target)
+
+    elif os.path.isdir(source):
+        os.makedirs(target, exist_ok=True)
+        shutil.copymode(source, target)
+
+        for name in sorted(os.listdir(source)):
+            stage_tree(os.path.join(source, name), os.path.join(target, name))
+
+    else:
+        stage_file(source, target)
+
+
+def stage(sources: list, root: str):
+    """Stages (path, path inside the package) pairs from expand_sources into root"""
+    for source, dest in sources:
+        target = os.path.join(root, dest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        stage_tree(source, target)
@@ -1,7 +1,8 @@
 from spkg_compose import SERVER_VERSION, BUILD_SERVER_VERSION, init_dir
-from spkg_compose.server.config import config as _cfg
+from spkg_compose.server.index import Index, IndexStore
 from spkg_compose.server.json import send_json, convert_json_data
 from spkg_compose.server.routines import Routines
+from spkg_compose.server.webhook import PLACEHOLDER_SECRET, WebhookServer
 from spkg_compose.utils.colors import *
 from spkg_compose.cli.logger import logger
 
@@ -13,9 +14,12 @@ import socket
 
 class Server:
     def __init__(self, args):
-        self.config = _cfg
+        # Loaded when the server starts, not on import: the build server imports this package as well
+        from spkg_compose.server.config import config
+
+        self.config = config
         self.args = args
-        self.index = f"{init_dir}/data/index.json"
+        self.index = Index(IndexStore(f"{init_dir}/data/index.db", f"{init_dir}/data/index.json"))
 
         if "token" in self.args.options:
             try:
@@ -98,6 +102,9 @@ class Server:
             logger.error("No build server available! spkg-compose server will be terminated")
             sys.exit(1)
 
+        if self.config.webhook.enabled:
+            self.start_webhook()
+
         i = 0
         len_routines = len(self.config.routines)
         try:
@@ -117,6 +124,33 @@ class Server:
                 thread.join()
         except KeyboardInterrupt:
             logger.warning("spkg-compose server will be terminated")
+            self.index.flush()
+
+    def start_webhook(self):
+        """Starts the webhook receiver. Pushes and releases are updated right away, the checkout routine only
+        finds changes that had no webhook"""
+        webhook = self.config.webhook
+
+        # Anyone who read the default config could sign requests with the placeholder
+        if not webhook.secret or webhook.secret == PLACEHOLDER_SECRET:
+            logger.error(f"{MAGENTA}webhook{RESET}: No secret configured, webhooks are disabled")
+            return
+
+        try:
+            server = WebhookServer(webhook.address, webhook.port, webhook.secret, self.routines.on_webhook)
+        except OSError as err:
+            logger.error(f"{MAGENTA}webhook{RESET}: Cannot listen on {webhook.address}:{webhook.port} ({err})")
+            return
+
+        server.start()
+
+        thread = threading.Thread(target=self.routines.run_webhook_updates)
+        thread.daemon = True
+        thread.start()
+
+        logger.ok(
+            f"{MAGENTA}webhook{RESET}: Listening for GitHub webhooks on {CYAN}{webhook.address}:{server.port}{RESET}"
+        )
 
 
 def server_main(args):
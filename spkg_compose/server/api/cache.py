@@ -0,0 +1,109 @@
+from spkg_compose.server.api.tokens import TokenPool
+
+import json
+import os
+import threading
+
+import requests
+
+
+class ResponseCache:
+    """ETag and Last-Modified of GitHub API responses, kept in a file between runs.
+
+    Requests for a known URL are sent with If-None-Match / If-Modified-Since. GitHub answers 304 Not Modified
+    if nothing changed, which doesn't count against the rate limit. Only the value extracted from the last
+    full response (e.g. the latest tag) is kept, not the response itself.
+
+    GitHub's responses vary by Authorization, so the validators are kept for every token separately. With a
+    TokenPool, the request is made conditional with the validators of the token the pool sends it with.
+    """
+
+    def __init__(self, cache_file: str, session=requests):
+        self.cache_file = cache_file
+        self.session = session
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+
+        try:
+            with open(cache_file, "r") as _cache:
+                entries = json.load(_cache)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entries = {}
+
+        # Entries of older versions have no validators per token and are requested again
+        self._entries = {url: entry for url, entry in entries.items() if "validators" in entry}
+
+    def get(self, url: str, headers: dict, extract) -> tuple[int, object]:
+        """Requests url and returns the status code and extract(response.json()). A 304 returns the value of
+        the last full response with status 200"""
+        with self._lock:
+            entry = self._entries.get(url)
+
+        # The token of the last attempt, as the pool sends a request again with another token if its token ran out
+        used = {}
+
+        def conditional_headers(token: str = "") -> dict:
+            used["token"] = token
+            request_headers = dict(headers)
+            validators = entry["validators"].get(token) if entry is not None else None
+
+            if validators is not None:
+                if validators["etag"]:
+                    request_headers["If-None-Match"] = validators["etag"]
+                if validators["last_modified"]:
+                    request_headers["If-Modified-Since"] = validators["last_modified"]
+
+            return request_headers
+
+        if isinstance(self.session, TokenPool):
+            response = self.session.get(url, headers=conditional_headers)
+        else:
+            response = self.session.get(url, headers=conditional_headers())
+
+        with self._lock:
+            self.requests += 1
+
+            if response.status_code == 304 and entry is not None:
+                self.hits += 1
+                return 200, entry["value"]
+
+        if response.status_code != 200:
+            return response.status_code, None
+
+        value = extract(response.json())
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+        if etag or last_modified:
+            with self._lock:
+                entry = self._entries.get(url)
+
+                # The validators of the other tokens belong to the old value, if it changed
+                if entry is None or entry["value"] != value:
+                    entry = self._entries[url] = {"value": value, "validators": {}}
+
+                entry["validators"][used["token"]] = {"etag": etag, "last_modified": last_modified}
+
+        return response.status_code, value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "ratio": self.hits / self.requests if self.requests else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.hits = 0
+
+    def save(self):
+        tmp_file = f"{self.cache_file}.tmp"
+
+        with self._lock:
+            with open(tmp_file, "w") as _cache:
+                json.dump(self._entries, _cache)
+
+        os.replace(tmp_file, self.cache_file)
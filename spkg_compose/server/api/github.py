@@ -1,4 +1,4 @@
-from spkg_compose.core.parser import read
+from spkg_compose.core.cache import compose_cache
 from spkg_compose.server.client import BuildServerClient
 from spkg_compose.server.yaml import ordered_load, ordered_dump
 from spkg_compose.cli.logger import RtLogger
@@ -9,26 +9,126 @@ from spkg_compose.package import SpkgBuild
 from enum import Enum
 
 import requests
-import json
+import requests.adapters
 import copy
+import json
 import threading
 import time
 
 
 
-def gh_check_ratelimit(token: str):
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': f'Bearer {token}'
+def gh_session(pool_size: int = 10) -> requests.Session:
+    """A session that keeps up to pool_size connections to the GitHub API alive, to be shared by all threads"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+API_URL = "https://api.github.com"
+GRAPHQL_URL = f"{API_URL}/graphql"
+
+GRAPHQL_BRANCH = "defaultBranchRef { target { oid } }"
+GRAPHQL_REPOSITORY = (
+    "releases(first: 1, orderBy: {field: CREATED_AT, direction: DESC}) { nodes { tagName } } " + GRAPHQL_BRANCH
+)
+
+
+def gh_batch_latest(repos: list, token: str, batch_size: int = 50, url: str = GRAPHQL_URL, session=requests,
+                    executor=None, commits_only=frozenset()) -> tuple[dict, int]:
+    """Looks up the latest release (the first one of /releases) and the head of the default branch (the first
+    one of /commits) of many "owner/repo" repositories, with one GraphQL query per `batch_size` of them. With
+    an executor, the queries are sent concurrently. Repositories in commits_only are only asked for the head of
+    the default branch.
+
+    Returns {repo: (tag or None, sha or None)} and the number of queries. Repositories that couldn't be looked
+    up are left out"""
+    repos = list(dict.fromkeys(repos))
+    batches = [repos[offset:offset + batch_size] for offset in range(0, len(repos), batch_size)]
+    results = {}
+
+    def query(batch):
+        return _gh_batch_query(batch, token, url, session, commits_only)
+
+    for batch_results in (executor.map(query, batches) if executor is not None else map(query, batches)):
+        results.update(batch_results)
+
+    return results, len(batches)
+
+
+def gh_latest(repositories: list, token: str, batch_size: int, session=requests, executor=None,
+              rt_logger: RtLogger | None = None, commits_only=frozenset()):
+    """Looks up the latest release and commit of the repositories of many GitHubApi instances. They're looked up
+    with gh_batch_latest() (one GraphQL query per `batch_size` of them, none with a batch size of 0), the ones the
+    batch couldn't look up (e.g. after an error) with lookup(). With an executor, the lookups run concurrently.
+    Releases aren't asked for if all packages of a repository are in commits_only (package names).
+
+    Yields (git, (tag, sha) or None) in the order of repositories, each as soon as its lookup is done"""
+    latest = {}
+
+    if batch_size > 0 and repositories:
+        repos = [git.to_gh_api_url("")[1] for git in repositories]
+        releases = {git.to_gh_api_url("")[1] for git in repositories if git.package.meta.id not in commits_only}
+
+        latest, queries = gh_batch_latest(
+            repos, token, batch_size, GRAPHQL_URL, session, executor, set(repos) - releases
+        )
+
+        if rt_logger is not None:
+            rt_logger.info(
+                f"Looked up {CYAN}{len(latest)}{RESET} repositories with {CYAN}{queries}{RESET} GraphQL queries"
+            )
+
+    lookups = {
+        git: executor.submit(git.lookup) if executor is not None else None
+        for git in repositories if git.to_gh_api_url("")[1] not in latest
     }
 
-    response = requests.get("https://api.github.com/rate_limit", headers=headers)
-    result = response.json()
-    rlimit_limit = result["resources"]["core"]["limit"]
-    rlimit_remaining = result["resources"]["core"]["remaining"]
-    rlimit_reset = result["resources"]["core"]["reset"]
+    for git in repositories:
+        if git not in lookups:
+            yield git, latest[git.to_gh_api_url("")[1]]
+        else:
+            yield git, lookups[git].result() if lookups[git] is not None else git.lookup()
+
 
-    return rlimit_limit, rlimit_remaining, rlimit_reset
+def _gh_batch_query(batch: list, token: str, url: str, session, commits_only=frozenset()) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    fields = []
+    results = {}
+
+    for i, repo in enumerate(batch):
+        owner, name = repo.split("/", 1)
+        fields.append(
+            f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) "
+            f"{{ {GRAPHQL_BRANCH if repo in commits_only else GRAPHQL_REPOSITORY} }}"
+        )
+
+    response = session.post(url, headers=headers, json={"query": f"query {{ {' '.join(fields)} }}"})
+
+    if response.status_code != 200:
+        return results
+
+    # Repositories that don't exist are null, with an entry in "errors"
+    data = response.json().get("data") or {}
+
+    for i, repo in enumerate(batch):
+        node = data.get(f"r{i}")
+
+        if node is None:
+            continue
+
+        releases = node["releases"]["nodes"] if "releases" in node else []
+        branch = node["defaultBranchRef"]
+
+        results[repo] = (
+            releases[0]["tagName"] if releases else None,
+            branch["target"]["oid"] if branch is not None else None,
+        )
+
+    return results
 
 
 class GitReleaseType(Enum):
@@ -47,152 +147,165 @@ class GitHubApi:
         self.file_path = file_path
         self.rt_logger = rt_logger
 
-        with open(self.server.index, 'r') as json_file:
-            self.index = json.load(json_file)
+        # A copy of the entry in the shared index, written back with update_json()
+        self.entry = self.server.index.get(self.package.meta.id)
 
     def update_json(self):
-        with open(self.server.index, 'w') as json_file:
-            json.dump(self.index, json_file, indent=2)
+        self.server.index.put(self.package.meta.id, self.entry)
 
     def to_gh_api_url(self, endpoint):
         parts = self.repo_url.rstrip('/').split('/')
         owner = parts[-2]
         repo = parts[-1]
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/{endpoint}"
+        api_url = f"{API_URL}/repos/{owner}/{repo}/{endpoint}"
         return api_url, f"{owner}/{repo}"
 
-    def fetch(self):
-        """Fetches the latest release from GitHub. If there is no release, the last commit is retrieved"""
-        try:
-            checkfor = self.index[self.package.meta.id]["checkfor"]
-        except:
-            checkfor = ""
-
-        api_url, repo = self.to_gh_api_url("releases")
-        headers = {
+    def headers(self) -> dict:
+        return {
             "Accept": "application/vnd.github.v3+json",
             "Authorization": f"Bearer {self.api_token}"
         }
-        response = requests.get(api_url, headers=headers)
 
-        self.repo = repo
+    def fetch(self):
+        """Fetches the latest release from GitHub. If there is no release, the last commit is retrieved"""
+        latest = self.lookup()
 
-        if checkfor == "commit":
-            return self.fetch_commit()
+        if latest is not None:
+            self.process_latest(*latest)
 
-        if response.status_code == 200:
-            releases = response.json()
+    def lookup(self) -> tuple[str | None, str | None] | None:
+        """Requests the latest release or, if there is none or only commits are checked for, the latest commit.
+        Returns (tag, sha), with None for the one that wasn't requested, or None after an error.
 
-            if releases:
-                latest_release = releases[0]["tag_name"]
+        Only reads from GitHub, so lookups of different packages can run concurrently"""
+        # Packages that are only checked for commits don't need to know about releases
+        if self.entry.get("checkfor", "") != "commit":
+            api_url, repo = self.to_gh_api_url("releases")
+            status_code, latest_release = self.server.http_cache.get(
+                api_url, self.headers(), lambda releases: releases[0]["tag_name"] if releases else None
+            )
 
-                for arch, up_to_date in self.index[self.package.meta.id]["architectures"].items():
-                    if not up_to_date:
-                        self.rt_logger.warning(
-                            f"Package '{CYAN}{self.package.meta.id}{RESET}' for arch '{GREEN}{arch}{RESET}' "
-                            f"was not updated correctly during the last update"
-                        )
+            if status_code != 200:
+                self.rt_logger.error(f"Error while fetching {repo} (Status code {status_code})")
+                return None
 
-                        self.pre_update_single_arch(arch=arch, release_type=GitReleaseType.RELEASE)
+            if latest_release is not None:
+                return latest_release, None
 
-                # If version in index is empty
-                if self.index[self.package.meta.id]["latest"] == "":
-                    self.rt_logger.info(f"Updating index version for {repo} to {GREEN}{latest_release}{RESET}")
-                    self.index[self.package.meta.id]["latest"] = latest_release
-                    self.update_json()
+        api_url, repo = self.to_gh_api_url("commits")
+        status_code, latest_commit = self.server.http_cache.get(
+            api_url, self.headers(), lambda commits: commits[0]["sha"] if commits else None
+        )
 
-                # If version in index matches latest git version
-                elif self.index[self.package.meta.id]["latest"] == latest_release:
-                    self.rt_logger.info(f"No new release for {repo} ({GREEN}{latest_release}{RESET})")
-                    self.update_json()
+        if status_code != 200:
+            self.rt_logger.error(f"Error while fetching {repo} (Status code {status_code})")
+            return None
 
-                # If version in index does not matches latest git version
-                else:
-                    self.rt_logger.info(f"New release found for {repo}: {CYAN}{latest_release}{RESET}")
-                    previous_version = self.index[self.package.meta.id]["latest"]
-                    self.index[self.package.meta.id]["latest"] = latest_release
-                    status = self.pre_update(
-                        release_type=GitReleaseType.RELEASE,
-                        string=latest_release,
-                        previous_index_version=previous_version
-                    )
+        return None, latest_commit
 
-                    match status:
-                        case 255:
-                            self.rt_logger.warning(
-                                f"The index has a different version than the compose file "
-                                f"(compose: {GREEN}{self.package.meta.version}{RESET}, "
-                                f"index: {YELLOW}{previous_version.replace('v', '')}{RESET})"
-                            )
-                            self.rt_logger.warning(
-                                "This should not happen. Either the version was changed manually or the "
-                                "update process was interrupted."
-                            )
-            else:
-                self.fetch_commit()
-        else:
-            self.rt_logger.error(f"Error while fetching {repo} (Status code {response.status_code})")
+    def process_latest(self, latest_release: str | None, latest_commit: str | None) -> str | None:
+        """Updates the package to the latest release or commit, as returned by lookup() or gh_batch_latest().
+        Returns the one that was used"""
+        self.repo = self.to_gh_api_url("")[1]
 
-    def fetch_commit(self):
-        """Fetches the latest commit from GitHub."""
+        if latest_release is not None and self.entry.get("checkfor", "") != "commit":
+            self.process_release(latest_release)
+            return latest_release
 
-        api_url, repo = self.to_gh_api_url("commits")
-        headers = {
-            "Accept": "application/vnd.github.v3+json",
-            "Authorization": f"Bearer {self.api_token}"
-        }
-        response = requests.get(api_url, headers=headers)
+        if latest_commit is not None:
+            self.process_commit(latest_commit)
 
-        self.repo = repo
+        return latest_commit
 
-        if response.status_code == 200:
-            commits = response.json()
+    def process_release(self, latest_release: str):
+        repo = self.repo
 
-            if commits:
-                latest_commit = commits[0]["sha"]
+        for arch, up_to_date in self.entry["architectures"].items():
+            if not up_to_date:
+                self.rt_logger.warning(
+                    f"Package '{CYAN}{self.package.meta.id}{RESET}' for arch '{GREEN}{arch}{RESET}' "
+                    f"was not updated correctly during the last update"
+                )
 
-                for arch, up_to_date in self.index[self.package.meta.id]["architectures"].items():
-                    if not up_to_date:
-                        self.rt_logger.warning(
-                            f"Package '{CYAN}{self.package.meta.id}{RESET}' for arch '{GREEN}{arch}{RESET}' "
-                            f"was not updated correctly during the last update"
-                        )
+                self.pre_update_single_arch(arch=arch, release_type=GitReleaseType.RELEASE)
 
-                        self.pre_update_single_arch(arch=arch, release_type=GitReleaseType.COMMIT)
+        # If version in index is empty
+        if self.entry["latest"] == "":
+            self.rt_logger.info(f"Updating index version for {repo} to {GREEN}{latest_release}{RESET}")
+            self.entry["latest"] = latest_release
+            self.update_json()
 
-                # If commit hash in index is empty
-                if self.index[self.package.meta.id]["latest"] == "":
-                    self.rt_logger.info(f"Updating index version for {repo} to {GREEN}{latest_commit[:7]}{RESET}")
-                    self.index[self.package.meta.id]["latest"] = latest_commit
-                    self.update_json()
+        # If version in index matches latest git version
+        elif self.entry["latest"] == latest_release:
+            self.rt_logger.info(f"No new release for {repo} ({GREEN}{latest_release}{RESET})")
+            self.update_json()
 
-                elif self.index[self.package.meta.id]["latest"] == latest_commit:
-                    self.rt_logger.info(f"No new commit for {repo} ({GREEN}{latest_commit[:7]}{RESET})")
-                    self.update_json()
+        # If version in index does not matches latest git version
+        else:
+            self.rt_logger.info(f"New release found for {repo}: {CYAN}{latest_release}{RESET}")
+            previous_version = self.entry["latest"]
+            self.entry["latest"] = latest_release
+            status = self.pre_update(
+                release_type=GitReleaseType.RELEASE,
+                string=latest_release,
+                previous_index_version=previous_version
+            )
 
-                else:
-                    self.rt_logger.info(f"New commit found for {repo}: {CYAN}{latest_commit[:7]}{RESET}")
-                    previous_version = self.index[self.package.meta.id]["latest"]
-                    self.index[self.package.meta.id]["latest"] = latest_commit
-                    status = self.pre_update(
-                        release_type=GitReleaseType.COMMIT,
-                        string=latest_commit[:7],
-                        previous_index_version=previous_version
+            match status:
+                case 255:
+                    self.rt_logger.warning(
+                        f"The index has a different version than the compose file "
+                        f"(compose: {GREEN}{self.package.meta.version}{RESET}, "
+                        f"index: {YELLOW}{previous_version.replace('v', '')}{RESET})"
+                    )
+                    self.rt_logger.warning(
+                        "This should not happen. Either the version was changed manually or the "
+                        "update process was interrupted."
                     )
 
-                    match status:
-                        case 255:
-                            self.rt_logger.warning(
-                                f"The index has a different version than the compose file "
-                                f"(compose: {GREEN}{self.package.meta.version[4:]}{RESET}, "
-                                f"index: {YELLOW}{previous_version[:7]}{RESET})"
-                            )
-                            self.rt_logger.warning(
-                                "This should not happen. Either the version was changed manually or the "
-                                "update process was interrupted."
-                            )
+    def process_commit(self, latest_commit: str):
+        repo = self.repo
+
+        for arch, up_to_date in self.entry["architectures"].items():
+            if not up_to_date:
+                self.rt_logger.warning(
+                    f"Package '{CYAN}{self.package.meta.id}{RESET}' for arch '{GREEN}{arch}{RESET}' "
+                    f"was not updated correctly during the last update"
+                )
+
+                self.pre_update_single_arch(arch=arch, release_type=GitReleaseType.COMMIT)
+
+        # If commit hash in index is empty
+        if self.entry["latest"] == "":
+            self.rt_logger.info(f"Updating index version for {repo} to {GREEN}{latest_commit[:7]}{RESET}")
+            self.entry["latest"] = latest_commit
+            self.update_json()
+
+        elif self.entry["latest"] == latest_commit:
+            self.rt_logger.info(f"No new commit for {repo} ({GREEN}{latest_commit[:7]}{RESET})")
+            self.update_json()
+
         else:
-            self.rt_logger.error(f"Error while fetching {repo} (Status code {response.status_code})")
+            self.rt_logger.info(f"New commit found for {repo}: {CYAN}{latest_commit[:7]}{RESET}")
+            previous_version = self.entry["latest"]
+            self.entry["latest"] = latest_commit
+            status = self.pre_update(
+                release_type=GitReleaseType.COMMIT,
+                string=latest_commit[:7],
+                previous_index_version=previous_version
+            )
+
+            match status:
+                case 255:
+                    self.rt_logger.warning(
+                        f"The index has a different version than the compose file "
+                        f"(compose: {GREEN}{self.package.meta.version[4:]}{RESET}, "
+                        f"index: {YELLOW}{previous_version[:7]}{RESET})"
+                    )
+                    self.rt_logger.warning(
+                        "This should not happen. Either the version was changed manually or the "
+                        "update process was interrupted."
+                    )
 
     def pre_update(self, release_type: GitReleaseType, string, previous_index_version):
         version = ""
@@ -221,7 +334,7 @@ class GitHubApi:
         )
 
         # Check if build server is available
-        servers = self.is_buildserver_available(self.index[self.package.meta.id]["architectures"])
+        servers = self.is_buildserver_available(self.entry["architectures"])
 
         if not servers:
             self.rt_logger.warning("Canceling update process", suffix="build")
@@ -259,7 +372,7 @@ class GitHubApi:
                 successful_processes += 1
                 self.rt_logger.ok(f"Build succeeded for {CYAN}{arch}{RESET}", suffix=f"build.{info['name']}")
                 try:
-                    with open(self.index[self.package.meta.id]["specfile"], 'r') as file:
+                    with open(self.entry["specfile"], 'r') as file:
                         specfile = ordered_load(file)
 
                     if specfile["binpkg"][arch]["url"] == "None":
@@ -286,7 +399,13 @@ class GitHubApi:
                         new_url = f"{base_url}/{info['package']}"
                         specfile["binpkg"][arch]["url"] = new_url
 
-                    with open(self.index[self.package.meta.id]["specfile"], 'w') as file:
+                    # The delta is uploaded next to the package. One of an earlier version must not stay
+                    if info.get("delta"):
+                        specfile["binpkg"][arch]["delta"] = f"{base_url}/{info['delta']}"
+                    else:
+                        specfile["binpkg"][arch].pop("delta", None)
+
+                    with open(self.entry["specfile"], 'w') as file:
                         ordered_dump(specfile, file, default_flow_style=False)
 
                     # todo: Update database
@@ -302,8 +421,11 @@ class GitHubApi:
                 self.rt_logger.warning(
                     f"Build not succeeded for {CYAN}{arch}{RESET}", suffix=f"build.{info['name']}"
                 )
-                self.index[self.package.meta.id]["architectures"][arch] = False
-                self.update_json()
+                # Only the architecture is written, other changes to the entry aren't final yet
+                self.entry["architectures"][arch] = False
+                self.server.index.update(
+                    self.package.meta.id, lambda entry: entry["architectures"].update({arch: False})
+                )
 
         if successful_processes < total_processes:
             self.rollback(
@@ -314,7 +436,7 @@ class GitHubApi:
             )
 
     def pre_update_single_arch(self, arch: str, release_type: GitReleaseType):
-        string = self.index[self.package.meta.id]["latest"]
+        string = self.entry["latest"]
         version = ""
         match release_type:
             case GitReleaseType.COMMIT:
@@ -349,34 +471,38 @@ class GitHubApi:
         for arch, info in success.items():
             if info["status"]:
                 self.rt_logger.ok(f"Build succeeded for {CYAN}{arch}{RESET}", suffix=f"build.{info['name']}")
-                self.index[self.package.meta.id]["architectures"][arch] = True
+                self.entry["architectures"][arch] = True
                 self.update_json()
             else:
                 self.rt_logger.warning(
                     message=f"Build not succeeded for {CYAN}{arch}{RESET}",
                     suffix=f"build.{info['name']}"
                 )
-                self.index[self.package.meta.id]["architectures"][arch] = False
-                self.update_json()
+                # Only the architecture is written, other changes to the entry aren't final yet
+                self.entry["architectures"][arch] = False
+                self.server.index.update(
+                    self.package.meta.id, lambda entry: entry["architectures"].update({arch: False})
+                )
 
     def update_specfile(self, version):
-        with open(self.index[self.package.meta.id]["specfile"], 'r') as file:
+        with open(self.entry["specfile"], 'r') as file:
             specfile = ordered_load(file)
 
         specfile_old = copy.deepcopy(specfile)
 
         specfile["package"]["version"] = version
 
-        with open(self.index[self.package.meta.id]["specfile"], 'w') as file:
+        with open(self.entry["specfile"], 'w') as file:
             ordered_dump(specfile, file, default_flow_style=False)
 
         return specfile_old
 
     def build_pkg(self, server, arch, package, name):
-        _status, _package = server.update_pkg(self, package, name, self.server.config.repo_api_url)
+        _status, _package, _delta = server.update_pkg(self, package, name, self.server.config.repo_api_url)
         server.disconnect()
         self.status[arch]["status"] = _status
         self.status[arch]["package"] = _package
+        self.status[arch]["delta"] = _delta
 
     def update_package(self, version, servers):
         self.status = {}
@@ -418,8 +544,7 @@ class GitHubApi:
                 server_name=name,
             )
 
-            data = read(self.file_path)
-            package = SpkgBuild(data)
+            package = compose_cache.load(self.file_path)
 
             thread = threading.Thread(target=self.build_pkg, args=(server, arch, package, name,))
             threads.append(thread)
@@ -456,13 +581,13 @@ class GitHubApi:
                 server_name=name,
             )
 
-            data = read(self.file_path)
-            package = SpkgBuild(data)
+            package = compose_cache.load(self.file_path)
 
-            _status, _package = server.update_pkg(self, package, name, self.server.config.repo_api_url)
+            _status, _package, _delta = server.update_pkg(self, package, name, self.server.config.repo_api_url)
             server.disconnect()
             self.status[arch]["status"] = _status
             self.status[arch]["package"] = _package
+            self.status[arch]["delta"] = _delta
 
         return self.status
 
@@ -535,13 +660,11 @@ class GitHubApi:
                 self.rt_logger.warning(
                     f"No build server for arch '{GREEN}{arch}{RESET}' is currently available", suffix="build"
                 )
-                with open(self.server.index, 'r') as json_file:
-                    index = json.load(json_file)
-
-                with open(self.server.index, 'w') as json_file:
-                    index[self.package.meta.id]["architectures"][arch] = False
-                    self.index[self.package.meta.id]["architectures"][arch] = False
-                    json.dump(index, json_file, indent=2)
+                # Only the architecture is written, other changes to the entry aren't final yet
+                self.entry["architectures"][arch] = False
+                self.server.index.update(
+                    self.package.meta.id, lambda entry: entry["architectures"].update({arch: False})
+                )
 
         if total_available_servers == 0:
             self.rt_logger.warning(
@@ -556,10 +679,10 @@ class GitHubApi:
         old_version = ""
         match release_type:
             case GitReleaseType.RELEASE:
-                new_version = self.index[self.package.meta.id]['latest'].replace('v', '')
+                new_version = self.entry['latest'].replace('v', '')
                 old_version = index_version.replace('v', '')
             case GitReleaseType.COMMIT:
-                new_version = f"git+{self.index[self.package.meta.id]['latest'][:7]}"
+                new_version = f"git+{self.entry['latest'][:7]}"
                 old_version = f"git+{index_version[:7]}"
 
         self.rt_logger.warning(
@@ -569,8 +692,8 @@ class GitHubApi:
         with open(self.file_path, 'w') as file:
             file.write(compose_old)
 
-        with open(self.index[self.package.meta.id]["specfile"], 'w') as file:
+        with open(self.entry["specfile"], 'w') as file:
             ordered_dump(specfile_old, file, default_flow_style=False)
 
-        self.index[self.package.meta.id]["latest"] = index_version
+        self.entry["latest"] = index_version
         self.update_json()
@@ -0,0 +1,134 @@
+from spkg_compose.cli.logger import logger
+from spkg_compose.utils.colors import *
+from spkg_compose.utils.time import unix_to_readable
+
+import threading
+import time
+
+import requests
+
+# GitHub's limit for authenticated requests, assumed for tokens that weren't used yet
+DEFAULT_LIMIT = 5000
+
+
+class TokenPool:
+    """All configured GitHub tokens, used like a requests session.
+
+    The remaining requests of every token are taken from the X-RateLimit-* headers of its responses, separately
+    for the REST and the GraphQL API. Every request is sent with the token that has the most requests left.
+    When no token has any left, requests wait until the earliest reset instead of failing.
+    """
+
+    def __init__(self, tokens: dict, session=requests, preferred: str | None = None):
+        # The preferred token comes first, so it's used while the others have no more requests left than it
+        self.tokens = {name: tokens[name] for name in sorted(tokens, key=lambda name: name != preferred)}
+        self.session = session
+
+        self._quota = {}
+        self._lock = threading.Lock()
+        self._announced_reset = None
+
+    def get(self, url: str, headers=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, headers, **kwargs)
+
+    def post(self, url: str, headers=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, headers, **kwargs)
+
+    def request(self, method: str, url: str, headers=None, **kwargs) -> requests.Response:
+        """headers can also be a function that gets the name of the token the request is sent with and returns
+        the headers, for headers that depend on the token (GitHub's responses vary by Authorization, so an ETag
+        is only good for the token it was returned to)"""
+        resource = "graphql" if url.rstrip("/").endswith("/graphql") else "core"
+
+        while True:
+            name = self._acquire(resource)
+            request_headers = headers(name) if callable(headers) else headers
+
+            response = self.session.request(
+                method, url, headers={**(request_headers or {}), "Authorization": f"Bearer {self.tokens[name]}"},
+                **kwargs
+            )
+
+            # A token that ran out in the meantime (e.g. used by something else) gets the request rejected,
+            # so it's sent again with the next one
+            if not self._update(name, resource, response) or response.status_code not in (403, 429):
+                return response
+
+    def metrics(self) -> dict:
+        """Returns {token name: {resource: {limit, remaining, reset, requests}}} of the tokens used so far"""
+        with self._lock:
+            metrics = {}
+
+            for (name, resource), quota in self._quota.items():
+                metrics.setdefault(name, {})[resource] = dict(quota)
+
+            return metrics
+
+    def reset_stats(self):
+        with self._lock:
+            for quota in self._quota.values():
+                quota["requests"] = 0
+
+    def _acquire(self, resource: str) -> str:
+        while True:
+            with self._lock:
+                now = time.time()
+                best = None
+
+                for name in self.tokens:
+                    quota = self._quota_of(name, resource, now)
+
+                    if quota["remaining"] > 0 and (best is None or quota["remaining"] > best[1]["remaining"]):
+                        best = (name, quota)
+
+                if best is not None:
+                    # Counted until the response tells how many are really left, so concurrent requests are
+                    # spread over the tokens
+                    best[1]["remaining"] -= 1
+                    best[1]["requests"] += 1
+                    return best[0]
+
+                reset = min(self._quota_of(name, resource, now)["reset"] for name in self.tokens)
+
+                # Once, not for every request that waits
+                announce = self._announced_reset != (resource, reset)
+                self._announced_reset = (resource, reset)
+
+            if announce:
+                logger.warning(
+                    f"{LIGHT_BLUE}git{RESET}: All tokens reached their {resource} rate limit, waiting until "
+                    f"{unix_to_readable(reset)}"
+                )
+
+            time.sleep(max(reset - time.time(), 0) + 1)
+
+    def _quota_of(self, name: str, resource: str, now: float) -> dict:
+        quota = self._quota.setdefault(
+            (name, resource), {"limit": DEFAULT_LIMIT, "remaining": DEFAULT_LIMIT, "reset": 0, "requests": 0}
+        )
+
+        if quota["reset"] and now >= quota["reset"]:
+            quota["remaining"], quota["reset"] = quota["limit"], 0
+        elif not quota["reset"] and quota["remaining"] <= 0:
+            # Only counted in advance, the token's responses never had a rate limit (e.g. GitHub Enterprise with
+            # rate limiting disabled, or a caching proxy in between), so it didn't run out
+            quota["remaining"] = quota["limit"]
+
+        return quota
+
+    def _update(self, name: str, resource: str, response: requests.Response) -> bool:
+        """Takes the rate limit from the response headers. Returns whether the token has no requests left"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+
+        if remaining is None:
+            return False
+
+        resource = response.headers.get("X-RateLimit-Resource", resource)
+
+        with self._lock:
+            quota = self._quota_of(name, resource, time.time())
+            quota["limit"] = int(response.headers.get("X-RateLimit-Limit", quota["limit"]))
+            quota["remaining"] = int(remaining)
+            quota["reset"] = int(response.headers.get("X-RateLimit-Reset", quota["reset"]))
+
+        return int(remaining) == 0
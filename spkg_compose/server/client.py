@@ -83,7 +83,7 @@ class BuildServerClient:
             self.logger.info(f"Server accepted build request", suffix=f"build.{server_name}")
         else:
             self.logger.warning(f"Server did not accepted build request", suffix=f"build.{server_name}")
-            return False
+            return False, None, None
 
         self.logger.info(
             f"Starting build process ...", suffix=f"build.{server_name}"
@@ -92,10 +92,12 @@ class BuildServerClient:
         response = message["response"]
 
         if response == "success":
-            _package = message["package_file"]
+            # Build servers report every package by format, the binpkg is the one the specfile points to
+            _package = message.get("packages", {}).get("binpkg", message["package_file"])
             self.logger.info(
                 f"Package successfully build as '{CYAN}{_package}{RESET}'", suffix=f"build.{server_name}"
             )
-            return True, _package
+            # Only sent if the build server created a delta against the previous version
+            return True, _package, message.get("delta_file")
         else:
-            return False, None
+            return False, None, None
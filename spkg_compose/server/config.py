@@ -10,6 +10,8 @@ import os
 DEFAULT_CONFIG = """server:
   data_dir: /path/to/your/repo
   repo_api_url: http://localhost:3087
+  watch: false
+  index_workers: auto
 
 build_server:
   main:
@@ -28,6 +30,10 @@ routines:
     every: 15m
 
 github:
+  batch_size: 50
+  concurrency: 8
+  poll_min: 15m
+  poll_max: 24h
   tokens:
     primary:
       token: your_gh_token
@@ -36,6 +42,12 @@ repo_http_api:
   address: 0.0.0.0
   port: 3087
   allowed_tokens: ["insert_token_here"]
+
+webhook:
+  enabled: false
+  address: 0.0.0.0
+  port: 3088
+  secret: insert_secret_here
 """
 
 try:
@@ -61,15 +73,32 @@ class Config:
             self.port = data["port"]
             self.allowed_tokens = data["allowed_tokens"]
 
+    class Webhook:
+        def __init__(self, data):
+            self.raw = data
+            self.enabled = data.get("enabled", False)
+            self.address = data.get("address", "0.0.0.0")
+            self.port = int(data.get("port", 3088))
+            self.secret = data.get("secret", "")
+
     def __init__(self):
         try:
             self.raw = config_data
             self.data_dir = config_data["server"]["data_dir"]
             self.routines = config_data["routines"]
             self.gh_token = config_data["github"]["tokens"]["primary"]["token"]
+            self.gh_token_id = "primary"
+            self.gh_tokens = {name: value["token"] for name, value in config_data["github"]["tokens"].items()}
+            self.gh_batch_size = int(config_data["github"].get("batch_size", 50))
+            self.gh_concurrency = max(1, int(config_data["github"].get("concurrency", 8)))
+            self.gh_poll_min = config_data["github"].get("poll_min", "15m")
+            self.gh_poll_max = config_data["github"].get("poll_max", "24h")
             self.build_server = config_data["build_server"].items()
             self.repo_api = Config.HttpApi(config_data["repo_http_api"])
+            self.webhook = Config.Webhook(config_data.get("webhook", {}))
             self.repo_api_url = config_data["server"]["repo_api_url"]
+            self.watch = config_data["server"].get("watch", False)
+            self.index_workers = config_data["server"].get("index_workers", "auto")
 
         except KeyError as err:
             logger.error(f"Invalid configuration! Please check your configuration file. (Missing key: {err})")
@@ -77,6 +106,7 @@ class Config:
 
     def set_token(self, token_id: str):
         self.gh_token = config_data["github"]["tokens"][token_id]["token"]
+        self.gh_token_id = token_id
         logger.info(f"{LIGHT_BLUE}git{RESET}: Using the '{CYAN}{token_id}{RESET}' token as the main token")
         return self.gh_token
 
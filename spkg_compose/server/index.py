@@ -0,0 +1,449 @@
+from spkg_compose.cli.logger import logger
+from spkg_compose.utils.colors import *
+
+from dataclasses import dataclass
+
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import types
+import urllib.parse
+
+UPSERT_PACKAGE = "INSERT INTO packages (name, data) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET data = excluded.data"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ignored (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class IndexStore:
+    """Package index in SQLite, one row per package.
+
+    Updates only write the row of the package they change, in a transaction. index.json is still produced
+    by export() for the HTTP APIs. It's also the file people edit by hand: if it was changed or deleted since
+    the last export, the database is loaded from it again (and a deleted index starts empty). That also
+    imports existing JSON indexes on the first start.
+    """
+
+    def __init__(self, db_path: str, json_path: str):
+        self.json_path = json_path
+        self._lock = threading.RLock()
+        self._changed = False
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        self.sync()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+            self._db.execute("COMMIT")
+            self._changed = True
+
+    def get(self, name: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM packages WHERE name = ?", (name,)).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def names(self) -> list:
+        with self._lock:
+            return [name for name, in self._db.execute("SELECT name FROM packages ORDER BY id")]
+
+    def ignored(self) -> list:
+        with self._lock:
+            return [name for name, in self._db.execute("SELECT name FROM ignored ORDER BY id")]
+
+    def put(self, name: str, entry: dict):
+        self.put_many({name: entry})
+
+    def put_many(self, entries: dict):
+        with self.transaction() as db:
+            db.executemany(UPSERT_PACKAGE, [(name, json.dumps(entry)) for name, entry in entries.items()])
+
+    def update(self, name: str, change):
+        """Changes single fields of an entry in place: change(entry) is called in the transaction that writes
+        the entry back"""
+        with self.transaction() as db:
+            row = db.execute("SELECT data FROM packages WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+
+            entry = json.loads(row[0])
+            change(entry)
+            db.execute("UPDATE packages SET data = ? WHERE name = ?", (json.dumps(entry), name))
+
+    def to_dict(self) -> dict:
+        """Returns the whole index in the layout of index.json"""
+        with self._lock:
+            index = {"ignore_packages": self.ignored()}
+            rows = self._db.execute("SELECT name, data FROM packages ORDER BY id")
+            index.update((name, json.loads(data)) for name, data in rows)
+
+        return index
+
+    def load_dict(self, index: dict):
+        """Replaces the whole index with one in the layout of index.json"""
+        with self.transaction() as db:
+            db.execute("DELETE FROM packages")
+            db.execute("DELETE FROM ignored")
+            db.executemany(
+                "INSERT OR IGNORE INTO ignored (name) VALUES (?)",
+                [(name,) for name in index.get("ignore_packages", [])]
+            )
+            db.executemany(
+                UPSERT_PACKAGE,
+                [(name, json.dumps(entry)) for name, entry in index.items() if name != "ignore_packages"]
+            )
+
+    def export(self, force: bool = False):
+        """Writes index.json if the index changed since the last export. The file is replaced atomically,
+        so readers never see a partly written index"""
+        with self._lock:
+            if not self._changed and not force and os.path.exists(self.json_path):
+                return
+
+            tmp_file = f"{self.json_path}.tmp"
+
+            with open(tmp_file, "w") as json_file:
+                json.dump(self.to_dict(), json_file, indent=2)
+
+            os.replace(tmp_file, self.json_path)
+
+            self._set_meta("json_mtime_ns", str(os.stat(self.json_path).st_mtime_ns))
+            self._changed = False
+
+    def sync(self) -> bool:
+        """Loads index.json into the database if it was edited or deleted since the last export.
+        Returns whether it was loaded"""
+        with self._lock:
+            exported = self._get_meta("json_mtime_ns")
+
+            try:
+                mtime_ns = str(os.stat(self.json_path).st_mtime_ns)
+            except FileNotFoundError:
+                mtime_ns = None
+
+            if mtime_ns == exported:
+                return False
+
+            if mtime_ns is None:
+                # Deleting index.json is the way to index everything again
+                self.load_dict({"ignore_packages": []})
+            else:
+                with open(self.json_path, "r") as json_file:
+                    self.load_dict(json.load(json_file))
+
+            self.export(force=True)
+
+        return True
+
+    def _get_meta(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class IndexEntry:
+    """A package in the Index. Entries are never changed, a write replaces them. The layout in the database
+    and in index.json stays the same dict, see to_dict()"""
+    compose: str
+    specfile: str
+    binpkg_path: str
+    latest: str
+    # (architecture, up to date) pairs
+    architectures: tuple
+    source: str | None = None
+    checkfor: str = ""
+    # Keys this class doesn't know (e.g. added to index.json by hand), kept as they are
+    extra: tuple = ()
+
+    FIELDS = ("compose", "specfile", "source", "binpkg_path", "latest", "architectures", "checkfor")
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "IndexEntry":
+        return cls(
+            compose=entry.get("compose", ""),
+            specfile=entry.get("specfile", ""),
+            binpkg_path=entry.get("binpkg_path", ""),
+            latest=entry.get("latest", ""),
+            architectures=tuple(
+                (sys.intern(arch), up_to_date) for arch, up_to_date in entry.get("architectures", {}).items()
+            ),
+            source=entry.get("source"),
+            checkfor=sys.intern(entry.get("checkfor", "")),
+            extra=tuple((key, value) for key, value in entry.items() if key not in cls.FIELDS),
+        )
+
+    def to_dict(self) -> dict:
+        entry = {"compose": self.compose, "specfile": self.specfile}
+
+        if self.source is not None:
+            entry["source"] = self.source
+
+        entry.update(binpkg_path=self.binpkg_path, latest=self.latest, architectures=dict(self.architectures))
+
+        if self.checkfor:
+            entry["checkfor"] = self.checkfor
+
+        entry.update(copy.deepcopy(dict(self.extra)))
+        return entry
+
+
+class Index:
+    """The package index of the server, shared by all routines and GitHubApi objects.
+
+    Entries are kept in memory as IndexEntry and never changed, a write replaces the entry. snapshot() is a
+    read-only view of the index at one point in time: it's copied on the first call after a write and shared
+    until the next one. Writes to the same package are serialized by a lock per package. A background writer
+    stores the changed rows in the IndexStore and exports index.json once no write came in for `delay`
+    seconds (at the latest after `max_delay`), so a checkout writes the index a few times instead of once per
+    package.
+
+    Secondary indexes (architecture, stale architecture, source host, source repository and checkfor mode ->
+    package names) are updated with every write, so the work lists of the routines don't need a pass over all
+    entries.
+    """
+
+    def __init__(self, store: IndexStore, delay: float = 2.0, max_delay: float = 30.0):
+        self.store = store
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._package_locks = {}
+        self._flush_lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        self._dirty = set()
+        self._first_write = self._last_write = 0.0
+
+        self._load()
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def snapshot(self) -> types.MappingProxyType:
+        """Returns the current entries as a read-only mapping of package names to IndexEntry"""
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = types.MappingProxyType(dict(self._entries))
+
+            return self._snapshot
+
+    def get(self, name: str) -> dict | None:
+        """Returns the entry as a dict that can be modified and written back with put()"""
+        with self._lock:
+            entry = self._entries.get(name)
+
+        return entry.to_dict() if entry is not None else None
+
+    def names(self) -> list:
+        with self._lock:
+            return list(self._entries)
+
+    def ignored(self) -> frozenset:
+        return self._ignored
+
+    def by_arch(self, arch: str) -> set:
+        """Packages that are built for `arch`"""
+        return self._lookup("arch", arch)
+
+    def stale(self, arch: str | None = None) -> set:
+        """Packages whose last update failed for `arch`, or for any architecture"""
+        if arch is not None:
+            return self._lookup("stale", arch)
+
+        with self._lock:
+            return set().union(*self._secondary["stale"].values())
+
+    def stale_counts(self) -> dict:
+        """Number of packages whose last update failed, by architecture"""
+        with self._lock:
+            return {arch: len(names) for arch, names in self._secondary["stale"].items()}
+
+    def by_host(self, host: str | None) -> set:
+        """Packages whose source is hosted on `host` (e.g. github.com). None are the entries without a source"""
+        return self._lookup("host", host)
+
+    def by_repository(self, repository: str) -> set:
+        """Packages whose source is the repository "owner/repo" (on any host, case-insensitive)"""
+        return self._lookup("repository", repository.lower())
+
+    def by_checkfor(self, mode: str) -> set:
+        """Packages that are checked for new releases ("") or only for new commits ("commit")"""
+        return self._lookup("checkfor", mode)
+
+    def for_tags(self, tags, stale: bool = False) -> set:
+        """Packages a build server with these tags (architectures) can build. With stale, only the ones with a
+        failed build for one of them"""
+        with self._lock:
+            arch_index = self._secondary["stale" if stale else "arch"]
+            return set().union(*(arch_index.get(tag, ()) for tag in tags))
+
+    def lock(self, name: str) -> threading.RLock:
+        """Lock of a single package, for changes that read the entry first"""
+        with self._lock:
+            return self._package_locks.setdefault(name, threading.RLock())
+
+    def put(self, name: str, entry: dict):
+        self.put_many({name: entry})
+
+    def put_many(self, entries: dict):
+        if entries:
+            self._publish({name: IndexEntry.from_dict(entry) for name, entry in entries.items()})
+
+    def update(self, name: str, change):
+        """Changes single fields of an entry: change(entry) is called with a copy of the current entry"""
+        with self.lock(name):
+            entry = self.get(name)
+            if entry is None:
+                raise KeyError(name)
+
+            change(entry)
+            self._publish({name: IndexEntry.from_dict(entry)})
+
+    def flush(self):
+        """Writes pending changes to the database and index.json right away"""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                rows = {name: self._entries[name].to_dict() for name in dirty if name in self._entries}
+
+            try:
+                if rows:
+                    self.store.put_many(rows)
+
+                self.store.export()
+            except BaseException:
+                # Written again with the next flush
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+
+    def sync(self):
+        """Picks up manual edits (or the deletion) of index.json. Pending changes are written first, so only
+        changes made to the file by hand can be lost, the same as before"""
+        self.flush()
+
+        with self._flush_lock:
+            if self.store.sync():
+                self._load()
+
+    def _load(self):
+        index = self.store.to_dict()
+
+        with self._lock:
+            self._ignored = frozenset(index.pop("ignore_packages"))
+            self._entries = {name: IndexEntry.from_dict(entry) for name, entry in index.items()}
+            self._snapshot = None
+            self._dirty = set()
+            self._secondary = {"arch": {}, "stale": {}, "host": {}, "repository": {}, "checkfor": {}}
+
+            for name, entry in self._entries.items():
+                self._reindex(name, None, entry)
+
+    def _publish(self, entries: dict):
+        with self._lock:
+            for name, entry in entries.items():
+                self._reindex(name, self._entries.get(name), entry)
+
+            self._entries.update(entries)
+            self._snapshot = None
+
+            now = time.monotonic()
+            if not self._dirty:
+                self._first_write = now
+
+            self._last_write = now
+            self._dirty.update(entries)
+            self._pending.notify()
+
+    def _lookup(self, index: str, key) -> set:
+        with self._lock:
+            return set(self._secondary[index].get(key, ()))
+
+    def _reindex(self, name: str, old: IndexEntry | None, new: IndexEntry):
+        old_keys = _secondary_keys(old) if old is not None else set()
+        new_keys = _secondary_keys(new)
+
+        for index, key in old_keys - new_keys:
+            names = self._secondary[index][key]
+            names.discard(name)
+
+            if not names:
+                del self._secondary[index][key]
+
+        for index, key in new_keys - old_keys:
+            self._secondary[index].setdefault(key, set()).add(name)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._dirty:
+                    self._pending.wait()
+
+                # Debounce: wait until writes stop coming in, but not for longer than max_delay
+                while self._dirty:
+                    now = time.monotonic()
+                    deadline = min(self._last_write + self.delay, self._first_write + self.max_delay)
+
+                    if now >= deadline:
+                        break
+
+                    self._pending.wait(deadline - now)
+
+            try:
+                self.flush()
+            except (OSError, sqlite3.Error) as err:
+                logger.error(f"{MAGENTA}index{RESET}: Cannot write the index ({err})")
+                time.sleep(self.delay)
+
+
+def _secondary_keys(entry: IndexEntry) -> set:
+    keys = {("arch", arch) for arch, _ in entry.architectures}
+    keys |= {("stale", arch) for arch, up_to_date in entry.architectures if not up_to_date}
+    keys.add(("checkfor", entry.checkfor))
+
+    if entry.source:
+        source = urllib.parse.urlparse(entry.source)
+        keys.add(("host", source.hostname))
+        keys.add(("repository", source.path.strip("/").removesuffix(".git").lower()))
+    else:
+        keys.add(("host", None))
+
+    return keys
@@ -0,0 +1,79 @@
+from spkg_compose.core.parser import read
+from spkg_compose.package import SpkgBuild
+from spkg_compose.utils.path import extract_path
+
+from concurrent.futures import ProcessPoolExecutor
+
+import multiprocessing
+import yaml
+
+# libyaml is many times faster than the pure Python loader, if PyYAML was built with it
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Below this many compose files, starting worker processes takes longer than parsing
+PARALLEL_MIN_FILES = 200
+
+_known = frozenset()
+
+
+def index_entry(file_path: str, known=None) -> tuple[str | None, dict | None, str | None]:
+    """Parses a compose file and, for packages that aren't in `known` yet, its specfile.
+    Returns the package id, its new index entry (None if it's already known) and an error message"""
+    known = _known if known is None else known
+
+    try:
+        package = SpkgBuild(read(file_path))
+        name = package.meta.id
+    except (OSError, KeyError, ValueError) as err:
+        return None, None, f"Invalid compose file '{file_path}' ({err})"
+
+    if name in known:
+        return name, None, None
+
+    specfile_path = file_path.replace("/compose.spkg", "/specfile.yml")
+
+    try:
+        with open(specfile_path, "r") as _specfile:
+            specfile_data = yaml.load(_specfile, Loader=SafeLoader)
+
+        architectures = {arch: True for arch in specfile_data["binpkg"]}
+
+        binpkg_path = next(iter(specfile_data["binpkg"].items()))
+        if binpkg_path != "None":
+            binpkg_path = extract_path(binpkg_path[1]["url"])
+    except (OSError, yaml.YAMLError, KeyError, TypeError, IndexError, StopIteration) as err:
+        return name, None, f"Either your specfile syntax is invalid or there's no compose.spkg ({err})"
+
+    return name, {
+        "compose": file_path,
+        "specfile": specfile_path,
+        "source": package.meta.source,
+        "binpkg_path": binpkg_path,
+        "latest": "",
+        "architectures": architectures,
+    }, None
+
+
+def index_entries(file_paths: list, known: set, workers: int = 1):
+    """Yields index_entry for every file, in the order of file_paths. With more than one worker, and enough
+    files to be worth it, the files are parsed in a process pool"""
+    if workers <= 1 or len(file_paths) < PARALLEL_MIN_FILES:
+        for file_path in file_paths:
+            yield index_entry(file_path, known)
+        return
+
+    chunksize = max(1, min(64, len(file_paths) // (workers * 4)))
+
+    # The server has threads running (routines, webhooks, the index writer). A forked child would inherit their
+    # locks in whatever state they were, the workers are forked from a clean server process instead
+    context = multiprocessing.get_context("forkserver")
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(frozenset(known),)
+    ) as pool:
+        yield from pool.map(index_entry, file_paths, chunksize=chunksize)
+
+
+def _init_worker(known: frozenset):
+    global _known
+    _known = known
@@ -1,48 +1,90 @@
 from spkg_compose import init_dir
-from spkg_compose.server.config import config as _cfg
-from spkg_compose.server.api.github import gh_check_ratelimit, GitHubApi
-from spkg_compose.core.parser import read
+from spkg_compose.server.api.cache import ResponseCache
+from spkg_compose.server.api.github import gh_latest, gh_session, GitHubApi
+from spkg_compose.server.api.tokens import TokenPool
+from spkg_compose.server.indexer import PARALLEL_MIN_FILES, index_entries
+from spkg_compose.server.scanner import IncrementalScanner, Watcher
+from spkg_compose.server.schedule import PollSchedule
+from spkg_compose.core.cache import compose_cache
 from spkg_compose.utils.colors import *
 from spkg_compose.utils.fmt import calculate_percentage, parse_interval
 from spkg_compose.utils.time import unix_to_readable, current_time, convert_time
-from spkg_compose.utils.path import extract_path
 from spkg_compose.cli.logger import logger, RtLogger
-from spkg_compose.package import SpkgBuild
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from yaml.parser import ParserError
 
 import os
-import json
+import queue
+import threading
 import time
-import yaml
 
 
 class Running:
     def __init__(self):
         self.indexing = False
         self.gh_checkout = False
+        self.webhook = False
 
 
 rt = Running()
+# Notified whenever a routine finishes
+rt_changed = threading.Condition()
 
 
 class Routines:
     def __init__(self, server):
         self.server = server
-        self.config = _cfg
-        self.index = f"{init_dir}/data/index.json"
+        self.config = server.config
+        self.index = server.index
 
         self.processes = {
             "indexing": self.indexing,
             "checkout": self.checkout
         }
 
+        # One pool of keep-alive connections to the GitHub API for all requests of a checkout
+        self.http = gh_session(self.config.gh_concurrency)
+        self.tokens = TokenPool(self.config.gh_tokens, self.http, preferred=self.config.gh_token_id)
+        self.http_cache = ResponseCache(f"{init_dir}/data/etags.json", self.tokens)
+        # Package updates of the checkout and of webhooks change the same files, so they run one at a time
+        self.update_lock = threading.Lock()
+        self.webhook_queue = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+
+        self.schedule = PollSchedule(
+            f"{init_dir}/data/schedule.json",
+            parse_interval(self.config.gh_poll_min).total_seconds(),
+            parse_interval(self.config.gh_poll_max).total_seconds()
+        )
+        # A package is looked at in the checkout that is closest to its next check, not in the one after it
+        # because that checkout started a few seconds early
+        checkout_every = [
+            parse_interval(routine["every"]).total_seconds() for routine in self.config.routines
+            if routine["process"] == "checkout"
+        ]
+        self.poll_slack = min(checkout_every, default=0) / 2
+
+        self.scanner = IncrementalScanner(self.config.data_dir, f"{init_dir}/data/scan.json")
+        self.watcher = None
+
+        if self.config.watch:
+            if Watcher.available():
+                self.watcher = Watcher(self.config.data_dir)
+                logger.info(f"{MAGENTA}watcher{RESET}: Watching {CYAN}{self.config.data_dir}{RESET} for changes")
+            else:
+                logger.warning(
+                    f"{MAGENTA}watcher{RESET}: inotify_simple is not installed, indexing falls back to scanning"
+                )
+
     @staticmethod
-    def routine(conflicts: str = None):
+    def routine(conflicts: str | tuple = None):
         """-- Routine decorator
-            This decorator will wrap some functions that are required for a routine
+            This decorator will wrap some functions that are required for a routine. The routine waits until
+            the routines it conflicts with (one name or a tuple of names) are finished
         """
+        conflicts = (conflicts,) if isinstance(conflicts, str) else tuple(conflicts or ())
 
         def _get_rt(_conflicts):
             match _conflicts:
@@ -50,6 +92,8 @@ class Routines:
                     return rt.gh_checkout
                 case "indexing":
                     return rt.indexing
+                case "webhook":
+                    return rt.webhook
                 case _:
                     logger.warning(
                         f"Invalid {YELLOW}{BOLD}@conflict{CRESET} name for {MAGENTA}@routine{RESET} "
@@ -62,38 +106,41 @@ class Routines:
                     rt.gh_checkout = state
                 case "indexing":
                     rt.indexing = state
+                case "webhook":
+                    rt.webhook = state
                 case _:
                     logger.warning(f"Invalid function for {MAGENTA}@routine{RESET} (got '{MAGENTA}{_rt}{RESET}')")
 
         def decorator(func):
             def wrapper(self, *args, **kwargs):
-                _set_rt(func.__name__, True)
+                with rt_changed:
+                    running = [name for name in conflicts if _get_rt(name)]
 
-                if conflicts is not None:
-                    if _get_rt(conflicts):
+                    if running:
                         logger.routine(
-                            f"{MAGENTA}{func.__name__}{RESET}: Waiting for routine '{CYAN}{conflicts}{RESET}' to finish"
+                            f"{MAGENTA}{func.__name__}{RESET}: Waiting for routine '{CYAN}{running[0]}{RESET}' "
+                            f"to finish"
                         )
 
-                while True:
-                    if conflicts is not None:
-                        if _get_rt(conflicts):
-                            time.sleep(1)
-                            continue
-
-                    rt_logger = RtLogger(rt_name=func.__name__)
-
-                    function = func(self, rt_logger, *args, **kwargs)
+                    # Checked and set at once, so two routines that conflict with each other can't both start (or
+                    # both wait for the other one)
+                    rt_changed.wait_for(lambda: not any(_get_rt(name) for name in conflicts))
+                    _set_rt(func.__name__, True)
 
-                    _set_rt(func.__name__, False)
+                rt_logger = RtLogger(rt_name=func.__name__)
 
-                    return function
+                try:
+                    return func(self, rt_logger, *args, **kwargs)
+                finally:
+                    with rt_changed:
+                        _set_rt(func.__name__, False)
+                        rt_changed.notify_all()
 
             return wrapper
 
         return decorator
 
-    @routine(conflicts="checkout")
+    @routine(conflicts=("checkout", "webhook"))
     def indexing(self, rt_logger: RtLogger):
         """-- Routine for indexing
             This routine checks for new *.spkg files. If there are any new files, this routine will
@@ -103,53 +150,62 @@ class Routines:
 
         rt_logger.info("Starting indexing")
 
-        # Check if index path already exists and load index, if not, create new index
-        if os.path.exists(self.server.index):
-            with open(self.server.index, "r") as json_file:
-                index = json.load(json_file)
-        else:
-            index = {"ignore_packages": []}
-
-        # Iterate data dir for *.spkg files
-        for root, _, files in os.walk(self.server.config.data_dir):
-            for file in files:
-                if file.endswith(".spkg"):
-                    file_path = os.path.join(root, file)
-
-                    data = read(file_path)
-                    package = SpkgBuild(data)
-                    name = package.meta.id
-
-                    # If cached data is not in index, add data to index.json
-                    if name not in index and name not in index["ignore_packages"]:
-                        i += 1
-                        rt_logger.info(f"Found new compose package '{CYAN}{name}{CRESET}'")
-                        specfile_path = file_path.replace("/compose.spkg", "/specfile.yml")
-
-                        with open(specfile_path, "r") as _specfile:
-                            try:
-                                specfile_data = yaml.load(_specfile, Loader=yaml.SafeLoader)
-                            except ParserError:
-                                rt_logger.error("Either your specfile syntax is invalid or there's no compose.spkg")
-
-                        architectures = {}
-                        for arch, url in specfile_data["binpkg"].items():
-                            architectures.update({arch: True})
-
-                        binpkg_path = next(iter(specfile_data["binpkg"].items()))
-                        if binpkg_path != "None":
-                            binpkg_path = extract_path(binpkg_path[1]["url"])
-
-                        index[name] = {
-                            "compose": file_path,
-                            "specfile": specfile_path,
-                            "binpkg_path": binpkg_path,
-                            "latest": "",
-                            "architectures": architectures,
-                        }
-
-        with open(self.server.index, 'w') as json_file:
-            json.dump(index, json_file, indent=2)
+        # Picks up manual edits of index.json
+        self.index.sync()
+
+        # Only compose files that are new or changed since the last run can add packages to the index, and the
+        # ones that aren't in it: invalid ones, ones whose entry was removed from index.json by hand, all of them
+        # after index.json was deleted
+        indexed = {os.path.abspath(entry.compose) for entry in self.index.snapshot().values()}
+        unindexed = [file_path for file_path in self.scanner.files() if file_path not in indexed]
+
+        changed, removed = self.scanner.scan(
+            self.watcher.drain() if self.watcher is not None else None, recheck=unindexed
+        )
+
+        for file_path in removed:
+            rt_logger.info(f"Compose file '{CYAN}{file_path}{CRESET}' was removed")
+
+        known = set(self.index.names()) | self.index.ignored()
+        new_packages = {}
+        workers = (os.cpu_count() or 1) if self.config.index_workers == "auto" else int(self.config.index_workers)
+
+        if len(changed) >= PARALLEL_MIN_FILES and workers > 1:
+            rt_logger.info(f"Indexing {CYAN}{len(changed)}{RESET} compose files with {CYAN}{workers}{RESET} workers")
+
+        start_time = time.time()
+        last_report = start_time
+
+        # Results come in the order of the file paths, so the index doesn't depend on the number of workers
+        for done, (name, entry, error) in enumerate(index_entries(changed, known, workers), start=1):
+            if error is not None:
+                rt_logger.error(error)
+
+            # If cached data is not in index, add data to index.json
+            elif entry is not None and name not in known and name not in new_packages:
+                i += 1
+                rt_logger.info(f"Found new compose package '{CYAN}{name}{CRESET}'")
+                new_packages[name] = entry
+
+            if time.time() - last_report >= 5:
+                last_report = time.time()
+                rt_logger.info(
+                    f"Indexed {calculate_percentage(len(changed), done)} ({done}/{len(changed)}) of the compose "
+                    f"files, {done / (last_report - start_time):.0f} files/s"
+                )
+
+        if changed:
+            elapsed_time = max(time.time() - start_time, 1e-6)
+            rt_logger.info(
+                f"Parsed {CYAN}{len(changed)}{RESET} compose files in {convert_time(elapsed_time)} "
+                f"({len(changed) / elapsed_time:.0f} files/s)"
+            )
+
+        self.index.put_many(new_packages)
+        self.index.flush()
+
+        self.scanner.save()
+        compose_cache.prune(self.scanner.files())
 
         if i == 0:
             rt_logger.info(f"Nothing to do, everything up to date.")
@@ -164,44 +220,194 @@ class Routines:
         """
         rt_logger.info(f"Starting checkout")
 
-        limit, remaining, reset = gh_check_ratelimit(self.server.config.gh_token)
+        # The rate limits are known from the responses of the last run. If every token runs out, the requests
+        # wait for the earliest reset
+        self.log_rate_limits(rt_logger)
 
+        self.http_cache.reset_stats()
+        self.tokens.reset_stats()
+
+        # Next checks are timed from the start of the checkout, like the next run of the routine
+        self.fetch_git(rt_logger, time.time())
+        self.index.flush()
+        self.http_cache.save()
+        self.schedule.save()
+
+        stats = self.http_cache.stats()
         rt_logger.info(
-            f"{calculate_percentage(limit, remaining)} of {GREEN}{limit}{RESET} requests available "
-            f"(Will reset on {unix_to_readable(reset)})"
+            f"GitHub API: {CYAN}{stats['hits']}{RESET} of {CYAN}{stats['requests']}{RESET} requests not modified "
+            f"({stats['ratio']:.0%}), saved {GREEN}{stats['hits']}{RESET} requests of the rate limit"
         )
 
-        if remaining == 0:
-            rt_logger.error(f"API rate limit exceeded. Canceling routine")
-            rt_logger.error(f"The API rate limit will be reset on {unix_to_readable(reset)}")
-            return 1
+        self.log_rate_limits(rt_logger)
 
-        self.fetch_git(rt_logger)
+        stats = compose_cache.stats()
+        rt_logger.info(
+            f"Compose cache: {GREEN}{stats['hits']}{RESET} hits, {YELLOW}{stats['misses']}{RESET} misses, "
+            f"{CYAN}{stats['entries']}{RESET} files"
+        )
         rt_logger.ok(f"Finished checkout")
 
-    def fetch_git(self, rt_logger: RtLogger):
-        with open(self.server.index, "r") as json_file:
-            index = json.load(json_file)
-
-        for root, _, files in os.walk(self.config.data_dir):
-            for file in files:
-                if file.endswith('.spkg'):
-                    file_path = os.path.join(root, file)
-
-                    data = read(file_path)
-                    package = SpkgBuild(data)
-                    repo_url = package.meta.source
-
-                    if repo_url.startswith("https://github.com") and package.meta.id not in index["ignore_packages"]:
-                        git = GitHubApi(
-                            repo_url=repo_url,
-                            api_token=self.config.gh_token,
-                            server=self,
-                            package=package,
-                            file_path=file_path,
-                            rt_logger=rt_logger
-                        )
-                        git.fetch()
+    def log_rate_limits(self, rt_logger: RtLogger):
+        for name, resources in self.tokens.metrics().items():
+            for resource, quota in sorted(resources.items()):
+                available = calculate_percentage(quota["limit"], quota["remaining"])
+                reset = f", will reset on {unix_to_readable(quota['reset'])}" if quota["reset"] else ""
+
+                rt_logger.info(
+                    f"Token '{CYAN}{name}{RESET}' ({resource}): {available} of {GREEN}{quota['limit']}{RESET} "
+                    f"requests available, {CYAN}{quota['requests']}{RESET} used in this run{reset}"
+                )
+
+    def fetch_git(self, rt_logger: RtLogger, start_time: float):
+        self.index.sync()
+        self.fill_sources(rt_logger)
+
+        for arch, count in sorted(self.index.stale_counts().items()):
+            rt_logger.info(f"{CYAN}{count}{RESET} packages will be rebuilt for arch '{GREEN}{arch}{RESET}'")
+
+        snapshot = self.index.snapshot()
+        packages = self.index.by_host("github.com") - self.index.ignored()
+        repositories = []
+
+        # Repositories that rarely change are looked at less often. Packages with a failed build are retried
+        # every time, if an enabled build server can build one of the architectures that failed
+        tags = {
+            tag for server in self.config.raw["build_server"].values() if server["enabled"] for tag in server["tags"]
+        }
+        retry = self.index.for_tags(tags, stale=True) & packages
+        due = self.schedule.due(packages, start_time, self.poll_slack) | retry
+        rt_logger.info(f"{CYAN}{len(due)}{RESET} of {CYAN}{len(packages)}{RESET} packages are due for a check")
+
+        for name in sorted(due, key=lambda _name: snapshot[_name].compose):
+            file_path = snapshot[name].compose
+
+            try:
+                package = compose_cache.load(file_path)
+            except (OSError, KeyError) as err:
+                rt_logger.warning(f"Cannot read compose file of '{CYAN}{name}{CRESET}' ({err})")
+                continue
+
+            if package.meta.source != snapshot[name].source:
+                self.index.update(name, lambda entry: entry.update({"source": package.meta.source}))
+
+                if not package.meta.source.startswith("https://github.com"):
+                    continue
+
+            repositories.append(GitHubApi(
+                repo_url=package.meta.source,
+                api_token=self.config.gh_token,
+                server=self,
+                package=package,
+                file_path=file_path,
+                rt_logger=rt_logger
+            ))
+
+        with ThreadPoolExecutor(max_workers=self.config.gh_concurrency) as pool:
+            # One GraphQL query for many repositories instead of one or two REST requests per package. Updates
+            # change compose files, specfiles and the index and start builds, so they run one after another, in
+            # the same order as before, as soon as the lookup of a package is done
+            for git, result in gh_latest(
+                repositories, self.config.gh_token, self.config.gh_batch_size, self.tokens, pool, rt_logger,
+                self.index.by_checkfor("commit")
+            ):
+                if result is not None:
+                    with self.update_lock:
+                        # A webhook may have updated the package since the lookup started
+                        git.entry = self.index.get(git.package.meta.id)
+                        version = git.process_latest(*result)
+                        self.schedule.observe(git.package.meta.id, version, start_time)
+
+    def on_webhook(self, repository: str):
+        """Queues an update of the packages built from a GitHub repository ("owner/repo") that changed"""
+        names = (self.index.by_repository(repository) & self.index.by_host("github.com")) - self.index.ignored()
+
+        if not names:
+            logger.info(f"{MAGENTA}webhook{RESET}: No package is built from {CYAN}{repository}{RESET}")
+            return
+
+        for name in sorted(names):
+            with self._queued_lock:
+                # Several events for the same package before it's updated only need one update
+                if name in self._queued:
+                    continue
+                self._queued.add(name)
+
+            logger.info(f"{MAGENTA}webhook{RESET}: {CYAN}{repository}{RESET} changed, queued '{CYAN}{name}{RESET}'")
+            self.webhook_queue.put(name)
+
+    def run_webhook_updates(self):
+        """Runs the webhook routine for the packages queued by webhooks, with everything that was queued while the
+        last run was going on (or waiting for indexing) in one run"""
+        while True:
+            names = [self.webhook_queue.get()]
+
+            while True:
+                try:
+                    names.append(self.webhook_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.webhook(names)
+
+    @routine(conflicts="indexing")
+    def webhook(self, rt_logger: RtLogger, names: list):
+        """-- Routine for webhook updates
+            This routine updates the packages whose repositories changed according to a webhook, one after
+            another. Updates change compose files, so it doesn't run at the same time as indexing
+        """
+        for name in names:
+            with self._queued_lock:
+                self._queued.discard(name)
+
+            try:
+                self.update_package(name, rt_logger)
+            except Exception as err:
+                rt_logger.error(f"Update of '{CYAN}{name}{CRESET}' failed ({err})")
+
+        self.index.flush()
+
+    def update_package(self, name: str, rt_logger: RtLogger):
+        """Looks at the repository of a single package and updates it, the same way checkout does"""
+        entry = self.index.snapshot().get(name)
+
+        if entry is None:
+            return
+
+        package = compose_cache.load(entry.compose)
+
+        with self.update_lock:
+            git = GitHubApi(
+                repo_url=package.meta.source,
+                api_token=self.config.gh_token,
+                server=self,
+                package=package,
+                file_path=entry.compose,
+                rt_logger=rt_logger
+            )
+            result = git.lookup()
+
+            if result is None:
+                return
+
+            version = git.process_latest(*result)
+
+            # Nothing new can also mean that the API doesn't show the change yet, polling still finds it then
+            if version is not None and version != entry.latest:
+                self.schedule.observe(name, version, time.time())
+
+    def fill_sources(self, rt_logger: RtLogger):
+        """Adds the source to entries that were indexed before it was part of the index"""
+        snapshot = self.index.snapshot()
+
+        for name in self.index.by_host(None):
+            try:
+                source = compose_cache.load(snapshot[name].compose).meta.source
+            except (OSError, KeyError) as err:
+                rt_logger.warning(f"Cannot read compose file of '{CYAN}{name}{CRESET}' ({err})")
+                continue
+
+            self.index.update(name, lambda entry: entry.update({"source": source}))
 
     def run_routine(self, routine):
         """Executes a routine and checks when the routine should next be executed"""
@@ -0,0 +1,239 @@
+from spkg_compose.cli.logger import logger
+from spkg_compose.utils.colors import *
+
+import json
+import os
+import threading
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+COMPOSE_SUFFIX = ".spkg"
+
+
+class IncrementalScanner:
+    """Finds new, changed and removed compose files below a directory without a full walk every time.
+
+    A snapshot of every directory (mtime, subdirectories and the stat of its compose files) is kept on disk.
+    A directory is only listed again when its mtime changed, otherwise only its known compose files are
+    stat'ed. With a Watcher, only the directories it reported are looked at.
+
+    A scan only becomes the new snapshot with save(), so files from a run that failed are reported again.
+    """
+
+    def __init__(self, root: str, snapshot_file: str):
+        self.root = os.path.abspath(root)
+        self.snapshot_file = snapshot_file
+        self.dirs = {}
+        self._pending = None
+
+        # Directories reported by the Watcher that aren't part of a saved scan yet
+        self._dirty = set()
+
+        try:
+            with open(snapshot_file, "r") as _snapshot:
+                snapshot = json.load(_snapshot)
+
+            if snapshot.get("root") == self.root:
+                self.dirs = snapshot["dirs"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    def files(self) -> list:
+        """Returns all compose files known from the last scan"""
+        return sorted(
+            os.path.join(path, name)
+            for path, entry in self.dirs.items()
+            for name in entry["files"]
+        )
+
+    def scan(self, dirty: set | None = None, recheck=()) -> tuple[list, list]:
+        """Returns the compose files that are new or changed and the ones that were removed since the last scan.
+
+        `dirty` is the set of directories a Watcher reported. None checks every known directory. Known compose
+        files in `recheck` are reported as changed even if they weren't (e.g. ones that couldn't be indexed)."""
+        changed, removed = [], []
+        self._pending = dict(self.dirs)
+
+        if dirty is not None:
+            self._dirty |= dirty
+            dirty = self._dirty
+
+        if dirty is None or not self.dirs:
+            self._scan_dir(self.root, True, changed, removed)
+        else:
+            # Parents first, so a removed directory is dropped before its children would be looked at
+            for path in sorted(dirty):
+                if path == self.root or path.startswith(self.root + os.sep):
+                    self._scan_dir(path, False, changed, removed)
+
+        reported = set(changed)
+
+        for file_path in recheck:
+            path, name = os.path.split(file_path)
+
+            if file_path not in reported and name in self._pending.get(path, {}).get("files", ()):
+                changed.append(file_path)
+
+        return sorted(changed), sorted(removed)
+
+    def save(self):
+        if self._pending is not None:
+            self.dirs, self._pending = self._pending, None
+            self._dirty = set()
+
+        tmp_file = f"{self.snapshot_file}.tmp"
+
+        with open(tmp_file, "w") as _snapshot:
+            json.dump({"root": self.root, "dirs": self.dirs}, _snapshot)
+
+        os.replace(tmp_file, self.snapshot_file)
+
+    def _scan_dir(self, path: str, recursive: bool, changed: list, removed: list):
+        entry = self._pending.get(path)
+
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            self._drop(path, removed)
+            return
+
+        if entry is None or entry["mtime_ns"] != mtime_ns or not recursive:
+            dirs, files = _list_dir(path)
+        else:
+            # Nothing was added or removed here, but compose files can still be modified in place
+            dirs, files = entry["dirs"], {}
+
+            for name in entry["files"]:
+                try:
+                    files[name] = _identity(os.stat(os.path.join(path, name)))
+                except FileNotFoundError:
+                    continue
+
+        old_files = entry["files"] if entry is not None else {}
+        old_dirs = entry["dirs"] if entry is not None else []
+
+        for name, identity in files.items():
+            if old_files.get(name) != identity:
+                changed.append(os.path.join(path, name))
+
+        for name in old_files.keys() - files.keys():
+            removed.append(os.path.join(path, name))
+
+        for name in set(old_dirs) - set(dirs):
+            self._drop(os.path.join(path, name), removed)
+
+        self._pending[path] = {"mtime_ns": mtime_ns, "dirs": dirs, "files": files}
+
+        for name in dirs:
+            child = os.path.join(path, name)
+
+            # Without recursion, only new subdirectories have to be scanned
+            if recursive or child not in self._pending:
+                self._scan_dir(child, True, changed, removed)
+
+    def _drop(self, path: str, removed: list):
+        """Removes a directory and everything below it from the snapshot"""
+        for child in [child for child in self._pending if child == path or child.startswith(path + os.sep)]:
+            removed.extend(os.path.join(child, name) for name in self._pending.pop(child)["files"])
+
+
+class Watcher:
+    """Collects the directories below root that changed, from inotify events. Needs inotify_simple"""
+
+    def __init__(self, root: str):
+        flags = inotify_simple.flags
+
+        self.root = os.path.abspath(root)
+        self.mask = (flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE |
+                     flags.ATTRIB | flags.DELETE_SELF | flags.MOVE_SELF)
+
+        self._inotify = inotify_simple.INotify()
+        self._watches = {}
+        self._dirty = set()
+        self._overflow = False
+        self._incomplete = False
+        self._lock = threading.Lock()
+
+        self._add_tree(self.root)
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def available() -> bool:
+        return inotify_simple is not None
+
+    def drain(self) -> set | None:
+        """Returns the directories that changed since the last call, or None if events were lost and
+        everything has to be checked"""
+        with self._lock:
+            dirty, overflow = self._dirty, self._overflow or self._incomplete
+            self._dirty, self._overflow = set(), False
+
+        return None if overflow else dirty
+
+    def _add_tree(self, path: str):
+        for dirpath, _, _ in os.walk(path):
+            try:
+                self._watches[self._inotify.add_watch(dirpath, self.mask)] = dirpath
+            except OSError as err:
+                # e.g. fs.inotify.max_user_watches reached, changes there would go unnoticed, so always scan
+                logger.warning(f"{MAGENTA}watcher{RESET}: Cannot watch '{CYAN}{dirpath}{RESET}' ({err})")
+                with self._lock:
+                    self._incomplete = True
+
+    def _run(self):
+        flags = inotify_simple.flags
+
+        while True:
+            for event in self._inotify.read():
+                if event.mask & flags.Q_OVERFLOW:
+                    with self._lock:
+                        self._overflow = True
+                    continue
+
+                path = self._watches.get(event.wd)
+
+                if path is None:
+                    continue
+
+                if event.mask & flags.IGNORED:
+                    del self._watches[event.wd]
+                    continue
+
+                # The path of a moved directory is outdated. It's watched again under its new path (MOVED_TO in
+                # the new parent), but where it was has to be found out with a full scan
+                if event.mask & flags.MOVE_SELF:
+                    self._inotify.rm_watch(event.wd)
+                    with self._lock:
+                        self._overflow = True
+                    continue
+
+                with self._lock:
+                    self._dirty.add(path)
+
+                # New directories are watched too. Anything written before the watch exists is found by the
+                # scan of the directory, which is unknown to the scanner at that point
+                if event.mask & flags.ISDIR and event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._add_tree(os.path.join(path, event.name))
+
+
+def _list_dir(path: str) -> tuple[list, dict]:
+    dirs, files = [], {}
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif entry.name.endswith(COMPOSE_SUFFIX) and entry.is_file():
+                files[entry.name] = _identity(entry.stat())
+
+    return sorted(dirs), files
+
+
+def _identity(stat: os.stat_result) -> list:
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,93 @@
+import heapq
+import json
+import os
+import threading
+
+
+class PollSchedule:
+    """When the repository of every package is looked at next.
+
+    A package whose latest release or commit didn't change since the last look waits `factor` times as long
+    as before, up to max_interval. A change brings it back to min_interval. Next check times are kept in a
+    heap, so finding the due packages doesn't look at the others. The state is kept in a file between runs.
+    """
+
+    def __init__(self, state_file: str, min_interval: float, max_interval: float, factor: float = 2.0):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.factor = factor
+
+        self._packages = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+        try:
+            with open(state_file, "r") as _state:
+                self._packages = json.load(_state)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        for name, state in self._packages.items():
+            # Changed bounds apply to the packages that are already known, too
+            state["interval"] = min(max(state["interval"], self.min_interval), self.max_interval)
+            state["next"] = min(state["next"], state["last"] + state["interval"])
+            self._heap.append((state["next"], name))
+
+        heapq.heapify(self._heap)
+
+    def due(self, names, now: float, slack: float = 0.0) -> set:
+        """Returns the packages in `names` that are due at `now`, or within `slack` seconds after it. Packages
+        that weren't looked at yet are always due"""
+        names = set(names)
+
+        with self._lock:
+            due = {name for name in names if name not in self._packages}
+
+            while self._heap and self._heap[0][0] <= now + slack:
+                next_check, name = heapq.heappop(self._heap)
+                state = self._packages.get(name)
+
+                # Outdated heap entries of packages that were rescheduled or forgotten are skipped
+                if state is None or state["next"] != next_check:
+                    continue
+
+                if name in names:
+                    due.add(name)
+                else:
+                    # Not part of the index (anymore)
+                    del self._packages[name]
+
+            # Stay in the heap until they're looked at with observe()
+            for name in due:
+                if name in self._packages:
+                    heapq.heappush(self._heap, (self._packages[name]["next"], name))
+
+        return due
+
+    def observe(self, name: str, latest, now: float):
+        """Schedules the next check of a package after a look at its repository found `latest`"""
+        with self._lock:
+            state = self._packages.get(name)
+
+            if state is None or state["latest"] != latest:
+                interval = self.min_interval
+            else:
+                interval = min(state["interval"] * self.factor, self.max_interval)
+
+            self._packages[name] = {"latest": latest, "interval": interval, "last": now, "next": now + interval}
+            heapq.heappush(self._heap, (now + interval, name))
+
+    def next_check(self) -> float | None:
+        """Returns the time of the earliest check, if any package is known"""
+        with self._lock:
+            return min((state["next"] for state in self._packages.values()), default=None)
+
+    def save(self):
+        tmp_file = f"{self.state_file}.tmp"
+
+        with self._lock:
+            with open(tmp_file, "w") as _state:
+                json.dump(self._packages, _state)
+
+        os.replace(tmp_file, self.state_file)
@@ -0,0 +1,138 @@
+from spkg_compose.cli.logger import logger
+from spkg_compose.utils.colors import *
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import hashlib
+import hmac
+import json
+import threading
+import urllib.parse
+
+# Release actions that can make a new version available
+RELEASE_ACTIONS = ("published", "released", "prereleased", "created")
+
+# The secret of the default config, which doesn't keep anyone out
+PLACEHOLDER_SECRET = "insert_secret_here"
+
+# GitHub doesn't send larger payloads
+MAX_PAYLOAD_SIZE = 25 * 1024 * 1024
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Checks the X-Hub-Signature-256 header (HMAC-SHA256 of the body with the webhook secret)"""
+    if not signature or not signature.startswith("sha256="):
+        return False
+
+    expected = hmac.new(secret.encode("utf8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def parse_payload(content_type: str | None, body: bytes):
+    """Returns the payload of a webhook with the content type application/json or application/x-www-form-urlencoded
+    (the JSON in a "payload" field). Raises ValueError if it can't be read"""
+    if (content_type or "").split(";")[0].strip().lower() == "application/x-www-form-urlencoded":
+        fields = urllib.parse.parse_qs(body.decode("utf8"), strict_parsing=True)
+
+        if "payload" not in fields:
+            raise ValueError("No payload field")
+
+        return json.loads(fields["payload"][0])
+
+    return json.loads(body)
+
+
+def changed_repository(event: str, payload: dict) -> str | None:
+    """Returns the "owner/repo" of a push to the default branch or of a new release, None for anything else"""
+    repository = payload.get("repository") or {}
+
+    match event:
+        case "push":
+            if payload.get("ref") != f"refs/heads/{repository.get('default_branch')}":
+                return None
+        case "release":
+            if payload.get("action") not in RELEASE_ACTIONS:
+                return None
+        case _:
+            return None
+
+    return repository.get("full_name")
+
+
+class WebhookServer:
+    """Receives GitHub webhooks (push and release, as JSON or form-encoded) and calls on_change with the repository
+    ("owner/repo") that changed. Requests without a valid signature are rejected"""
+
+    def __init__(self, address: str, port: int, secret: str, on_change):
+        self.secret = secret
+        self.on_change = on_change
+
+        self.httpd = ThreadingHTTPServer((address, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+
+                if not 0 <= length <= MAX_PAYLOAD_SIZE:
+                    return self.respond(400, "Invalid Content-Length")
+
+                body = self.rfile.read(length)
+
+                if not verify_signature(webhook.secret, body, self.headers.get("X-Hub-Signature-256")):
+                    logger.warning(
+                        f"{MAGENTA}webhook{RESET}: Rejected a request with an invalid signature from "
+                        f"{CYAN}{self.client_address[0]}{RESET}"
+                    )
+                    return self.respond(401, "Invalid signature")
+
+                event = self.headers.get("X-GitHub-Event", "")
+
+                if event == "ping":
+                    return self.respond(200, "pong")
+
+                try:
+                    payload = parse_payload(self.headers.get("Content-Type"), body)
+                except ValueError:
+                    return self.respond(400, "Invalid payload")
+
+                repository = changed_repository(event, payload) if isinstance(payload, dict) else None
+
+                if repository is None:
+                    return self.respond(200, "Ignored")
+
+                webhook.on_change(repository)
+                return self.respond(202, "Accepted")
+
+            def respond(self, status: int, message: str):
+                body = message.encode("utf8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,189 @@
+from spkg_compose.package import binpkg as binpkg_format
+from spkg_compose.package import deb as deb_format
+from spkg_compose.server.api import github
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """A directory `spkg-compose build` runs in, with the output of a build in _work/build/out. Returns a function
+    that makes the compose data of a package built from it"""
+    monkeypatch.setattr(binpkg_format, "execution_dir", str(tmp_path))
+    monkeypatch.setattr(deb_format, "execution_dir", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    out = tmp_path / "_work" / "build" / "out"
+    (out / "bin").mkdir(parents=True)
+    (out / "share" / "doc").mkdir(parents=True)
+    (out / "bin" / "tool").write_bytes(random.Random(0).randbytes(300 * 1024))
+    (out / "bin" / "tool").chmod(0o755)
+    (out / "share" / "doc" / "README").write_text("tool\n" * 1000)
+
+    def compose_data(version: str = "1.0", formats: str = "binpkg", **options) -> dict:
+        install = {"Prefix": "/usr", "Target": "out/*", "Threads": "1", **options}
+
+        return {
+            "Meta": {
+                "Name": "tool", "Id": "tool", "Description": "A tool", "Version": version,
+                "Architecture": "x86_64", "Author": "Tester <tester@example.org>", "Source": "https://example.org"
+            },
+            "Prepare": {"Type": "Archive", "URL": "https://example.org/tool.tar.gz"},
+            "Build": {"BuildSys": "none", "Workdir": "build"},
+            "Install": {"As": formats},
+            "Install.binpkg": install,
+            "Install.deb": install,
+        }
+
+    compose_data.path = tmp_path
+    return compose_data
+
+
+class FakeGitHub:
+    """A local GitHub API for the repositories {"owner/repo": (latest tag or None, sha of the default branch)}:
+    the GraphQL endpoint for repository(owner, name) with aliases, and the REST endpoints for the releases and
+    commits of a repository.
+
+    Like GitHub, REST responses have an ETag that depends on the content and the Authorization header, a
+    matching If-None-Match is answered with 304, and only full responses count against the rate limit of the
+    token. Every request takes `latency` seconds. The benchmarks use it as well (see benchmarks/lookups.py)"""
+
+    ALIAS = re.compile(r'(r\d+): repository\(owner: ("[^"]*"), name: ("[^"]*")\) \{ (releases)?')
+
+    def __init__(self, repositories: dict, latency: float = 0.0):
+        self.repositories = repositories
+        self.latency = latency
+        self.graphql_status = 200
+
+        self.queries = []
+        self.rest_requests = []
+        self.connections = set()
+        self.remaining = {}
+        self.full_responses = 0
+        self.not_modified = 0
+        self.not_modified_for = {}
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "FakeGitHub":
+        # Polled for shutdown more often than by default, so closing it doesn't hold up every test for 0.5 s
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like api.github.com
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_POST(self):
+                fake.connections.add(self.client_address)
+                query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["query"]
+                fake.queries.append(query)
+                time.sleep(fake.latency)
+
+                if fake.graphql_status != 200:
+                    return self.respond(fake.graphql_status, {"message": "Server Error"})
+
+                data, errors = {}, []
+
+                for alias, owner, name, releases in fake.ALIAS.findall(query):
+                    repo = f"{json.loads(owner)}/{json.loads(name)}"
+
+                    if repo not in fake.repositories:
+                        # A missing repository doesn't fail the whole query
+                        data[alias] = None
+                        errors.append({
+                            "type": "NOT_FOUND", "path": [alias],
+                            "message": f"Could not resolve to a Repository with the name '{repo}'."
+                        })
+                        continue
+
+                    tag, sha = fake.repositories[repo]
+                    data[alias] = {"defaultBranchRef": {"target": {"oid": sha}}}
+
+                    if releases:
+                        data[alias]["releases"] = {"nodes": [{"tagName": tag}] if tag else []}
+
+                self.respond(200, {"data": data, "errors": errors} if errors else {"data": data})
+
+            def do_GET(self):
+                fake.connections.add(self.client_address)
+                fake.rest_requests.append(self.path)
+                time.sleep(fake.latency)
+
+                owner, name, endpoint = self.path.split("?")[0].split("/")[2:5]
+
+                if f"{owner}/{name}" not in fake.repositories:
+                    return self.respond(404, {"message": "Not Found"})
+
+                tag, sha = fake.repositories[f"{owner}/{name}"]
+
+                if endpoint == "releases":
+                    payload = [{"tag_name": tag}] if tag else []
+                else:
+                    payload = [{"sha": sha}]
+
+                authorization = self.headers.get("Authorization", "")
+                etag = f'"{hashlib.sha256(f"{json.dumps(payload)}:{authorization}".encode()).hexdigest()}"'
+                remaining = fake.remaining.setdefault(authorization, 5000)
+
+                if self.headers.get("If-None-Match") == etag:
+                    fake.not_modified += 1
+                    fake.not_modified_for[authorization] = fake.not_modified_for.get(authorization, 0) + 1
+                    return self.respond(304, None, etag, remaining)
+
+                fake.full_responses += 1
+                fake.remaining[authorization] = remaining - 1
+                self.respond(200, payload, etag, remaining - 1)
+
+            def respond(self, status: int, payload, etag: str | None = None, remaining: int | None = None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                    self.send_header("Vary", "Accept, Authorization")
+                    self.send_header("X-RateLimit-Limit", "5000")
+                    self.send_header("X-RateLimit-Remaining", str(remaining))
+
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    """A FakeGitHub with the repositories owner/repo0 to owner/repo119, their tag is v<i> except for every third
+    one, which has no releases. The API URLs of spkg_compose.server.api.github point to it"""
+    server = FakeGitHub({f"owner/repo{i}": (f"v{i}" if i % 3 else None, f"sha{i}") for i in range(120)}).start()
+
+    monkeypatch.setattr(github, "API_URL", server.url)
+    monkeypatch.setattr(github, "GRAPHQL_URL", f"{server.url}/graphql")
+
+    yield server
+
+    server.close()
@@ -0,0 +1,100 @@
+from binpkg import BinPkg
+from binpkg.header import read_header
+from binpkg.metadata import Metadata
+from spkg_compose.package.binpkg import SpkgBinPkgFormat
+from spkg_compose.package.cache import ArtifactCache, tree_manifest
+
+import os
+
+import pytest
+
+OPTIONS = {"compression": "gzip", "index": False, "reproducible": False}
+
+
+def meta(version: str = "1.0", **fields) -> dict:
+    return {**Metadata("tool", "tool", version, "test", "x86_64", "test").serialize(), **fields}
+
+
+def payload(path) -> bytes:
+    """Everything after the header, i.e. the compressed payload and the table of contents"""
+    with open(path, "rb") as f:
+        read_header(f)
+        return f.read()
+
+
+def test_key_ignores_version():
+    key = ArtifactCache.key("manifest", meta("1.0"), OPTIONS)
+
+    assert ArtifactCache.key("manifest", meta("2.0"), OPTIONS) == key
+    assert ArtifactCache.key("other", meta("1.0"), OPTIONS) != key
+    assert ArtifactCache.key("manifest", meta("1.0", description="changed"), OPTIONS) != key
+    assert ArtifactCache.key("manifest", meta("1.0"), {**OPTIONS, "compression": "xz"}) != key
+
+
+def test_manifest(tmp_path):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "tool").write_text("tool\n")
+    os.symlink("tool", tree / "link")
+    sources = [(str(tree), "usr")]
+    manifest = tree_manifest(sources)
+
+    # Timestamps are not part of the manifest
+    os.utime(tree / "tool", (0, 0))
+    assert tree_manifest(sources) == manifest
+
+    (tree / "tool").chmod(0o755)
+    assert tree_manifest(sources) != manifest
+    (tree / "tool").chmod(0o644)
+    assert tree_manifest(sources) == manifest
+
+    os.remove(tree / "link")
+    os.symlink("other", tree / "link")
+    assert tree_manifest(sources) != manifest
+
+    assert tree_manifest([(str(tree), "opt")]) != manifest
+
+
+def test_lookup(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    package = tmp_path / "tool.binpkg"
+    package.write_bytes(b"package")
+
+    assert cache.lookup("tool-x86_64", "key") is None
+    cache.store("tool-x86_64", "key", str(package))
+
+    assert cache.lookup("tool-x86_64", "key") == str(tmp_path / "cache" / "tool-x86_64.binpkg")
+    assert cache.lookup("tool-x86_64", "other") is None
+    assert cache.lookup("tool-aarch64", "key") is None
+
+
+@pytest.mark.parametrize("index", ["false", "true"])
+def test_relabel_cached(build, index):
+    first = SpkgBinPkgFormat(build("1.0", Index=index))
+    assert not first.relabel_cached()
+    first.makepkg()
+
+    second = SpkgBinPkgFormat(build("1.1", Index=index))
+    assert second.relabel_cached()
+
+    package = str(build.path / "tool-1.1-x86_64.binpkg")
+    assert payload(package) == payload(build.path / "tool-1.0-x86_64.binpkg")
+    assert BinPkg.read(package).meta.version == "1.1"
+
+    BinPkg.read(package).verify()
+    BinPkg.extract(package, str(build.path / "extracted"))
+    assert (build.path / "extracted" / "usr" / "bin" / "tool").read_bytes() == (
+        build.path / "_work" / "build" / "out" / "bin" / "tool"
+    ).read_bytes()
+
+
+def test_changed_output_is_rebuilt(build):
+    SpkgBinPkgFormat(build("1.0")).makepkg()
+    (build.path / "_work" / "build" / "out" / "share" / "doc" / "README").write_text("changed\n")
+
+    second = SpkgBinPkgFormat(build("1.1"))
+    assert not second.relabel_cached()
+    second.makepkg()
+
+    BinPkg.extract(str(build.path / "tool-1.1-x86_64.binpkg"), str(build.path / "extracted"))
+    assert (build.path / "extracted" / "usr" / "share" / "doc" / "README").read_text() == "changed\n"
@@ -0,0 +1,94 @@
+from spkg_compose.server.api.cache import ResponseCache
+from spkg_compose.server.api.tokens import TokenPool
+
+import json
+
+import pytest
+
+
+def latest_tag(releases):
+    return releases[0]["tag_name"] if releases else None
+
+
+@pytest.fixture
+def url(fake_github):
+    """Releases of a repository with the tag v1"""
+    return f"{fake_github.url}/repos/owner/repo1/releases"
+
+
+def test_not_modified_reuses_value(fake_github, url, tmp_path):
+    cache = ResponseCache(str(tmp_path / "etags.json"))
+
+    assert cache.get(url, {}, latest_tag) == (200, "v1")
+
+    for _ in range(5):
+        assert cache.get(url, {}, latest_tag) == (200, "v1")
+
+    assert fake_github.full_responses == 1
+    assert fake_github.not_modified == 5
+    assert cache.stats() == {"requests": 6, "hits": 5, "ratio": 5 / 6}
+
+    fake_github.repositories["owner/repo1"] = ("v2", "sha1")
+    assert cache.get(url, {}, latest_tag) == (200, "v2")
+    assert cache.get(url, {}, latest_tag) == (200, "v2")
+    assert fake_github.full_responses == 2
+
+
+def test_saved_between_runs(fake_github, url, tmp_path):
+    cache = ResponseCache(str(tmp_path / "etags.json"))
+    cache.get(url, {}, latest_tag)
+    cache.save()
+
+    cache = ResponseCache(str(tmp_path / "etags.json"))
+    assert cache.get(url, {}, latest_tag) == (200, "v1")
+    assert fake_github.full_responses == 1
+
+
+def test_old_entries_are_ignored(url, tmp_path):
+    cache_file = tmp_path / "etags.json"
+    cache_file.write_text(json.dumps({url: {"etag": '"old"', "last_modified": None, "value": "v0"}}))
+
+    cache = ResponseCache(str(cache_file))
+    assert cache.get(url, {}, latest_tag) == (200, "v1")
+
+
+def test_not_modified_costs_no_rate_limit(fake_github, url, tmp_path):
+    pool = TokenPool({"main": "token-a"})
+    cache = ResponseCache(str(tmp_path / "etags.json"), pool)
+
+    cache.get(url, {}, latest_tag)
+    remaining = pool.metrics()["main"]["core"]["remaining"]
+
+    for _ in range(5):
+        assert cache.get(url, {}, latest_tag) == (200, "v1")
+
+    assert remaining == 4999
+    assert pool.metrics()["main"]["core"]["remaining"] == remaining
+    assert fake_github.remaining["Bearer token-a"] == remaining
+
+
+def test_revalidation_after_token_rotation(fake_github, url, tmp_path):
+    pool = TokenPool({"first": "token-a", "second": "token-b"})
+    cache = ResponseCache(str(tmp_path / "etags.json"), pool)
+
+    # Every token needs one full response for its own ETag. The pool moves to the second token after the first
+    # one got a request counted
+    assert cache.get(url, {}, latest_tag) == (200, "v1")
+    assert cache.get(url, {}, latest_tag) == (200, "v1")
+    assert set(fake_github.remaining) == {"Bearer token-a", "Bearer token-b"}
+    assert fake_github.full_responses == 2
+
+    for _ in range(10):
+        # A request that isn't cached uses up one request of a token, so the next one goes with the other token
+        pool.get(url)
+        assert cache.get(url, {}, latest_tag) == (200, "v1")
+
+    assert fake_github.full_responses == 12
+    assert fake_github.not_modified_for == {"Bearer token-a": 5, "Bearer token-b": 5}
+
+    # A token that saw the old value doesn't return it after another token saw the new one
+    fake_github.repositories["owner/repo1"] = ("v2", "sha1")
+    assert cache.get(url, {}, latest_tag) == (200, "v2")
+    assert cache.get(url, {}, latest_tag) == (200, "v2")
+    assert cache.get(url, {}, latest_tag) == (200, "v2")
+    assert fake_github.full_responses == 14
@@ -0,0 +1,83 @@
+from binpkg import BinPkg
+from binpkg.codec import get_codec, zstandard
+from binpkg.metadata import Metadata
+from binpkg.parallel import BLOCK_SIZE
+
+import io
+import os
+import random
+
+import pytest
+
+META = Metadata("tool", "tool", "1.0", "test", "x86_64", "test")
+
+CODECS = [
+    "gzip",
+    "xz",
+    "none",
+    pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")),
+]
+
+
+def make_tree(directory) -> dict:
+    rng = random.Random(0)
+    files = {
+        # More than one block of the parallel writer, repetitive so xz doesn't take long
+        "usr/bin/tool": (rng.randbytes(64 * 1024) * (2 * BLOCK_SIZE // (64 * 1024) + 1))[:2 * BLOCK_SIZE + 1000],
+        "usr/lib/libtool.so": b"library " * 50000,
+        "usr/share/doc/tool/README": b"readme\n",
+        "usr/share/empty": b"",
+    }
+
+    for path, data in files.items():
+        (directory / path).parent.mkdir(parents=True, exist_ok=True)
+        (directory / path).write_bytes(data)
+
+    os.symlink("tool", directory / "usr" / "bin" / "tool-link")
+    return files
+
+
+def read_tree(directory) -> dict:
+    files = {}
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                with open(path, "rb") as f:
+                    files[os.path.relpath(path, directory)] = f.read()
+
+    return files
+
+
+@pytest.mark.parametrize("compression", CODECS)
+@pytest.mark.parametrize("threads", [1, 4])
+@pytest.mark.parametrize("index", [False, True])
+def test_create_extract(tmp_path, compression, threads, index):
+    files = make_tree(tmp_path / "tree")
+    package = str(tmp_path / "tool.binpkg")
+
+    BinPkg.create(META, str(tmp_path / "tree"), package, threads=threads, compression=compression, index=index)
+    BinPkg.read(package).verify()
+    extracted = BinPkg.extract(package, str(tmp_path / "out"))
+
+    assert extracted.compression == compression
+    assert extracted.meta.version == "1.0"
+    assert read_tree(tmp_path / "out") == files
+    assert os.readlink(tmp_path / "out" / "usr" / "bin" / "tool-link") == "tool"
+
+
+@pytest.mark.parametrize("compression", [codec for codec in CODECS if codec != "none"])
+def test_frames_concatenate(compression):
+    codec = get_codec(compression)
+    compressed = io.BytesIO(codec.compress(b"first ") + codec.compress(b"second"))
+
+    with codec.open_reader(compressed) as reader:
+        assert reader.read() == b"first second"
+
+
+def test_unknown_codec():
+    assert get_codec("GZIP").name == "gzip"
+
+    with pytest.raises(ValueError, match="Unsupported compression 'lz4'"):
+        get_codec("lz4")
@@ -0,0 +1,91 @@
+from spkg_compose.core.cache import ComposeCache
+
+import os
+
+import pytest
+
+COMPOSE = open(os.path.join(os.path.dirname(__file__), "..", "buildfiles", "binpkg", "spkg.spkg")).read()
+
+
+def write(path, version: str):
+    path.write_text(COMPOSE.replace("Version=git+bc97081", f"Version={version}"))
+
+
+@pytest.fixture
+def compose(tmp_path):
+    path = tmp_path / "compose.spkg"
+    write(path, "1.0")
+    return path
+
+
+def test_hit(compose, monkeypatch):
+    cache = ComposeCache()
+    first = cache.load(str(compose))
+
+    # The same file by another name
+    monkeypatch.chdir(compose.parent)
+    assert cache.load("compose.spkg") is first
+    assert first.meta.version == "1.0"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_size_changed(compose):
+    cache = ComposeCache()
+    cache.load(str(compose))
+    write(compose, "1.0.1")
+
+    assert cache.load(str(compose)).meta.version == "1.0.1"
+    assert cache.stats() == {"hits": 0, "misses": 2, "entries": 1}
+
+
+def test_mtime_changed(compose):
+    cache = ComposeCache()
+    cache.load(str(compose))
+
+    stat = os.stat(compose)
+    write(compose, "1.1")
+    os.utime(compose, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert cache.load(str(compose)).meta.version == "1.1"
+
+
+def test_inode_changed(compose):
+    cache = ComposeCache()
+    cache.load(str(compose))
+
+    # Replaced by a file with the same size and mtime, like a checkout that renames files into place
+    stat = os.stat(compose)
+    replacement = compose.parent / "compose.spkg.new"
+    write(replacement, "1.1")
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, compose)
+
+    assert os.stat(compose).st_size == stat.st_size and os.stat(compose).st_ino != stat.st_ino
+    assert cache.load(str(compose)).meta.version == "1.1"
+    assert cache.stats()["misses"] == 2
+
+
+def test_prune_and_clear(tmp_path, compose):
+    other = tmp_path / "other.spkg"
+    write(other, "2.0")
+
+    cache = ComposeCache()
+    cache.load(str(compose))
+    cache.load(str(other))
+
+    cache.prune([str(other)])
+    assert cache.stats()["entries"] == 1
+    cache.load(str(other))
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+    cache.clear()
+    assert cache.stats() == {"hits": 0, "misses": 0, "entries": 0}
+
+
+def test_deleted(compose):
+    cache = ComposeCache()
+    cache.load(str(compose))
+    compose.unlink()
+
+    with pytest.raises(FileNotFoundError):
+        cache.load(str(compose))
@@ -0,0 +1,102 @@
+from spkg_compose.package.debfile import DebPkg
+
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+CONTROL = {"Package": "tool", "Version": "1.0", "Architecture": "amd64", "Maintainer": "Tester <tester@example.org>",
+           "Description": "A tool\n\nThat does things"}
+
+
+def read_ar(path) -> dict:
+    """Parses the ar archive of a deb, returns {member name: data} in the order of the archive"""
+    members = {}
+
+    with open(path, "rb") as f:
+        assert f.read(8) == b"!<arch>\n"
+
+        while header := f.read(60):
+            assert header[58:60] == b"`\n"
+            name, mode, size = header[:16].decode().rstrip(), header[40:48].decode().rstrip(), int(header[48:58])
+            assert mode == "100644"
+
+            members[name] = f.read(size)
+
+            # Members start at even offsets
+            if size % 2:
+                assert f.read(1) == b"\n"
+
+    return members
+
+
+def read_tar(data: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return {member.name: (member, tar.extractfile(member).read() if member.isreg() else None) for member in tar}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    tree = tmp_path / "tree"
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "bin" / "tool").write_bytes(os.urandom(5000))
+    (tree / "usr" / "bin" / "tool").chmod(0o755)
+    os.link(tree / "usr" / "bin" / "tool", tree / "usr" / "bin" / "tool-hardlink")
+    os.symlink("tool", tree / "usr" / "bin" / "tool-symlink")
+    (tree / "usr" / "share").mkdir()
+    (tree / "usr" / "share" / "README").write_text("tool\n")
+    return tree
+
+
+@pytest.mark.parametrize("compression, decompress", [("gzip", gzip.decompress), ("xz", lzma.decompress),
+                                                     ("none", bytes)])
+@pytest.mark.parametrize("threads", [1, 4])
+def test_members(tmp_path, tree, compression, decompress, threads):
+    deb = tmp_path / "tool.deb"
+    DebPkg.create(CONTROL, str(tree), str(deb), threads, compression)
+
+    members = read_ar(deb)
+    data_name = {"gzip": "data.tar.gz", "xz": "data.tar.xz", "none": "data.tar"}[compression]
+    assert list(members) == ["debian-binary", "control.tar.gz", data_name]
+    assert members["debian-binary"] == b"2.0\n"
+
+    data = read_tar(decompress(members[data_name]))
+    tool, content = data["./usr/bin/tool"]
+    assert content == (tree / "usr" / "bin" / "tool").read_bytes()
+    assert tool.mode == 0o755 and tool.uname == "root" and tool.uid == 0
+    assert data["./usr/bin/tool-hardlink"][0].islnk()
+    assert data["./usr/bin/tool-symlink"][0].linkname == "tool"
+
+    control = read_tar(members["control.tar.gz"])
+    fields = control["./control"][1].decode()
+    assert "Description: A tool\n .\n That does things\n" in fields
+    # tool (5 KiB), README (1 KiB) and one each for the hardlink, the symlink and the four directories
+    assert "Installed-Size: 12\n" in fields
+
+    md5 = hashlib.md5((tree / "usr" / "bin" / "tool").read_bytes()).hexdigest()
+    readme_md5 = hashlib.md5(b"tool\n").hexdigest()
+    md5sums = control["./md5sums"][1].decode().splitlines()
+    assert sorted(md5sums) == sorted([
+        f"{md5}  usr/bin/tool",
+        f"{md5}  usr/bin/tool-hardlink",
+        f"{readme_md5}  usr/share/README",
+    ])
+
+
+@pytest.mark.skipif(shutil.which("dpkg-deb") is None, reason="dpkg-deb is not installed")
+def test_dpkg_deb(tmp_path, tree):
+    deb = tmp_path / "tool.deb"
+    DebPkg.create(CONTROL, str(tree), str(deb), compression="xz")
+
+    assert "Package: tool" in subprocess.check_output(["dpkg-deb", "--info", str(deb)], text=True)
+
+    subprocess.check_call(["dpkg-deb", "--extract", str(deb), str(tmp_path / "out")])
+    assert (tmp_path / "out" / "usr" / "bin" / "tool-hardlink").read_bytes() == (
+        tree / "usr" / "bin" / "tool"
+    ).read_bytes()
@@ -0,0 +1,107 @@
+from binpkg import BinPkg
+from binpkg.metadata import Metadata
+from spkg_compose.package.binpkg import SpkgBinPkgFormat
+
+import hashlib
+import os
+import random
+import shutil
+
+import pytest
+
+
+def sha256(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def make_package(tmp_path, version: str, changed: bytes) -> str:
+    tree = tmp_path / f"tree-{version}"
+    shutil.rmtree(tree, ignore_errors=True)
+    rng = random.Random(0)
+
+    # Several chunks, only the one with the changed file differs between the versions
+    for i in range(8):
+        (tree / "usr" / "lib").mkdir(parents=True, exist_ok=True)
+        (tree / "usr" / "lib" / f"lib{i}.so").write_bytes(rng.randbytes(256 * 1024))
+
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "bin" / "tool").write_bytes(changed)
+
+    package = str(tmp_path / f"tool-{version}.binpkg")
+    BinPkg.create(Metadata("tool", "tool", version, "test", "x86_64", "test"), str(tree), package, index=True,
+                  reproducible=True)
+    return package
+
+
+@pytest.fixture
+def packages(tmp_path):
+    return make_package(tmp_path, "1.0", b"old tool\n"), make_package(tmp_path, "1.1", b"new tool\n" * 100)
+
+
+def test_round_trip(tmp_path, packages):
+    base, target = packages
+    delta = str(tmp_path / "tool.delta")
+
+    BinPkg.create_delta(base, target, delta)
+    rebuilt = BinPkg.apply_delta(base, delta, str(tmp_path / "rebuilt.binpkg"))
+
+    assert sha256(tmp_path / "rebuilt.binpkg") == sha256(target)
+    assert rebuilt.meta.version == "1.1"
+    assert os.path.getsize(delta) < os.path.getsize(target) / 2
+
+
+def test_wrong_base(tmp_path, packages):
+    base, target = packages
+    delta = str(tmp_path / "tool.delta")
+    BinPkg.create_delta(base, target, delta)
+
+    other = make_package(tmp_path, "0.9", b"older tool\n")
+
+    for wrong_base in (target, other):
+        with pytest.raises(ValueError, match="is not the base package"):
+            BinPkg.apply_delta(wrong_base, delta, str(tmp_path / "rebuilt.binpkg"))
+
+    assert not os.path.exists(tmp_path / "rebuilt.binpkg")
+
+
+def test_corrupted_delta(tmp_path, packages):
+    base, target = packages
+    delta = tmp_path / "tool.delta"
+    BinPkg.create_delta(base, target, str(delta))
+
+    # The last byte before the end record belongs to the changed chunk, which is in the delta as it is
+    data = bytearray(delta.read_bytes())
+    data[-30] ^= 0xff
+    delta.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match="does not match"):
+        BinPkg.apply_delta(base, str(delta), str(tmp_path / "rebuilt.binpkg"))
+
+    assert not os.path.exists(tmp_path / "rebuilt.binpkg")
+
+
+def test_makedelta_against_published_version(build):
+    first = SpkgBinPkgFormat(build("1.0", Index="true"))
+
+    # Nothing was delivered yet
+    assert first.makepkg() == "tool-1.0-x86_64.binpkg"
+    assert not os.path.exists(build.path / "tool-1.0-x86_64.binpkg.delta")
+    first.publish()
+
+    (build.path / "_work" / "build" / "out" / "share" / "doc" / "README").write_text("changed\n")
+    second = SpkgBinPkgFormat(build("1.1", Index="true"))
+    second.makepkg()
+
+    assert second.makedelta() == "tool-1.1-x86_64.binpkg.delta"
+
+    BinPkg.apply_delta(
+        second.cache.base("tool-x86_64"), str(build.path / "tool-1.1-x86_64.binpkg.delta"),
+        str(build.path / "rebuilt.binpkg")
+    )
+    assert sha256(build.path / "rebuilt.binpkg") == sha256(build.path / "tool-1.1-x86_64.binpkg")
+
+    # The same version again has no delta, and the one of the earlier build is gone
+    second.publish()
+    assert second.makedelta() is None
+    assert not os.path.exists(build.path / "tool-1.1-x86_64.binpkg.delta")
@@ -0,0 +1,101 @@
+from spkg_compose.server.api.cache import ResponseCache
+from spkg_compose.server.api.github import gh_batch_latest, gh_latest, GitHubApi
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+
+class Messages:
+    def __init__(self):
+        self.errors = []
+
+    def info(self, message):
+        pass
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def repositories(fake_github, tmp_path, names: list, rt_logger) -> list:
+    """A GitHubApi for every repository, with a server that only has what lookup() needs"""
+    server = SimpleNamespace(
+        index=SimpleNamespace(get=lambda name: {"checkfor": ""}),
+        http_cache=ResponseCache(str(tmp_path / "etags.json")),
+    )
+
+    return [
+        GitHubApi(
+            repo_url=f"https://github.com/{name}", api_token="token", server=server,
+            package=SimpleNamespace(meta=SimpleNamespace(id=name.split("/")[1])), file_path=None,
+            rt_logger=rt_logger
+        )
+        for name in names
+    ]
+
+
+def test_batch_aliases(fake_github):
+    repos = [f"owner/repo{i}" for i in range(120)] + ["owner/repo1"]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results, queries = gh_batch_latest(repos, "token", 50, f"{fake_github.url}/graphql", executor=pool)
+
+    # Duplicates are only looked up once
+    assert queries == 3 == len(fake_github.queries)
+    assert sorted(len(fake_github.ALIAS.findall(query)) for query in fake_github.queries) == [20, 50, 50]
+
+    assert len(results) == 120
+    assert results["owner/repo1"] == ("v1", "sha1")
+    assert results["owner/repo3"] == (None, "sha3")
+
+
+def test_batch_partial_errors(fake_github):
+    repos = ["owner/repo1", "owner/missing", "owner/repo2"]
+
+    results, queries = gh_batch_latest(repos, "token", 50, f"{fake_github.url}/graphql")
+
+    assert queries == 1
+    assert results == {"owner/repo1": ("v1", "sha1"), "owner/repo2": ("v2", "sha2")}
+
+
+def test_batch_commits_only(fake_github, tmp_path):
+    names = ["owner/repo1", "owner/repo2"]
+    repositories_ = repositories(fake_github, tmp_path, names, Messages())
+
+    results = list(gh_latest(repositories_, "token", 50, commits_only={"repo2"}))
+
+    assert [result for _, result in results] == [("v1", "sha1"), (None, "sha2")]
+    assert [releases for *_, releases in fake_github.ALIAS.findall(fake_github.queries[0])] == ["releases", ""]
+
+
+def test_fallback_to_rest(fake_github, tmp_path):
+    messages = Messages()
+    names = ["owner/repo1", "owner/missing", "owner/repo3"]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(gh_latest(repositories(fake_github, tmp_path, names, messages), "token", 50, executor=pool))
+
+    # In the same order, with the repository the batch couldn't look up requested with REST
+    assert [git.to_gh_api_url("")[1] for git, _ in results] == names
+    assert [result for _, result in results] == [("v1", "sha1"), None, (None, "sha3")]
+    assert fake_github.rest_requests == ["/repos/owner/missing/releases"]
+    assert len(messages.errors) == 1
+
+
+def test_fallback_after_failed_query(fake_github, tmp_path):
+    fake_github.graphql_status = 502
+    names = ["owner/repo1", "owner/repo3"]
+
+    results = list(gh_latest(repositories(fake_github, tmp_path, names, Messages()), "token", 50))
+
+    # A repository without releases needs a second request for the commits
+    assert [result for _, result in results] == [("v1", None), (None, "sha3")]
+    assert sorted(fake_github.rest_requests) == [
+        "/repos/owner/repo1/releases", "/repos/owner/repo3/commits", "/repos/owner/repo3/releases"
+    ]
+
+
+def test_without_batches(fake_github, tmp_path):
+    results = list(gh_latest(repositories(fake_github, tmp_path, ["owner/repo2"], Messages()), "token", 0))
+
+    assert [result for _, result in results] == [("v2", None)]
+    assert fake_github.queries == []
@@ -0,0 +1,209 @@
+from spkg_compose.server.index import Index, IndexStore
+
+import json
+import os
+import time
+
+import pytest
+
+
+def entry(source: str | None, architectures: dict, checkfor: str = "") -> dict:
+    return {
+        "compose": "/repo/compose.spkg",
+        "specfile": "/repo/specfile.yml",
+        "source": source,
+        "binpkg_path": "/pkg",
+        "latest": "",
+        "architectures": architectures,
+        "checkfor": checkfor,
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = Index(IndexStore(str(tmp_path / "index.db"), str(tmp_path / "index.json")), delay=0.01)
+    index.put_many({
+        "a": entry("https://github.com/Owner/A.git", {"x86_64": True, "aarch64": False}),
+        "b": entry("https://github.com/owner/b", {"x86_64": False}),
+        "c": entry("https://gitlab.com/owner/a", {"x86_64": True}, "commit"),
+        "d": entry(None, {"x86_64": True}),
+    })
+    return index
+
+
+def test_lookups(index):
+    assert index.stale() == {"a", "b"}
+    assert index.stale("aarch64") == {"a"}
+    assert index.stale_counts() == {"x86_64": 1, "aarch64": 1}
+    assert index.by_host("github.com") == {"a", "b"}
+    assert index.by_host(None) == {"d"}
+    assert index.by_repository("owner/a") == {"a", "c"}
+    assert index.by_arch("aarch64") == {"a"}
+    assert index.by_checkfor("commit") == {"c"}
+    assert index.by_checkfor("") == {"a", "b", "d"}
+    assert index.for_tags(["aarch64", "linux"]) == {"a"}
+    assert index.for_tags(["x86_64"]) == {"a", "b", "c", "d"}
+    assert index.for_tags(["x86_64"], stale=True) == {"b"}
+    assert index.for_tags(["riscv64"], stale=True) == set()
+
+
+def test_lookups_follow_updates(index):
+    index.update("a", lambda changed: changed["architectures"].update({"aarch64": True}))
+    index.put("b", entry("https://github.com/owner/new", {"x86_64": True}))
+
+    assert index.stale() == set()
+    assert index.stale_counts() == {}
+    assert index.by_repository("owner/b") == set()
+    assert index.by_repository("owner/new") == {"b"}
+    assert index.for_tags(["aarch64", "x86_64"], stale=True) == set()
+
+    index.update("c", lambda changed: changed.update({"checkfor": "", "architectures": {"riscv64": False}}))
+
+    assert index.by_checkfor("commit") == set()
+    assert index.by_arch("x86_64") == {"a", "b", "d"}
+    assert index.for_tags(["riscv64"], stale=True) == {"c"}
+
+
+def test_lookups_after_sync(index, tmp_path):
+    index.flush()
+
+    with open(tmp_path / "index.json") as json_file:
+        data = json.load(json_file)
+
+    del data["b"]
+
+    with open(tmp_path / "index.json", "w") as json_file:
+        json.dump(data, json_file)
+
+    index.sync()
+
+    assert sorted(index.names()) == ["a", "c", "d"]
+    assert index.stale() == {"a"}
+    assert index.by_host("github.com") == {"a"}
+
+
+def edit(path, change):
+    """Changes index.json like someone with an editor. The mtime is moved on explicitly, so the edit is noticed
+    on filesystems with coarse timestamps as well"""
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    with open(path) as json_file:
+        data = json.load(json_file)
+
+    change(data)
+
+    with open(path, "w") as json_file:
+        json.dump(data, json_file)
+
+    os.utime(path, ns=(mtime_ns + 1_000_000, mtime_ns + 1_000_000))
+
+
+def test_import(tmp_path):
+    # An index of a version without the database
+    legacy = {"ignore_packages": ["old"], "a": entry("https://github.com/owner/a", {"x86_64": True}, "commit")}
+    legacy["a"]["custom"] = "kept"
+    (tmp_path / "index.json").write_text(json.dumps(legacy))
+
+    store = IndexStore(str(tmp_path / "index.db"), str(tmp_path / "index.json"))
+
+    assert store.to_dict() == legacy
+    assert json.loads((tmp_path / "index.json").read_text()) == legacy
+
+    index = Index(store)
+    assert index.ignored() == {"old"}
+    assert index.get("a")["custom"] == "kept"
+
+
+def test_export_and_reload(tmp_path):
+    paths = str(tmp_path / "index.db"), str(tmp_path / "index.json")
+    store = IndexStore(*paths)
+    store.put("a", entry(None, {"x86_64": True}))
+    store.export()
+
+    assert json.loads((tmp_path / "index.json").read_text())["a"]["architectures"] == {"x86_64": True}
+
+    # Nothing changed since the export, so a restart keeps the database
+    store = IndexStore(*paths)
+    assert not store.sync()
+    assert store.names() == ["a"]
+
+    edit(tmp_path / "index.json", lambda data: data.update(b=entry(None, {"aarch64": False})))
+    assert store.sync()
+    assert store.names() == ["a", "b"]
+
+    # Deleting index.json indexes everything again
+    os.remove(tmp_path / "index.json")
+    assert store.sync()
+    assert store.to_dict() == {"ignore_packages": []}
+    assert os.path.exists(tmp_path / "index.json")
+
+
+def test_reload_after_edit(index, tmp_path):
+    index.flush()
+    edit(tmp_path / "index.json", lambda data: data["a"]["architectures"].update({"aarch64": True}))
+    index.sync()
+
+    assert index.get("a")["architectures"] == {"x86_64": True, "aarch64": True}
+    assert index.stale("aarch64") == set()
+
+    # The edit isn't overwritten by the next export
+    index.put("d", entry(None, {"x86_64": False}))
+    index.flush()
+    data = json.loads((tmp_path / "index.json").read_text())
+    assert data["a"]["architectures"]["aarch64"] is True
+    assert data["d"]["architectures"] == {"x86_64": False}
+
+
+@pytest.fixture
+def counted_store(tmp_path, monkeypatch):
+    """An IndexStore and the list of times it wrote index.json at"""
+    store = IndexStore(str(tmp_path / "index.db"), str(tmp_path / "index.json"))
+    exports = []
+    export = store.export
+
+    def counting_export(force: bool = False):
+        exports.append(time.monotonic())
+        export(force)
+
+    monkeypatch.setattr(store, "export", counting_export)
+    return store, exports
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return condition()
+
+
+def test_flush_is_debounced(counted_store):
+    store, exports = counted_store
+    index = Index(store, delay=0.5, max_delay=10)
+
+    for i in range(10):
+        index.put(f"p{i}", entry(None, {"x86_64": True}))
+        time.sleep(0.01)
+
+    assert exports == []
+    assert wait_for(lambda: exports)
+    assert len(exports) == 1
+    assert sorted(store.names()) == [f"p{i}" for i in range(10)]
+
+    time.sleep(0.6)
+    assert len(exports) == 1
+
+
+def test_flush_max_delay(counted_store):
+    store, exports = counted_store
+    index = Index(store, delay=0.3, max_delay=0.5)
+    start = time.monotonic()
+
+    # Writes keep coming in faster than the delay, they are still written after max_delay
+    while time.monotonic() - start < 1.5:
+        index.put("a", entry(None, {"x86_64": True}))
+        time.sleep(0.02)
+
+    assert exports
+    assert exports[0] - start < 1.0
@@ -0,0 +1,36 @@
+from spkg_compose.server.indexer import PARALLEL_MIN_FILES, index_entries
+
+import os
+
+COMPOSE = open(os.path.join(os.path.dirname(__file__), "..", "buildfiles", "binpkg", "spkg.spkg")).read()
+SPECFILE = "binpkg:\n  x86_64:\n    url: https://example.org/packages/{name}/{name}-1.0-x86_64.binpkg\n"
+
+
+def make_repo(directory, count: int) -> list:
+    paths = []
+
+    for i in range(count):
+        package = directory / f"pkg{i}"
+        package.mkdir()
+        (package / "compose.spkg").write_text(COMPOSE.replace("Id=spkg", f"Id=pkg{i}"))
+
+        # Every tenth package has no specfile
+        if i % 10:
+            (package / "specfile.yml").write_text(SPECFILE.format(name=f"pkg{i}"))
+
+        paths.append(str(package / "compose.spkg"))
+
+    return paths
+
+
+def test_worker_processes_give_the_same_entries(tmp_path):
+    paths = make_repo(tmp_path, PARALLEL_MIN_FILES)
+    known = {"pkg1"}
+
+    serial = list(index_entries(paths, known, workers=1))
+    parallel = list(index_entries(paths, known, workers=2))
+
+    assert parallel == serial
+    assert serial[1] == ("pkg1", None, None)
+    assert serial[2][1]["binpkg_path"] == "/pkg2"
+    assert serial[10][0] == "pkg10" and serial[10][2] is not None
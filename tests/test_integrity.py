@@ -0,0 +1,96 @@
+from binpkg import BinPkg, IntegrityError
+from binpkg.metadata import Metadata
+
+import os
+import random
+
+import pytest
+
+META = Metadata("tool", "tool", "1.0", "test", "x86_64", "test")
+
+
+def make_package(tmp_path, compression: str, index: bool = False) -> str:
+    tree = tmp_path / "tree"
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "lib").mkdir(parents=True)
+    (tree / "usr" / "bin" / "tool").write_bytes(b"#!/bin/sh\necho 'the original tool'\n")
+    (tree / "usr" / "lib" / "libtool.so").write_bytes(random.Random(0).randbytes(512 * 1024))
+
+    package = str(tmp_path / "tool.binpkg")
+    BinPkg.create(META, str(tree), package, compression=compression, index=index)
+    return package
+
+
+def replace_bytes(path: str, old: bytes, new: bytes):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert data.count(old) == 1
+    with open(path, "wb") as f:
+        f.write(data.replace(old, new))
+
+
+def damage(path: str, at: float):
+    """Overwrites a few bytes in the middle of the payload"""
+    with open(path, "r+b") as f:
+        f.seek(int(os.path.getsize(path) * at))
+        f.write(b"\xff" * 64)
+
+
+def extracted_files(directory) -> set:
+    return {os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory) for name in names}
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_changed_file(tmp_path, index):
+    package = make_package(tmp_path, "none", index)
+    replace_bytes(package, b"the original tool", b"a malicious tool!")
+
+    with pytest.raises(IntegrityError, match="usr/bin/tool"):
+        BinPkg.read(package).verify()
+
+    with pytest.raises(IntegrityError, match="usr/bin/tool"):
+        BinPkg.extract(package, str(tmp_path / "out"))
+
+    # Neither the file nor its temporary copy are left behind
+    assert not any(path.startswith("usr/bin/") for path in extracted_files(tmp_path / "out"))
+
+
+def test_changed_checksum(tmp_path):
+    package = make_package(tmp_path, "gzip")
+    digest = BinPkg.read(package).list_members()
+    tool = next(member for member in digest if member.path == "./usr/bin/tool")
+    replace_bytes(package, tool.sha256.encode(), b"0" * 64)
+
+    with pytest.raises(IntegrityError, match="usr/bin/tool"):
+        BinPkg.extract(package, str(tmp_path / "out"))
+
+    assert "usr/bin/tool" not in extracted_files(tmp_path / "out")
+
+
+@pytest.mark.parametrize("compression", ["gzip", "xz"])
+@pytest.mark.parametrize("index", [False, True])
+def test_damaged_stream(tmp_path, compression, index):
+    package = make_package(tmp_path, compression, index)
+    damage(package, 0.5)
+
+    with pytest.raises(IntegrityError):
+        BinPkg.read(package).verify()
+
+    with pytest.raises(IntegrityError):
+        BinPkg.extract(package, str(tmp_path / "out"))
+
+
+def test_damaged_payload_checksum(tmp_path):
+    package = make_package(tmp_path, "gzip")
+
+    with open(package, "rb") as f:
+        data = f.read()
+
+    # The payload checksum is the first one in the table of contents
+    start = data.index(b'"payload_sha256": "') + len(b'"payload_sha256": "')
+    replace_bytes(package, data[start:start + 64], b"0" * 64)
+
+    with pytest.raises(IntegrityError, match="Payload checksum mismatch"):
+        BinPkg.read(package).verify()
@@ -0,0 +1,85 @@
+from binpkg import BinPkg, toc
+from spkg_compose.package import SpkgBuild
+from spkg_compose.package.binpkg import SpkgBinPkgFormat
+from spkg_compose.package.deb import SpkgDebPkgFormat
+from spkg_compose.package.multi import SpkgMultiFormat
+
+import builtins
+import os
+import shutil
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Counts how often add_trees opens every file, by name"""
+    reads = {}
+
+    def counting_open(name, *args, **kwargs):
+        path = os.path.relpath(name, "_binpkg")
+        reads[path] = reads.get(path, 0) + 1
+        return builtins.open(name, *args, **kwargs)
+
+    monkeypatch.setattr(toc, "open", counting_open, raising=False)
+    return reads
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    stages = []
+
+    for package_format in (SpkgBinPkgFormat, SpkgDebPkgFormat):
+        def stage(self, original=package_format.stage):
+            stages.append(self.format)
+            return original(self)
+
+        monkeypatch.setattr(package_format, "stage", stage)
+
+    return stages
+
+
+def test_one_walk(build, reads, stages):
+    package = SpkgBuild(build(formats="binpkg, deb"))
+    assert isinstance(package.install_pkg, SpkgMultiFormat)
+
+    assert package.install_pkg.makepkg() == ["tool-1.0-x86_64.binpkg", "tool-1.0_x86_64.deb"]
+
+    # Staged and read once for both packages
+    assert stages == ["binpkg"]
+    assert reads == {"usr/bin/tool": 1, "usr/share/doc/README": 1}
+
+    BinPkg.extract(str(build.path / "tool-1.0-x86_64.binpkg"), str(build.path / "binpkg"))
+    assert (build.path / "binpkg" / "usr" / "bin" / "tool").read_bytes() == (
+        build.path / "_work" / "build" / "out" / "bin" / "tool"
+    ).read_bytes()
+
+    if shutil.which("dpkg-deb") is not None:
+        subprocess.check_call(["dpkg-deb", "--extract", str(build.path / "tool-1.0_x86_64.deb"),
+                               str(build.path / "deb")])
+        assert subprocess.check_output(["diff", "-r", "binpkg", "deb"], cwd=build.path) == b""
+
+
+def test_different_targets(build, stages):
+    data = build(formats="deb, binpkg")
+    data["Install.deb"] = {**data["Install.deb"], "Target": "out/share"}
+
+    SpkgBuild(data).install_pkg.makepkg()
+
+    # Formats with different files can't share a tree
+    assert sorted(stages) == ["binpkg", "deb"]
+
+
+def test_cached_format(build, reads, stages):
+    SpkgBuild(build("1.0", formats="binpkg, deb")).install_pkg.makepkg()
+    stages.clear()
+    reads.clear()
+
+    # The binpkg is relabelled from the cache, only the deb is packed again
+    assert SpkgBuild(build("1.1", formats="binpkg, deb")).install_pkg.makepkg() == [
+        "tool-1.1-x86_64.binpkg", "tool-1.1_x86_64.deb"
+    ]
+    assert stages == ["deb"]
+    assert os.path.exists(build.path / "tool-1.1_x86_64.deb")
+    assert BinPkg.read(str(build.path / "tool-1.1-x86_64.binpkg")).meta.version == "1.1"
@@ -0,0 +1,65 @@
+from binpkg import BinPkg
+from binpkg.codec import zstandard
+from binpkg.metadata import Metadata
+from binpkg.parallel import BLOCK_SIZE
+
+import hashlib
+import os
+import random
+
+import pytest
+
+META = Metadata("tool", "tool", "1.0", "test", "x86_64", "test")
+
+
+def make_tree(directory, order, mtime: int):
+    rng = random.Random(0)
+    files = {
+        "usr/bin/tool": rng.randbytes(BLOCK_SIZE + BLOCK_SIZE // 2),
+        "usr/lib/libtool.so": b"library " * 100000,
+        "usr/share/doc/tool/README": b"readme\n",
+        "etc/tool.conf": b"key=value\n",
+    }
+
+    # Created in a different order and with other mtimes, neither may change the package
+    for path in sorted(files, reverse=order == "reverse"):
+        file = directory / path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_bytes(files[path])
+        os.utime(file, (mtime, mtime))
+
+    os.symlink("tool", directory / "usr" / "bin" / "tool-link")
+    return str(directory)
+
+
+def sha256(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@pytest.mark.parametrize("compression, index", [
+    ("gzip", False),
+    ("gzip", True),
+    ("xz", False),
+    pytest.param("zstd", True, marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")),
+])
+def test_reproducible_build_does_not_depend_on_threads(tmp_path, compression, index):
+    first = make_tree(tmp_path / "first", "sorted", 1700000000)
+    second = make_tree(tmp_path / "second", "reverse", 1800000000)
+
+    BinPkg.create(META, first, str(tmp_path / "one.binpkg"), threads=1, compression=compression, index=index,
+                  reproducible=True)
+    BinPkg.create(META, second, str(tmp_path / "four.binpkg"), threads=4, compression=compression, index=index,
+                  reproducible=True)
+
+    assert sha256(tmp_path / "one.binpkg") == sha256(tmp_path / "four.binpkg")
+
+
+def test_reproducible_build_extracts_tree(tmp_path):
+    tree = make_tree(tmp_path / "tree", "sorted", 1700000000)
+    BinPkg.create(META, tree, str(tmp_path / "pkg.binpkg"), threads=4, reproducible=True)
+    BinPkg.extract(str(tmp_path / "pkg.binpkg"), str(tmp_path / "out"))
+
+    extracted = tmp_path / "out" / "usr" / "bin"
+    assert (extracted / "tool").read_bytes() == (tmp_path / "tree" / "usr" / "bin" / "tool").read_bytes()
+    assert os.readlink(extracted / "tool-link") == "tool"
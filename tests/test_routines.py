@@ -0,0 +1,144 @@
+from spkg_compose.server.routines import Routines, rt
+
+import threading
+import time
+
+import pytest
+
+
+class FakeRoutines:
+    """Routines with the names (and conflicts) of the real ones, that run until they're released"""
+
+    def __init__(self):
+        self.events = []
+        self.release = {"indexing": threading.Event(), "checkout": threading.Event(), "webhook": threading.Event()}
+        self.lock = threading.Lock()
+
+    def run(self, name: str):
+        with self.lock:
+            self.events.append(f"start {name}")
+
+        self.release[name].wait(5)
+
+        with self.lock:
+            self.events.append(f"end {name}")
+
+    @Routines.routine(conflicts=("checkout", "webhook"))
+    def indexing(self, rt_logger):
+        self.run("indexing")
+
+    @Routines.routine(conflicts="indexing")
+    def checkout(self, rt_logger):
+        self.run("checkout")
+
+    @Routines.routine(conflicts="indexing")
+    def webhook(self, rt_logger, fail: bool = False):
+        if fail:
+            raise RuntimeError("update failed")
+
+        self.run("webhook")
+
+
+@pytest.fixture
+def routines():
+    routines = FakeRoutines()
+    yield routines
+
+    for event in routines.release.values():
+        event.set()
+
+    rt.indexing = rt.gh_checkout = rt.webhook = False
+
+
+def start(routine) -> threading.Thread:
+    thread = threading.Thread(target=routine, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_for(condition):
+    deadline = time.time() + 5
+
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_webhook_waits_for_indexing(routines):
+    indexing = start(routines.indexing)
+    wait_for(lambda: routines.events == ["start indexing"])
+
+    webhook = start(routines.webhook)
+    time.sleep(0.2)
+    assert routines.events == ["start indexing"]
+
+    routines.release["indexing"].set()
+    routines.release["webhook"].set()
+    indexing.join(5)
+    webhook.join(5)
+
+    assert routines.events == ["start indexing", "end indexing", "start webhook", "end webhook"]
+    assert not rt.indexing and not rt.webhook
+
+
+def test_indexing_waits_for_webhook(routines):
+    webhook = start(routines.webhook)
+    wait_for(lambda: routines.events == ["start webhook"])
+
+    indexing = start(routines.indexing)
+    time.sleep(0.2)
+    assert routines.events == ["start webhook"]
+
+    routines.release["webhook"].set()
+    routines.release["indexing"].set()
+    webhook.join(5)
+    indexing.join(5)
+
+    assert routines.events == ["start webhook", "end webhook", "start indexing", "end indexing"]
+
+
+def test_checkout_and_webhook_run_together(routines):
+    checkout = start(routines.checkout)
+    webhook = start(routines.webhook)
+    wait_for(lambda: len(routines.events) == 2)
+
+    routines.release["checkout"].set()
+    routines.release["webhook"].set()
+    checkout.join(5)
+    webhook.join(5)
+
+
+def test_no_deadlock_when_started_together(routines):
+    for event in routines.release.values():
+        event.set()
+
+    for _ in range(20):
+        threads = [start(routines.indexing), start(routines.checkout), start(routines.webhook)]
+
+        for thread in threads:
+            thread.join(5)
+            assert not thread.is_alive()
+
+    # Indexing never overlaps with the others
+    running = set()
+
+    for event in routines.events:
+        action, name = event.split()
+
+        if action == "start":
+            assert "indexing" not in running and (name != "indexing" or not running)
+            running.add(name)
+        else:
+            running.discard(name)
+
+
+def test_failed_routine_finishes(routines):
+    with pytest.raises(RuntimeError):
+        routines.webhook(fail=True)
+
+    assert not rt.webhook
+
+    routines.release["indexing"].set()
+    indexing = start(routines.indexing)
+    indexing.join(5)
+    assert routines.events == ["start indexing", "end indexing"]
@@ -0,0 +1,57 @@
+from binpkg import BinPkg, scan
+from binpkg.metadata import Metadata
+from binpkg.scan import _cache, clear_cache
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def repo(tmp_path):
+    tree = tmp_path / "tree"
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "bin" / "tool").write_text("#!/bin/sh\n")
+
+    template = tmp_path / "template.binpkg"
+    BinPkg.create(Metadata("tool", "tool", "1.0", "test", "x86_64", "test"), str(tree), str(template))
+
+    repo = tmp_path / "repo"
+    for i in range(200):
+        sub = repo / f"group{i % 7}"
+        sub.mkdir(parents=True, exist_ok=True)
+        meta = Metadata(f"pkg{i}", f"pkg{i}", "1.0", "test", "x86_64", "test")
+        BinPkg.relabel(str(template), meta, str(sub / f"pkg{i}.binpkg"))
+
+    (repo / "group0" / "broken.binpkg").write_bytes(b"not a package")
+
+    clear_cache()
+    yield str(repo)
+    clear_cache()
+
+
+def test_scan_finds_every_valid_package(repo):
+    # One thread and small batches, so more batches than the window are in flight
+    found = dict(scan(repo, threads=1))
+
+    assert len(found) == 200
+    assert found[os.path.join(repo, "group3", "pkg3.binpkg")].name == "pkg3"
+
+
+def test_scan_prunes_cache_of_removed_files(repo):
+    list(scan(repo))
+    assert len(_cache) == 200
+
+    os.remove(os.path.join(repo, "group1", "pkg1.binpkg"))
+    found = dict(scan(repo))
+
+    assert len(found) == 199
+    assert os.path.join(repo, "group1", "pkg1.binpkg") not in _cache
+    assert len(_cache) == 199
+
+
+def test_scan_keeps_cache_of_other_directories(repo):
+    list(scan(repo))
+    list(scan(os.path.join(repo, "group2")))
+
+    assert len(_cache) == 200
@@ -0,0 +1,88 @@
+from spkg_compose.server.scanner import IncrementalScanner
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def repo(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / "repo" / name).mkdir(parents=True)
+        (tmp_path / "repo" / name / "compose.spkg").write_text(f"[Meta]\nId={name}\n")
+
+    return tmp_path / "repo"
+
+
+def compose(repo, name) -> str:
+    return os.path.join(str(repo), name, "compose.spkg")
+
+
+def test_first_scan_reports_everything(repo, tmp_path):
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    changed, removed = scanner.scan()
+
+    assert changed == [compose(repo, name) for name in ("a", "b", "c")]
+    assert removed == []
+
+
+def test_saved_scan_reports_only_changes(repo, tmp_path):
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    scanner.scan()
+    scanner.save()
+
+    (repo / "b" / "compose.spkg").write_text("[Meta]\nId=b\nVersion=2\n")
+    (repo / "c" / "compose.spkg").unlink()
+    (repo / "d").mkdir()
+    (repo / "d" / "compose.spkg").write_text("[Meta]\nId=d\n")
+
+    # A new scanner reads the snapshot from disk
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    changed, removed = scanner.scan()
+
+    assert changed == [compose(repo, "b"), compose(repo, "d")]
+    assert removed == [compose(repo, "c")]
+
+
+def test_unsaved_scan_is_reported_again(repo, tmp_path):
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    first, _ = scanner.scan()
+    second, _ = scanner.scan()
+
+    assert first == second
+
+
+def test_recheck_reports_unchanged_files(repo, tmp_path):
+    # e.g. a compose file whose specfile was invalid, or whose index entry was removed by hand
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    scanner.scan()
+    scanner.save()
+
+    changed, _ = scanner.scan(recheck=[compose(repo, "a")])
+    assert changed == [compose(repo, "a")]
+
+    scanner.save()
+    changed, _ = scanner.scan()
+    assert changed == []
+
+
+def test_recheck_ignores_removed_files(repo, tmp_path):
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    scanner.scan()
+    scanner.save()
+
+    (repo / "a" / "compose.spkg").unlink()
+    changed, removed = scanner.scan(recheck=[compose(repo, "a"), compose(repo, "x")])
+
+    assert changed == []
+    assert removed == [compose(repo, "a")]
+
+
+def test_recheck_with_watcher_directories(repo, tmp_path):
+    scanner = IncrementalScanner(str(repo), str(tmp_path / "scan.json"))
+    scanner.scan()
+    scanner.save()
+
+    # Nothing was reported for a's directory, but it's still checked again
+    changed, _ = scanner.scan(set(), recheck=[compose(repo, "a")])
+    assert changed == [compose(repo, "a")]
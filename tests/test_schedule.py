@@ -0,0 +1,61 @@
+from spkg_compose.server.schedule import PollSchedule
+
+import random
+
+# The defaults: checkout every 15 minutes, poll_min 15 minutes
+EVERY = 15 * 60
+
+
+def checkouts(schedule: PollSchedule, runs: int, latest, seed: int = 1) -> dict:
+    """Runs `runs` checkouts the way the checkout routine does: every EVERY seconds, each a bit late (e.g. after
+    waiting for indexing), with the lookups taking a while. Returns {name: [runs in which it was checked]}"""
+    rng = random.Random(seed)
+    checked = {}
+
+    for run in range(runs):
+        start_time = run * EVERY + rng.uniform(0, 60)
+
+        for name in sorted(schedule.due(["busy", "quiet"], start_time, EVERY / 2)):
+            checked.setdefault(name, []).append(run)
+            schedule.observe(name, latest(name, run), start_time)
+
+    return checked
+
+
+def test_changing_package_every_checkout(tmp_path):
+    schedule = PollSchedule(str(tmp_path / "schedule.json"), EVERY, 24 * 60 * 60)
+
+    checked = checkouts(schedule, 20, lambda name, run: f"v{run}" if name == "busy" else "v1")
+
+    assert checked["busy"] == list(range(20))
+
+
+def test_unchanged_package_backs_off(tmp_path):
+    schedule = PollSchedule(str(tmp_path / "schedule.json"), EVERY, 24 * 60 * 60)
+
+    checked = checkouts(schedule, 100, lambda name, run: "v1")
+
+    # 15, 30, 60 minutes, ... up to poll_max
+    assert checked["quiet"] == [0, 1, 3, 7, 15, 31, 63]
+
+
+def test_change_resets_interval(tmp_path):
+    schedule = PollSchedule(str(tmp_path / "schedule.json"), EVERY, 24 * 60 * 60)
+
+    checked = checkouts(schedule, 20, lambda name, run: "v2" if run >= 7 else "v1")
+
+    # Back to every checkout after the change was found in run 7
+    assert checked["quiet"] == [0, 1, 3, 7, 8, 10, 14]
+
+
+def test_saved_between_runs(tmp_path):
+    schedule = PollSchedule(str(tmp_path / "schedule.json"), EVERY, 24 * 60 * 60)
+    schedule.observe("quiet", "v1", 0)
+    schedule.observe("quiet", "v1", EVERY)
+    schedule.save()
+
+    schedule = PollSchedule(str(tmp_path / "schedule.json"), EVERY, 24 * 60 * 60)
+
+    assert schedule.due(["quiet"], 2 * EVERY, EVERY / 2) == set()
+    assert schedule.due(["quiet"], 3 * EVERY - 60, EVERY / 2) == {"quiet"}
+    assert schedule.next_check() == 3 * EVERY
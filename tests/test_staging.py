@@ -0,0 +1,78 @@
+from spkg_compose.package import staging
+from spkg_compose.package.binpkg import SpkgBinPkgFormat
+from spkg_compose.package.staging import expand_sources, stage, stage_file
+
+import errno
+import os
+
+import pytest
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    out = tmp_path / "out"
+    (out / "bin").mkdir(parents=True)
+    (out / "bin" / "tool").write_text("tool\n")
+    (out / "bin" / "tool").chmod(0o755)
+    os.symlink("tool", out / "bin" / "alias")
+    (out / "share").mkdir()
+    (out / "share").chmod(0o700)
+    (out / "README").write_text("readme\n")
+    return out
+
+
+def test_layout(tmp_path, build_dir):
+    sources = expand_sources(f"{build_dir}/*", "/usr")
+    assert [dest for _, dest in sources] == ["usr/README", "usr/bin", "usr/share"]
+
+    stage(sources, str(tmp_path / "root"))
+    usr = tmp_path / "root" / "usr"
+
+    assert (usr / "bin" / "tool").read_text() == "tool\n"
+    assert os.stat(usr / "bin" / "tool").st_mode & 0o777 == 0o755
+    assert os.readlink(usr / "bin" / "alias") == "tool"
+    assert os.stat(usr / "share").st_mode & 0o777 == 0o700
+    assert (usr / "README").read_text() == "readme\n"
+
+    # The same filesystem, so nothing was copied
+    assert os.stat(usr / "bin" / "tool").st_ino == os.stat(build_dir / "bin" / "tool").st_ino
+
+
+def test_no_match(tmp_path, build, build_dir):
+    with pytest.raises(FileNotFoundError, match="Target matches no files"):
+        expand_sources(f"{build_dir}/lib/*", "/usr")
+
+    # Packaging fails instead of creating an empty package
+    with pytest.raises(FileNotFoundError):
+        SpkgBinPkgFormat(build(Target="lib/*")).makepkg()
+
+    assert not os.path.exists(build.path / "tool-1.0-x86_64.binpkg")
+
+
+def cross_device(source, target):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+def test_reflink_fallback(tmp_path, build_dir, monkeypatch):
+    reflinked = []
+    monkeypatch.setattr(os, "link", cross_device)
+    monkeypatch.setattr(staging, "_reflink", lambda source, target: reflinked.append(source))
+
+    stage_file(str(build_dir / "bin" / "tool"), str(tmp_path / "tool"))
+    assert reflinked == [str(build_dir / "bin" / "tool")]
+
+
+def test_copy_fallback(tmp_path, build_dir, monkeypatch):
+    def unsupported(source, target):
+        # Like the ioctl on a filesystem without reflinks, after the target was created
+        open(target, "wb").close()
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    monkeypatch.setattr(staging, "_reflink", unsupported)
+
+    stage_file(str(build_dir / "bin" / "tool"), str(tmp_path / "tool"))
+
+    assert (tmp_path / "tool").read_text() == "tool\n"
+    assert os.stat(tmp_path / "tool").st_mode & 0o777 == 0o755
+    assert os.stat(tmp_path / "tool").st_ino != os.stat(build_dir / "bin" / "tool").st_ino
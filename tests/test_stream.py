@@ -0,0 +1,115 @@
+from binpkg import BinPkg
+from binpkg.metadata import Metadata
+from binpkg.stream import iter_chunks
+from spkg_compose.package.binpkg import SpkgBinPkgFormat
+
+import filecmp
+import io
+import os
+import random
+import threading
+
+import pytest
+
+META = Metadata("tool", "tool", "1.0", "test", "x86_64", "test")
+
+
+def write_chunks(chunks, path) -> int:
+    """Collects a stream in a buffer like the repository does with an upload, returns the number of chunks"""
+    buffer = io.BytesIO()
+    count = 0
+
+    for chunk in chunks:
+        buffer.write(chunk)
+        count += 1
+
+    with open(path, "wb") as f:
+        f.write(buffer.getvalue())
+
+    return count
+
+
+def same_tree(first, second) -> bool:
+    comparison = filecmp.dircmp(first, second)
+    return not (comparison.left_only or comparison.right_only or comparison.diff_files) and all(
+        same_tree(os.path.join(first, name), os.path.join(second, name)) for name in comparison.common_dirs
+    )
+
+
+@pytest.fixture
+def tree(tmp_path):
+    tree = tmp_path / "tree"
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "bin" / "tool").write_bytes(random.Random(0).randbytes(1024 * 1024))
+    (tree / "usr" / "share").mkdir()
+    (tree / "usr" / "share" / "README").write_text("tool\n" * 1000)
+    return tree
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_stream(tmp_path, tree, index):
+    package = tmp_path / "tool.binpkg"
+    chunks = write_chunks(
+        BinPkg.stream(META, str(tree), compression="gzip", index=index, chunk_size=64 * 1024), package
+    )
+
+    assert chunks > 1
+    BinPkg.read(str(package)).verify()
+    BinPkg.extract(str(package), str(tmp_path / "out"))
+    assert same_tree(tree, tmp_path / "out")
+
+
+def test_stream_is_create(tmp_path, tree):
+    created = tmp_path / "created.binpkg"
+    BinPkg.create(META, str(tree), str(created), compression="gzip", index=True, reproducible=True)
+    write_chunks(
+        BinPkg.stream(META, str(tree), compression="gzip", index=True, reproducible=True), tmp_path / "streamed.binpkg"
+    )
+
+    assert (tmp_path / "streamed.binpkg").read_bytes() == created.read_bytes()
+
+
+def test_producer_error():
+    def produce(sink):
+        sink.write(b"x" * 100)
+        raise OSError("disk on fire")
+
+    with pytest.raises(OSError, match="disk on fire"):
+        list(iter_chunks(produce, 10))
+
+
+def test_consumer_stops():
+    stopped = threading.Event()
+
+    def produce(sink):
+        try:
+            while True:
+                sink.write(b"x" * 10)
+        finally:
+            stopped.set()
+
+    chunks = iter_chunks(produce, 10)
+    assert next(chunks) == b"x" * 10
+
+    # An aborted upload closes the generator, the producer must not be left blocked on the full queue
+    chunks.close()
+    assert stopped.wait(5)
+
+
+def test_stream_format(build, tmp_path):
+    first = SpkgBinPkgFormat(build("1.0"))
+    write_chunks(first.stream(), tmp_path / "first.binpkg")
+
+    # The second stream is the cached build with a new version in the header
+    second = SpkgBinPkgFormat(build("1.1"))
+    write_chunks(second.stream(), tmp_path / "second.binpkg")
+
+    for package in ("first", "second"):
+        BinPkg.read(str(tmp_path / f"{package}.binpkg")).verify()
+        BinPkg.extract(str(tmp_path / f"{package}.binpkg"), str(tmp_path / package))
+        assert same_tree(build.path / "_work" / "build" / "out", tmp_path / package / "usr")
+
+    assert BinPkg.read(str(tmp_path / "second.binpkg")).meta.version == "1.1"
+
+    # Nothing was written to disk
+    assert not os.path.exists(build.path / "tool-1.0-x86_64.binpkg")
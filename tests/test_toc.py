@@ -0,0 +1,122 @@
+from binpkg import BinPkg, IntegrityError
+from binpkg.header import build_header
+from binpkg.metadata import Metadata
+from binpkg.toc import CHUNK_SIZE
+
+import gzip
+import io
+import random
+import tarfile
+
+import pytest
+
+META = Metadata("tool", "tool", "1.0", "test", "x86_64", "test")
+
+
+def make_tree(directory) -> dict:
+    rng = random.Random(0)
+    files = {f"usr/lib/lib{i}.so": rng.randbytes(rng.randint(1, CHUNK_SIZE // 2)) for i in range(24)}
+    files["usr/bin/tool"] = b"tool\n"
+    files["usr/share/empty"] = b""
+
+    for path, data in files.items():
+        (directory / path).parent.mkdir(parents=True, exist_ok=True)
+        (directory / path).write_bytes(data)
+
+    return files
+
+
+@pytest.fixture
+def package(tmp_path):
+    files = make_tree(tmp_path / "tree")
+    package = str(tmp_path / "tool.binpkg")
+    BinPkg.create(META, str(tmp_path / "tree"), package, threads=2, index=True)
+    return BinPkg.read(package), files
+
+
+def test_list_members(package):
+    binpkg, files = package
+    members = {member.path: member for member in binpkg.list_members()}
+
+    assert {path for path, member in members.items() if member.type == "file"} == {f"./{path}" for path in files}
+    assert members["./usr/lib"].type == "dir"
+    assert members["./usr/bin/tool"].size == 5
+
+    # The files are spread over several independently compressed chunks
+    assert len({member.chunk for member in members.values()}) > 3
+
+
+def test_open_member(package):
+    binpkg, files = package
+
+    for path, data in files.items():
+        assert binpkg.open_member(path).read() == data
+
+    assert binpkg.open_member("/usr/bin/tool").read() == b"tool\n"
+    assert binpkg.open_member("./usr/bin/../bin/tool").read() == b"tool\n"
+
+    with pytest.raises(KeyError):
+        binpkg.open_member("usr/bin/missing")
+
+    with pytest.raises(ValueError, match="is not a regular file"):
+        binpkg.open_member("usr/lib")
+
+
+def test_open_member_reads_only_its_chunk(package):
+    binpkg, files = package
+    members = [member for member in binpkg.list_members() if member.type == "file"]
+    first, last = members[0], members[-1]
+    assert first.chunk != last.chunk
+
+    # Damage the chunk of the first file, the last one is still readable
+    with open(binpkg.source, "r+b") as f:
+        header_length = len(build_header(META.serialize(), "1.4", "gzip", {"INDEX": 1, "CHECKSUM": "sha256"}))
+        f.seek(header_length + first.chunk + 20)
+        f.write(b"\0" * 16)
+
+    assert binpkg.open_member(last.path).read() == files[last.path[2:]]
+
+    with pytest.raises(IntegrityError):
+        binpkg.open_member(first.path)
+
+
+def test_without_index(tmp_path):
+    make_tree(tmp_path / "tree")
+    package = str(tmp_path / "tool.binpkg")
+    BinPkg.create(META, str(tmp_path / "tree"), package)
+
+    # Checksums only, no chunks to jump to
+    assert all(member.chunk is None for member in BinPkg.read(package).list_members())
+
+    with pytest.raises(ValueError, match="created without index"):
+        BinPkg.read(package).open_member("usr/bin/tool")
+
+
+@pytest.mark.parametrize("version, compression", [("1.1", None), ("1.2", "gzip")])
+def test_old_package_without_trailer(tmp_path, version, compression):
+    files = make_tree(tmp_path / "tree")
+
+    payload = io.BytesIO()
+    with gzip.GzipFile(fileobj=payload, mode="wb") as compressed, \
+            tarfile.open(fileobj=compressed, mode="w|") as tar:
+        tar.add(str(tmp_path / "tree"), ".")
+
+    # Before 1.2 there was no COMPRESSION field, the payload is always gzip
+    header = build_header(META.serialize(), version, compression or "gzip")
+    if compression is None:
+        header = header.replace(b",COMPRESSION=gzip", b"")
+
+    (tmp_path / "old.binpkg").write_bytes(header + payload.getvalue())
+    package = str(tmp_path / "old.binpkg")
+
+    extracted = BinPkg.extract(package, str(tmp_path / "out"))
+    assert extracted.meta.name == "tool"
+
+    for path, data in files.items():
+        assert (tmp_path / "out" / path).read_bytes() == data
+
+    with pytest.raises(ValueError, match="has no table of contents"):
+        BinPkg.read(package).list_members()
+
+    with pytest.raises(ValueError, match="created without index"):
+        BinPkg.read(package).open_member("usr/bin/tool")
@@ -0,0 +1,128 @@
+from spkg_compose.server.api import tokens
+from spkg_compose.server.api.tokens import TokenPool
+
+import pytest
+import requests
+
+
+class Clock:
+    """time.time() and time.sleep() of the token pool, without waiting"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimitedApi:
+    """Answers like GitHub's REST API with a rate limit of `limit` requests per token until `reset`, or without
+    rate limit headers at all"""
+
+    def __init__(self, clock: Clock, limit: int | None, reset_after: float = 3600):
+        self.clock = clock
+        self.limit = limit
+        self.reset = clock.now + reset_after
+        self.remaining = {}
+        self.sent = []
+
+    def request(self, method, url, headers=None, **kwargs) -> requests.Response:
+        token = headers["Authorization"].removeprefix("Bearer ")
+        self.sent.append(token)
+
+        response = requests.Response()
+        response.status_code = 200
+
+        if self.limit is None:
+            return response
+
+        if self.clock.now >= self.reset:
+            self.remaining.clear()
+            self.reset = self.clock.now + 3600
+
+        remaining = self.remaining.setdefault(token, self.limit)
+
+        if remaining == 0:
+            response.status_code = 403
+        else:
+            remaining = self.remaining[token] = remaining - 1
+
+        response.headers.update({
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(self.reset)),
+            "X-RateLimit-Resource": "core",
+        })
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tokens, "time", clock)
+    return clock
+
+
+def test_preferred_token_first(clock):
+    api = RateLimitedApi(clock, 10)
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, api, preferred="b")
+
+    pool.get("https://api.github.com/repos/owner/repo")
+
+    assert api.sent == ["token-b"]
+
+
+def test_rotation(clock):
+    api = RateLimitedApi(clock, 3)
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, api)
+
+    for _ in range(6):
+        assert pool.get("https://api.github.com/repos/owner/repo").status_code == 200
+
+    # The token with the most requests left is used
+    assert api.sent == ["token-a", "token-b", "token-a", "token-b", "token-a", "token-b"]
+    assert clock.sleeps == []
+    assert {name: quota["core"]["remaining"] for name, quota in pool.metrics().items()} == {"a": 0, "b": 0}
+
+
+def test_waits_for_reset(clock):
+    api = RateLimitedApi(clock, 2, reset_after=600)
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, api)
+
+    for _ in range(4):
+        pool.get("https://api.github.com/repos/owner/repo")
+
+    reset = api.reset
+    assert pool.get("https://api.github.com/repos/owner/repo").status_code == 200
+
+    # Waited once, until the earliest reset
+    assert len(clock.sleeps) == 1
+    assert reset <= clock.now <= reset + 1
+    assert pool.metrics()["a"]["core"]["remaining"] == 1
+
+
+def test_rejected_request_is_sent_again(clock):
+    api = RateLimitedApi(clock, 5)
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, api)
+
+    # Used up by something else, the pool doesn't know yet
+    api.remaining["token-a"] = 0
+
+    assert pool.get("https://api.github.com/repos/owner/repo").status_code == 200
+    assert api.sent == ["token-a", "token-b"]
+
+
+def test_without_rate_limit_headers(clock):
+    api = RateLimitedApi(clock, None)
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, api)
+
+    for _ in range(2 * tokens.DEFAULT_LIMIT + 10):
+        pool.get("https://api.github.com/repos/owner/repo")
+
+    assert clock.sleeps == []
+    assert len(api.sent) == 2 * tokens.DEFAULT_LIMIT + 10
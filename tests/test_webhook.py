@@ -0,0 +1,101 @@
+from spkg_compose.server.webhook import WebhookServer
+
+import hashlib
+import hmac
+import json
+import os
+import urllib.parse
+
+import pytest
+import requests
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhooks")
+SECRET = "It's a Secret to Everybody"
+
+
+def recorded(event: str) -> bytes:
+    with open(os.path.join(PAYLOADS, f"{event}.json"), "rb") as _payload:
+        return _payload.read()
+
+
+def signature(body: bytes, secret: str = SECRET) -> str:
+    return f"sha256={hmac.new(secret.encode('utf8'), body, hashlib.sha256).hexdigest()}"
+
+
+@pytest.fixture
+def webhook():
+    changed = []
+    server = WebhookServer("127.0.0.1", 0, SECRET, changed.append)
+    server.start()
+
+    def deliver(event: str, body: bytes, sign: str | None = None, content_type: str = "application/json"):
+        headers = {"X-GitHub-Event": event, "Content-Type": content_type}
+
+        if sign is not None:
+            headers["X-Hub-Signature-256"] = sign
+
+        response = requests.post(f"http://127.0.0.1:{server.port}/", data=body, headers=headers)
+        return response.status_code, response.text
+
+    deliver.changed = changed
+    yield deliver
+
+    server.stop()
+
+
+@pytest.mark.parametrize("event", ["push", "release"])
+def test_valid_signature(webhook, event):
+    body = recorded(event)
+
+    assert webhook(event, body, signature(body)) == (202, "Accepted")
+    assert webhook.changed == ["Strawberry-Foundations/spkg"]
+
+
+@pytest.mark.parametrize("event", ["push", "release", "ping"])
+def test_invalid_signature(webhook, event):
+    body = recorded(event)
+
+    assert webhook(event, body, signature(body, "wrong secret"))[0] == 401
+    assert webhook(event, body, signature(body + b" "))[0] == 401
+    assert webhook(event, body, signature(body).replace("sha256=", "sha1="))[0] == 401
+    assert webhook(event, body)[0] == 401
+    assert webhook.changed == []
+
+
+def test_ping(webhook):
+    body = recorded("ping")
+
+    assert webhook("ping", body, signature(body)) == (200, "pong")
+    assert webhook.changed == []
+
+
+def test_form_encoded(webhook):
+    body = urllib.parse.urlencode({"payload": recorded("release").decode("utf8")}).encode()
+
+    assert webhook("release", body, signature(body), "application/x-www-form-urlencoded") == (202, "Accepted")
+    assert webhook.changed == ["Strawberry-Foundations/spkg"]
+
+
+def test_ignored_events(webhook):
+    push = json.loads(recorded("push"))
+    push["ref"] = "refs/heads/feature"
+    release = json.loads(recorded("release"))
+    release["action"] = "deleted"
+
+    for event, payload in (("push", push), ("release", release), ("issues", push)):
+        body = json.dumps(payload).encode()
+        assert webhook(event, body, signature(body)) == (200, "Ignored")
+
+    assert webhook.changed == []
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"{\"ref\": \"\xff\"}", "application/json"),
+    (b"{\"ref\": ", "application/json"),
+    (b"\xff\xfe", "application/x-www-form-urlencoded"),
+    (b"other=field", "application/x-www-form-urlencoded"),
+    (b"payload=%7B", "application/x-www-form-urlencoded"),
+])
+def test_invalid_payload(webhook, body, content_type):
+    assert webhook("push", body, signature(body), content_type) == (400, "Invalid payload")
+    assert webhook.changed == []